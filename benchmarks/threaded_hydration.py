@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Measures how hydrating the results of a query scales with the number of threads hydrating them.
+
+The collection is served from memory by a :class:`xml_models.testing.StubTransport`, so only splitting and hydration
+are timed.  Run it on a free-threaded build (``python3.13t``) to see hydration scale with the cores available, and on
+a regular build to check that the threaded path gives the same results::
+
+    python benchmarks/threaded_hydration.py --records 20000
+"""
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import sys
+import time
+
+import xml_models
+from xml_models.testing import StubTransport
+
+
+class Order(xml_models.Model):
+    id = xml_models.IntField(xpath='/order/@id')
+    customer = xml_models.CharField(xpath='/order/customer/name')
+    email = xml_models.CharField(xpath='/order/customer/email')
+    country = xml_models.CharField(xpath='/order/customer/address/country', intern=True)
+    total = xml_models.FloatField(xpath='/order/total')
+    paid = xml_models.BoolField(xpath='/order/@paid')
+    placed = xml_models.DateField(xpath='/order/placed', date_format='%Y-%m-%d')
+    items = xml_models.CollectionField(xml_models.CharField, xpath='/order/items/item')
+
+    collection_node = 'orders'
+    finders = {(): 'http://example.com/orders'}
+
+
+def orders(count):
+    records = ''.join(
+        '<order id="%d" paid="%s"><customer><name>Customer %d</name><email>c%d@example.com</email>'
+        '<address><country>%s</country></address></customer><total>%d.50</total><placed>2024-01-%02d</placed>'
+        '<items><item>A%d</item><item>B%d</item></items></order>'
+        % (i, 'true' if i % 2 else 'false', i, i, ('NZ', 'AU', 'GB')[i % 3], i, i % 28 + 1, i % 97, i % 89)
+        for i in range(count))
+    return '<orders>%s</orders>' % records
+
+
+def run(workers, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        query = Order.objects.all().hydrate(xml_models.EAGER)  # as the threaded path hydrates
+        if workers:
+            query = query.threaded(workers=workers)
+        start = time.time()
+        result = [(order.id, order.country, order.total, order.items) for order in query]
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, nargs='*')
+    args = parser.parse_args()
+
+    cores = multiprocessing.cpu_count()
+    workers = args.workers or sorted(set([1, 2, 4, 8, cores]) & set(range(1, cores + 1)))
+    Order.http_transport = StubTransport().add(r'/orders$', orders(args.records))
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print('%s, %d cores, GIL %s, %d records' % (sys.version.split()[0], cores, 'enabled' if gil else 'disabled',
+                                                 args.records))
+
+    baseline, expected = run(None, args.repeat)
+    print('%-12s %8.3fs %10.0f records/s' % ('unthreaded', baseline, args.records / baseline))
+    for count in workers:
+        elapsed, result = run(count, args.repeat)
+        if result != expected:
+            sys.exit('threaded(workers=%d) hydrated different values' % count)
+        print('%-12s %8.3fs %10.0f records/s %6.2fx' % ('%d workers' % count, elapsed, args.records / elapsed,
+                                                        baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main()
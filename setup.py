@@ -18,7 +18,7 @@ setup(
     author_email='g_ford@hotmail.ccom',
     url='http://github.com/alephnullplex/xml_models2',
     packages=['xml_models', 'xml_models.rest_client'],
-    install_requires=['lxml', 'python-dateutil', 'pytz', 'future', 'requests'],
+    install_requires=['lxml', 'python-dateutil', 'pytz', 'requests'],
     tests_require=['mock', 'nose', 'coverage'],
     test_suite="nose.collector"
 )
@@ -0,0 +1,302 @@
+import errno
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from mock import patch
+import xml_models
+from xml_models.cache import DiskCache, CachedResponse, MemoryCache, SqliteCache, StoredResponse, cache_key
+from xml_models.index import RecordIndex
+from xml_models.rest_client import rest_client, Response
+
+
+class CachedModel(xml_models.Model):
+    field1 = xml_models.CharField(xpath='/root/field1')
+
+    finders = {
+        (field1,): "http://foo.com/cached/%s",
+    }
+
+
+class SharedModel(xml_models.Model):
+    field1 = xml_models.CharField(xpath='/root/field1')
+    count = xml_models.IntField(xpath='/root/count')
+
+    finders = {
+        (field1,): "http://foo.com/shared/%s",
+    }
+
+
+COLLECTION = "<elems><root><field1>hello</field1></root><root><field1>goodbye</field1></root></elems>"
+
+
+class DiskCacheTestCases(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.client = rest_client.Client("")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        CachedModel.response_cache = None
+
+    @patch.object(rest_client.Client, "GET")
+    def test_stores_and_replays_responses(self, mock_get):
+        mock_get.return_value = Response("http://a", 200, {'ETag': '"v1"'}, COLLECTION)
+        cache = DiskCache(self.directory, max_age=60)
+
+        first = cache.fetch(self.client, "http://a")
+        second = cache.fetch(self.client, "http://a")
+
+        self.assertEqual(1, mock_get.call_count)
+        self.assertIsInstance(second, CachedResponse)
+        self.assertEqual(COLLECTION, second.content)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(COLLECTION.encode(), second.open().read())
+
+    @patch.object(rest_client.Client, "GET")
+    def test_identical_bodies_are_stored_once(self, mock_get):
+        mock_get.return_value = Response("http://a", 200, {}, COLLECTION)
+        cache = DiskCache(self.directory)
+
+        cache.fetch(self.client, "http://a")
+        cache.fetch(self.client, "http://b")
+
+        stored = [f for _, _, files in os.walk(os.path.join(self.directory, 'objects')) for f in files]
+        self.assertEqual(1, len(stored))
+
+    def test_directories_created_by_another_writer_are_used(self):
+        cache = DiskCache(self.directory)
+        makedirs = os.makedirs
+
+        def racing(path, *args):
+            makedirs(path, *args)
+            raise OSError(errno.EEXIST, 'File exists', path)
+
+        with patch('os.makedirs', side_effect=racing):
+            stored = cache.set(cache_key("http://a"), Response("http://a", 200, {}, COLLECTION))
+            DiskCache(self.directory)
+        self.assertEqual(COLLECTION, stored.content)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_revalidates_stale_entries_with_etag(self, mock_get):
+        mock_get.return_value = Response("http://a", 200, {'ETag': '"v1"'}, COLLECTION)
+        cache = DiskCache(self.directory, max_age=60)
+        cache.fetch(self.client, "http://a")
+        key = cache_key("http://a")
+        stale = time.time() - 120
+        os.utime(cache._entry_path(key), (stale, stale))
+
+        mock_get.return_value = Response("http://a", 304, {}, '')
+        response = cache.fetch(self.client, "http://a")
+
+        self.assertEqual('"v1"', mock_get.call_args[1]['headers']['If-None-Match'])
+        self.assertEqual(COLLECTION, response.content)
+        self.assertTrue(cache.is_fresh(cache.get(key)))
+
+    @patch.object(rest_client.Client, "GET")
+    def test_replaces_modified_entries(self, mock_get):
+        mock_get.return_value = Response("http://a", 200, {'ETag': '"v1"'}, COLLECTION)
+        cache = DiskCache(self.directory)
+        cache.fetch(self.client, "http://a")
+
+        mock_get.return_value = Response("http://a", 200, {'ETag': '"v2"'}, "<elems />")
+        response = cache.fetch(self.client, "http://a")
+
+        self.assertEqual("<elems />", response.content)
+        self.assertEqual('"v2"', response.etag)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_offline_cache_never_revalidates(self, mock_get):
+        mock_get.return_value = Response("http://a", 200, {}, COLLECTION)
+        DiskCache(self.directory).fetch(self.client, "http://a")
+
+        DiskCache(self.directory, offline=True).fetch(self.client, "http://a")
+        self.assertEqual(1, mock_get.call_count)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_error_responses_are_not_cached(self, mock_get):
+        mock_get.return_value = Response("http://a", 500, {}, 'oops')
+        cache = DiskCache(self.directory, max_age=60)
+
+        cache.fetch(self.client, "http://a")
+        self.assertIsNone(cache.get(cache_key("http://a")))
+
+    @patch.object(rest_client.Client, "GET")
+    def test_queries_hydrate_from_the_cache(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/cached/a", 200, {}, COLLECTION)
+        CachedModel.response_cache = DiskCache(self.directory, max_age=60)
+
+        first = [m.field1 for m in CachedModel.objects.filter(field1='a')]
+        second = [m.field1 for m in CachedModel.objects.filter(field1='a')]
+
+        self.assertEqual(['hello', 'goodbye'], first)
+        self.assertEqual(first, second)
+        self.assertEqual(1, mock_get.call_count)
+        self.assertEqual(2, CachedModel.objects.filter(field1='a').count())
+
+
+    @patch.object(rest_client.Client, "GET")
+    def test_get_parses_the_cached_body_in_place(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/cached/a", 200, {}, "<root><field1>a</field1></root>")
+        CachedModel.response_cache = DiskCache(self.directory, max_age=60)
+
+        with patch.object(CachedResponse, 'content', property(unread)):
+            self.assertEqual('a', CachedModel.objects.get(field1='a').field1)
+            self.assertEqual('a', CachedModel.objects.get(field1='a').field1)
+        self.assertEqual(1, mock_get.call_count)
+
+
+def unread(response):
+    raise AssertionError('%s was read into a string' % response.url)
+
+
+class SharedCacheTestMixin(object):
+    # the behaviour every cache has, whatever it stores entries in
+    def make_cache(self, **kwargs):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.client = rest_client.Client("")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        SharedModel.model_cache = None
+
+    @patch.object(rest_client.Client, "GET")
+    def test_stores_and_replays_responses(self, mock_get):
+        mock_get.return_value = Response("http://a", 200, {'ETag': '"v1"'}, COLLECTION)
+        cache = self.make_cache(max_age=60)
+
+        cache.fetch(self.client, "http://a")
+        second = cache.fetch(self.client, "http://a")
+
+        self.assertEqual(1, mock_get.call_count)
+        self.assertIsInstance(second, StoredResponse)
+        self.assertEqual(COLLECTION, second.content)
+        self.assertEqual('"v1"', second.etag)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_revalidates_stale_entries(self, mock_get):
+        mock_get.return_value = Response("http://a", 200, {'ETag': '"v1"'}, COLLECTION)
+        cache = self.make_cache(max_age=0)
+        cache.fetch(self.client, "http://a")
+
+        mock_get.return_value = Response("http://a", 304, {}, '')
+        response = cache.fetch(self.client, "http://a")
+
+        self.assertEqual('"v1"', mock_get.call_args[1]['headers']['If-None-Match'])
+        self.assertEqual(COLLECTION, response.content)
+
+    def test_each_cache_keeps_its_own_indexes(self):
+        first, second = self.make_cache(), self.make_cache()
+        first.set_index('a', RecordIndex('v1'))
+        self.assertEqual('v1', first.get_index('a').version)
+        self.assertIsNone(second.get_index('a'))
+
+    def test_entries_expire_after_ttl(self):
+        cache = self.make_cache(ttl=60)
+        cache.set("a", Response("http://a", 200, {}, COLLECTION))
+        cache.store("b", b"snapshot")
+
+        with patch.object(time, "time", return_value=time.time() + 61):
+            self.assertIsNone(cache.get("a"))
+            self.assertIsNone(cache.load("b"))
+
+    def test_oldest_entries_are_evicted_beyond_max_size(self):
+        cache = self.make_cache(max_size=35)
+        for key in "abc":
+            cache.set(key, Response("http://" + key, 200, {}, "<elems>%s</elems>" % key))
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual("<elems>b</elems>", cache.get("b").content)
+        self.assertEqual("<elems>c</elems>", cache.get("c").content)
+
+    def test_responses_and_snapshots_are_kept_apart(self):
+        cache = self.make_cache()
+        cache.set("a", Response("http://a", 200, {}, COLLECTION))
+        cache.store("b", b"snapshot")
+
+        self.assertIsNone(cache.load("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(b"snapshot", cache.load("b")[0])
+
+    @patch.object(rest_client.Client, "GET")
+    def test_get_loads_models_from_snapshots(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/shared/a", 200, {},
+                                         "<root><field1>a</field1><count>3</count></root>")
+        SharedModel.model_cache = self.make_cache(max_age=60)
+
+        first = SharedModel.objects.get(field1='a')
+        second = SharedModel.objects.get(field1='a')
+
+        self.assertEqual(1, mock_get.call_count)
+        self.assertEqual(('a', 3), (first.field1, first.count))
+        self.assertEqual(('a', 3), (second.field1, second.count))
+
+    @patch.object(rest_client.Client, "GET")
+    def test_stale_snapshots_are_refetched(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/shared/a", 200, {}, "<root><field1>a</field1></root>")
+        SharedModel.model_cache = self.make_cache(max_age=0)
+
+        SharedModel.objects.get(field1='a')
+        SharedModel.objects.get(field1='a')
+
+        self.assertEqual(2, mock_get.call_count)
+
+
+class MemoryCacheTestCases(SharedCacheTestMixin, unittest.TestCase):
+    def make_cache(self, **kwargs):
+        return MemoryCache(**kwargs)
+
+    def test_least_recently_used_entries_are_evicted_first(self):
+        cache = self.make_cache(max_size=25)
+        cache.set("a", Response("http://a", 200, {}, "<elems>a</elems>"))
+        cache.store("b", b"0123456")
+        cache.get("a")
+        cache.store("c", b"0123456")
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.load("b"))
+        self.assertEqual(23, cache.size)
+
+
+class SqliteCacheTestCases(SharedCacheTestMixin, unittest.TestCase):
+    def make_cache(self, **kwargs):
+        return SqliteCache(os.path.join(self.directory, 'cache.db'), **kwargs)
+
+    def test_entries_are_shared_between_processes(self):
+        path = os.path.join(self.directory, 'cache.db')
+        cache = SqliteCache(path, offline=True)
+        subprocess.check_call([sys.executable, '-c',
+                               "from xml_models.cache import SqliteCache\n"
+                               "from xml_models.rest_client import Response\n"
+                               "SqliteCache(%r).set('a', Response('http://a', 200, {}, '<elems />'))" % path])
+
+        self.assertEqual('<elems />', cache.get('a').content)
+
+    def test_readers_are_not_blocked_by_writers(self):
+        cache = self.make_cache()
+        cache.set("a", Response("http://a", 200, {}, COLLECTION))
+        writer = SqliteCache(cache.path)._connection()
+        writer.execute('BEGIN IMMEDIATE')
+        try:
+            writer.execute("DELETE FROM entries")
+            self.assertEqual(COLLECTION, cache.get("a").content)
+        finally:
+            writer.execute('ROLLBACK')
+
+    def test_writes_are_skipped_while_another_writer_holds_the_lock(self):
+        cache = self.make_cache(timeout=0)
+        writer = SqliteCache(cache.path)._connection()
+        writer.execute('BEGIN IMMEDIATE')
+        try:
+            stored = cache.set("a", Response("http://a", 200, {}, COLLECTION))
+        finally:
+            writer.execute('ROLLBACK')
+
+        self.assertEqual(COLLECTION, stored.content)
+        self.assertIsNone(cache.get("a"))
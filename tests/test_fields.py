@@ -1,12 +1,19 @@
+import sys
 import unittest
 import xml_models
+from xml_models import interning
 from mock import patch
 try:
     from StringIO import StringIO
 except ImportError:
     from io import StringIO
 from lxml import objectify
+try:
+    import enum
+except ImportError:  # Python 2 and 3.3, without the enum34 backport
+    enum = None
 import datetime
+from xml_models import xpath_finder
 from xml_models.xpath_finder import MultipleNodesReturnedException
 
 XML = objectify.fromstring("""
@@ -240,6 +247,249 @@ class CollectionFieldTests(unittest.TestCase):
         self.assertEqual([], response)
 
 
+class NamespaceTests(unittest.TestCase):
+    def test_use_a_default_namespace(self):
+        ns_model = NsModel("<root xmlns='urn:test:namespace'><name>Finbar</name><age>47</age></root>")
+        self.assertEquals('Finbar', ns_model.name)
+        self.assertEquals(47, ns_model.age)
+
+    def test_default_namespace_does_not_match_unqualified_nodes(self):
+        ns_model = NsModel("<root><name>Finbar</name></root>")
+        self.assertIsNone(ns_model.name)
+
+    def test_use_prefixed_namespaces(self):
+        class PrefixedModel(xml_models.Model):
+            namespaces = {'a': 'urn:test:a', 'b': 'urn:test:b'}
+            name = xml_models.CharField(xpath='/a:root/b:name')
+            kind = xml_models.CharField(xpath='/a:root/b:name/@b:kind')
+
+        model = PrefixedModel("<root xmlns='urn:test:a' xmlns:x='urn:test:b'><x:name x:kind='muppet'>Finbar</x:name></root>")
+        self.assertEqual('Finbar', model.name)
+        self.assertEqual('muppet', model.kind)
+
+    def test_namespaced_collections(self):
+        class NsCollection(xml_models.Model):
+            namespace = 'urn:test:namespace'
+            names = xml_models.CollectionField(xml_models.CharField, xpath='/root/names/name')
+
+        model = NsCollection("<root xmlns='urn:test:namespace'><names><name>a</name><name>b</name></names></root>")
+        self.assertEqual(['a', 'b'], model.names)
+
+    def test_generates_namespaced_xml(self):
+        ns_model = NsModel()
+        ns_model.name = 'Finbar'
+        self.assertEqual('<root xmlns="urn:test:namespace"><name>Finbar</name></root>', ns_model.to_xml())
+
+    def test_qualify_only_binds_element_names(self):
+        self.assertEqual('/_:a/_:b[@c = "d" and _:e]/text()',
+                         xpath_finder.qualify('/a/b[@c = "d" and e]/text()'))
+        self.assertEqual('count(/_:a/*) div 2', xpath_finder.qualify('count(/a/*) div 2'))
+        self.assertEqual('/p:a/child::_:b/attribute::c', xpath_finder.qualify('/p:a/child::b/attribute::c'))
+
+
+class Padded(xml_models.Model):
+    name = xml_models.CharField(xpath='/padded/name')
+    stripped_name = xml_models.CharField(xpath='/padded/name', strip=True)
+    code = xml_models.CharField(xpath='/padded/@code')
+    raw_code = xml_models.CharField(xpath='/padded/@code', strip=False)
+    empty = xml_models.CharField(xpath='/padded/@empty')
+    text = xml_models.CharField(xpath='/padded/name/text()')
+    parent = xml_models.CharField(xpath='/padded/parent')
+    first = xml_models.CharField(xpath='name(/padded/*)')
+    count = xml_models.IntField(xpath='count(/padded/*)')
+
+
+PADDED = '<padded code=" GB " empty=""><name>  Kermit  </name><parent>  Frog <child /></parent></padded>'
+
+
+class EvaluatorTests(unittest.TestCase):
+    def test_result_kinds(self):
+        self.assertEqual(xpath_finder.ELEMENT, xpath_finder.result_kind('/a/b[@c = "d"]/e'))
+        self.assertEqual(xpath_finder.ELEMENT, xpath_finder.result_kind('self::a//p:b/*'))
+        self.assertEqual(xpath_finder.ELEMENT, xpath_finder.result_kind('.'))
+        self.assertEqual(xpath_finder.STRING, xpath_finder.result_kind('/a/b[1]/@p:c'))
+        self.assertEqual(xpath_finder.STRING, xpath_finder.result_kind('//a/text()'))
+        self.assertIsNone(xpath_finder.result_kind('/a/b | /a/c'))
+        self.assertIsNone(xpath_finder.result_kind('count(/a/b)'))
+        self.assertIsNone(xpath_finder.result_kind('/a/b[@c = "]"]'))
+
+    def test_default_stripping_is_unchanged(self):
+        model = Padded(PADDED)
+        self.assertEqual('  Kermit  ', model.name)
+        self.assertEqual('GB', model.code)
+        self.assertEqual('Kermit', model.text)
+        self.assertEqual('Frog', model.parent)
+        self.assertEqual('name', model.first)
+        self.assertEqual(2, model.count)
+
+    def test_stripping_can_be_chosen_per_field(self):
+        model = Padded(PADDED)
+        self.assertEqual('Kermit', model.stripped_name)
+        self.assertEqual(' GB ', model.raw_code)
+
+    def test_empty_attributes(self):
+        self.assertEqual('', Padded(PADDED).empty)
+
+    def test_empty_strings_found_by_other_expressions(self):
+        self.assertEqual('', xpath_finder.find_unique(xpath_finder.domify('<a x=""/>'), '(/a/@x)'))
+        self.assertEqual('', xpath_finder.find_unique(xpath_finder.domify('<a x=""/>'), '/a/@x | /a/@y'))
+
+    def test_values_are_plain_strings(self):
+        self.assertIs(str, type(Padded(PADDED).raw_code))
+
+    def test_multiple_matches(self):
+        with self.assertRaises(MultipleNodesReturnedException):
+            Padded('<padded><name>a</name><name>b</name></padded>').name
+
+
+if enum is not None:
+    class Status(str, enum.Enum):
+        OPEN = 'open'
+        CLOSED = 'closed'
+
+
+def ticket_model():
+    # each test gets fresh intern tables
+    class Ticket(xml_models.Model):
+        country = xml_models.CharField(xpath='/ticket/country', intern=True)
+        status = xml_models.CharField(xpath='/ticket/status', choices=Status if enum else ('open', 'closed'))
+        size = xml_models.CharField(xpath='/ticket/size', choices=('S', 'M', 'L'), default='M')
+        tags = xml_models.CollectionField(xml_models.CharField, xpath='/ticket/tag', intern=2)
+
+    return Ticket
+
+
+class InterningTests(unittest.TestCase):
+    def setUp(self):
+        self.model = ticket_model()
+
+    def ticket(self, country, status='open', tags=()):
+        return self.model("<ticket><country>%s</country><status>%s</status>%s</ticket>"
+                          % (country, status, ''.join('<tag>%s</tag>' % tag for tag in tags)))
+
+    def test_repeated_values_share_one_instance(self):
+        first, second = self.ticket('GB').country, self.ticket('GB').country
+
+        self.assertEqual('GB', second)
+        self.assertIs(first, second)
+        self.assertEqual({'values': 1, 'hits': 1, 'misses': 1, 'saved': sys.getsizeof(second)},
+                         self.model._fields['country'].interned.stats())
+
+    def test_tables_are_bounded(self):
+        tags = [t.tags for t in (self.ticket('GB', tags=['red', 'big', 'new']),
+                                 self.ticket('GB', tags=['red', 'big', 'new']))]
+
+        self.assertEqual([['red', 'big', 'new']] * 2, tags)
+        self.assertIs(tags[0][1], tags[1][1])
+        self.assertIsNot(tags[0][2], tags[1][2])
+        self.assertEqual(2, len(self.model._fields['tags']._item_field.interned))
+
+    @unittest.skipIf(enum is None, 'enum is not available')
+    def test_choices_map_values_to_enum_members(self):
+        self.assertIs(Status.CLOSED, self.ticket('GB', status='closed').status)
+
+    def test_values_outside_the_choices_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.ticket('GB', status='pending').status
+
+    def test_defaults_need_not_be_choices(self):
+        self.assertEqual('M', self.ticket('GB').size)
+
+    @unittest.skipIf(enum is None, 'enum is not available')
+    def test_filters_compare_with_enum_members(self):
+        self.assertIs(Status.OPEN, xml_models.managers._to_python(self.model._fields['status'], 'open'))
+
+    @unittest.skipIf(enum is None, 'enum is not available')
+    def test_snapshots_keep_enum_members(self):
+        loaded = self.model.from_snapshot(self.ticket('GB', status='closed', tags=['a']).to_snapshot())
+        self.assertIs(Status.CLOSED, loaded.status)
+        self.assertEqual(['a'], loaded.tags)
+
+    @unittest.skipIf(enum is None, 'enum is not available')
+    def test_choices_are_written_back_as_their_values(self):
+        class Flagged(xml_models.Model):
+            status = xml_models.CharField(xpath='/ticket/status', choices=Status)
+            states = xml_models.CollectionField(xml_models.CharField, xpath='/ticket/states/state', choices=Status)
+
+        ticket = Flagged('<ticket><status>open</status><states><state>closed</state></states></ticket>')
+        self.assertEqual((Status.OPEN, [Status.CLOSED]), (ticket.status, ticket.states))
+        xml = '<ticket><status>open</status><states><state>closed</state></states></ticket>'
+        self.assertEqual(xml, ticket.to_xml())
+        self.assertEqual(xml, Flagged.build(status=Status.OPEN, states=[Status.CLOSED]).to_xml())
+        ticket.status = Status.CLOSED
+        self.assertEqual('closed', Flagged(ticket.to_xml()).status.value)
+
+    def test_report(self):
+        self.ticket('GB').country
+        self.ticket('GB').country
+        report = interning.report(self.model)
+
+        self.assertEqual(['country', 'size', 'status', 'tags'], sorted(report))
+        self.assertEqual(1, report['country']['hits'])
+
+
+class Measured(xml_models.Model):
+    count = xml_models.IntField(xpath='/m/count')
+    lenient_count = xml_models.IntField(xpath='/m/count', on_error='coerce')
+    safe_count = xml_models.IntField(xpath='/m/count', on_error='default', default=-1)
+    price = xml_models.FloatField(xpath='/m/price')
+    lenient_price = xml_models.FloatField(xpath='/m/price', on_error='coerce')
+    flag = xml_models.BoolField(xpath='/m/@flag')
+    lenient_flag = xml_models.BoolField(xpath='/m/@flag', on_error='coerce')
+    strict_flag = xml_models.BoolField(xpath='/m/@flag', on_error='strict', default=True)
+
+
+class ConverterTests(unittest.TestCase):
+    def test_zero_and_empty_values(self):
+        self.assertEqual(0, Measured('<m><count>0</count></m>').count)
+        self.assertIsNone(Measured('<m><count></count></m>').count)
+        self.assertEqual(-1, Measured('<m />').safe_count)
+        self.assertEqual(0.0, Measured('<m><price>0</price></m>').price)
+
+    def test_strict_values_raise(self):
+        with self.assertRaises(ValueError):
+            Measured('<m><count>12.0</count></m>').count
+        with self.assertRaises(ValueError):
+            Measured('<m flag="yes" />').strict_flag
+
+    def test_coerced_values(self):
+        self.assertEqual(12, Measured('<m><count> 12.0 </count></m>').lenient_count)
+        self.assertEqual(3.5, Measured('<m><price>3,5</price></m>').lenient_price)
+        self.assertEqual([True, False], [Measured('<m flag="%s" />' % flag).lenient_flag for flag in ('Yes', '0')])
+        with self.assertRaises(ValueError):
+            Measured('<m><count>12.5</count></m>').lenient_count
+        with self.assertRaises(ValueError):
+            Measured('<m><price>1,000.5</price></m>').lenient_price
+
+    def test_invalid_values_may_be_the_default(self):
+        before = xml_models.converters.report(Measured)
+        self.assertEqual(-1, Measured('<m><count>many</count></m>').safe_count)
+        self.assertIsNone(Measured('<m flag="yes" />').flag)
+        after = xml_models.converters.report(Measured)
+        self.assertEqual(sorted(Measured.xml_fields), sorted(after))
+        self.assertEqual({'safe_count': 1, 'flag': 1},
+                         dict((name, after[name] - before[name]) for name in after if after[name] != before[name]))
+
+    def test_booleans_in_any_case(self):
+        self.assertEqual([True, False, True], [Measured('<m flag="%s" />' % flag).flag for flag in ('TRUE', 'false',
+                                                                                                     'tRuE')])
+
+    def test_non_string_defaults_are_kept(self):
+        self.assertIs(True, Measured('<m />').strict_flag)
+
+    def test_convert_many(self):
+        converter = Measured._fields['safe_count'].converter
+        self.assertEqual([1, 2, 3], converter.convert_many(['1', '2', '3']))
+        self.assertEqual([1, -1, -1, 3], converter.convert_many(['1', 'x', None, '3']))
+        self.assertEqual([True, False, None], Measured._fields['flag'].converter.convert_many(['true', 'False', '']))
+        with self.assertRaises(ValueError):
+            Measured._fields['count'].converter.convert_many(['1', 'x'])
+
+    def test_unknown_policies_are_rejected(self):
+        with self.assertRaises(ValueError):
+            xml_models.IntField(xpath='/m/count', on_error='ignore')
+
+
 
 #     def test_use_a_default_namespace(self):
 #         nsModel = NsModel("<root xmlns='urn:test:namespace'><name>Finbar</name><age>47</age></root>")
@@ -0,0 +1,47 @@
+import subprocess
+import sys
+import unittest
+
+SLOW_MODULES = ('requests', 'dateutil', 'future', 'numpy', 'concurrent.futures', 'httpx', 'multiprocessing')
+
+
+def run(code):
+    return subprocess.check_output([sys.executable, '-c', code]).decode('utf-8').split()
+
+
+class ImportTimeTestCases(unittest.TestCase):
+    def test_importing_does_not_load_slow_optional_modules(self):
+        loaded = run("import sys, xml_models\n"
+                     "print(' '.join(name for name in %r if name in sys.modules))" % (SLOW_MODULES,))
+        self.assertEqual([], loaded)
+
+    def test_defining_models_does_not_create_managers_or_load_the_http_stack(self):
+        loaded = run("import sys, xml_models\n"
+                     "class Person(xml_models.Model):\n"
+                     "    name = xml_models.CharField(xpath='/person/name')\n"
+                     "    born = xml_models.DateField(xpath='/person/born')\n"
+                     "    finders = {(name,): 'http://example.com/%%s'}\n"
+                     "print(type(Person.__dict__['objects']).__name__)\n"
+                     "print(' '.join(name for name in %r if name in sys.modules))" % (SLOW_MODULES,))
+        self.assertEqual(['_LazyManager'], loaded)
+
+    def test_import_time(self):
+        # generous, so that this only fails if something slow starts being imported eagerly again
+        elapsed = run("import time\n"
+                      "start = time.time()\n"
+                      "import xml_models\n"
+                      "print(time.time() - start)")
+        self.assertLess(float(elapsed[0]), 0.5)
+
+    def test_managers_are_created_on_first_use(self):
+        import xml_models
+
+        class Lazy(xml_models.Model):
+            name = xml_models.CharField(xpath='/lazy/name')
+            finders = {(name,): 'http://example.com/%s'}
+            headers = {'user': 'me'}
+
+        manager = Lazy.objects
+        self.assertIs(manager, Lazy.objects)
+        self.assertEqual({'user': 'me'}, manager.headers)
+        self.assertIn(('name',), manager.finders)
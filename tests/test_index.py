@@ -0,0 +1,99 @@
+import unittest
+from mock import patch
+import xml_models
+from xml_models import index
+from xml_models.managers import DoesNotExist
+from xml_models.rest_client import rest_client, Response
+from xml_models.xpath_finder import MultipleNodesReturnedException
+
+
+class Keyed(xml_models.Model):
+    id = xml_models.IntField(xpath='/person/@id')
+    name = xml_models.CharField(xpath='/person/name')
+
+    primary_key = 'id'
+    finders = {
+        (): "http://foo.com/people",
+    }
+
+
+PEOPLE = ('<people><person id="1"><name>Kermit</name></person><person id="2"><name>Piggy</name></person>'
+          '<person id="3"><name>Gonzo</name></person></people>')
+
+
+class RecordIndexTestCases(unittest.TestCase):
+    def setUp(self):
+        Keyed.response_cache = xml_models.MemoryCache(max_age=60)
+
+    def tearDown(self):
+        Keyed.response_cache = None
+
+    @patch.object(rest_client.Client, "GET")
+    def test_primary_key_lookups_use_one_index_of_the_cached_response(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/people", 200, {}, PEOPLE)
+
+        with patch.object(index.RecordIndex, 'build', wraps=index.RecordIndex.build) as build:
+            self.assertEqual('Piggy', Keyed.objects.get(id=2).name)
+            self.assertEqual('Gonzo', Keyed.objects.get(id='3').name)
+            self.assertEqual('Kermit', Keyed.objects.filter(id__exact=1).get().name)
+
+        self.assertEqual(1, build.call_count)
+        self.assertEqual(1, mock_get.call_count)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_missing_and_duplicate_keys(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/people", 200, {},
+                                         PEOPLE.replace('id="3"', 'id="2"'))
+
+        with self.assertRaises(DoesNotExist):
+            Keyed.objects.get(id=4)
+        with self.assertRaises(MultipleNodesReturnedException):
+            Keyed.objects.get(id=2)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_index_follows_the_cached_body(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/people", 200, {}, PEOPLE)
+        Keyed.objects.get(id=2)
+
+        Keyed.response_cache = xml_models.MemoryCache(max_age=60)
+        mock_get.return_value = Response("http://foo.com/people", 200, {}, PEOPLE.replace('Piggy', 'Miss Piggy'))
+        self.assertEqual('Miss Piggy', Keyed.objects.get(id=2).name)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_indexes_are_kept_by_their_cache(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/people", 200, {}, PEOPLE)
+
+        with patch.object(index.RecordIndex, 'build', wraps=index.RecordIndex.build) as build:
+            Keyed.objects.get(id=2)
+            Keyed.response_cache = xml_models.MemoryCache(max_age=60)
+            Keyed.objects.get(id=2)
+        self.assertEqual(2, build.call_count)
+
+    def test_only_the_most_recently_used_indexes_are_kept(self):
+        cache = xml_models.MemoryCache()
+        cache.max_indexes = 2
+        for key in ('a', 'b', 'c'):
+            cache.set_index(key, index.RecordIndex(key))
+            cache.get_index('a')
+
+        self.assertEqual('a', cache.get_index('a').version)
+        self.assertIsNone(cache.get_index('b'))
+        self.assertEqual('c', cache.get_index('c').version)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_other_lookups_scan_the_records(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/people", 200, {}, PEOPLE)
+
+        with patch.object(index.RecordIndex, 'build') as build:
+            self.assertEqual(2, Keyed.objects.get(name='Piggy').id)
+            self.assertEqual(3, Keyed.objects.get(id__gt=2).id)
+        self.assertFalse(build.called)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_uncached_responses_are_not_indexed(self, mock_get):
+        Keyed.response_cache = None
+        mock_get.return_value = Response("http://foo.com/people", 200, {}, PEOPLE)
+
+        with patch.object(index.RecordIndex, 'build') as build:
+            self.assertEqual('Piggy', Keyed.objects.get(id=2).name)
+        self.assertFalse(build.called)
@@ -1,9 +1,15 @@
 import unittest
+from array import array
+from lxml import etree
 from xml_models.xpath_finder import MultipleNodesReturnedException
 from mock import patch
 import xml_models
-from xml_models.managers import ModelQuery, NoRegisteredFinderError, DoesNotExist
-from xml_models.rest_client import rest_client
+from xml_models.managers import ModelQuery, NoRegisteredFinderError, NoRegisteredWriterError, DoesNotExist
+from xml_models.rest_client import rest_client, CircuitOpenError
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class SimpleModel(xml_models.Model):
@@ -196,6 +202,18 @@ class QueryManagerTestCases(unittest.TestCase):
         self.assertEquals("hello", results[0].field1)
         self.assertEquals("goodbye", results[1].field1)
 
+    @patch.object(rest_client.Client, "GET")
+    def test_slicing_does_not_cut_short_later_iterations(self, mock_get):
+        class api:
+            content = "<elems>%s</elems>" % ''.join('<root><field1>%d</field1></root>' % i for i in range(10))
+        mock_get.return_value = api()
+        qry = SimpleModel.objects.filter_custom("http://hard_coded_url")
+        self.assertEqual('0', qry[0].field1)
+        self.assertEqual(['2', '3'], [result.field1 for result in qry[2:4]])
+        self.assertEqual([str(i) for i in range(10)], [result.field1 for result in qry])
+        self.assertEqual(10, len(qry))
+        self.assertEqual(1, mock_get.call_count)
+
     @patch.object(rest_client.Client, "GET")
     def test_returns_count_of_collection_of_results_when_len_is_called(self, mock_get):
         class api:
@@ -297,5 +315,369 @@ class QueryManagerTestCases(unittest.TestCase):
         self.assertIsInstance(results[0], NestedModel)
         self.assertEqual('hello', results[0].field1)
 
-        
+    @patch.object(rest_client.Client, "GET")
+    def test_can_specify_namespaced_collection_node(self, mock_get):
+        class NsNestedModel(xml_models.Model):
+            namespace = 'urn:test:namespace'
+            field1 = xml_models.CharField(xpath='/root/field1')
+            collection_node = 'elems'
+            finders = {(): 'http://example.com'}
+
+        class api:
+            content = """<response xmlns='urn:test:namespace'><metadata /><elems><root><field1>hello</field1></root>
+                <root><field1>goodbye</field1></root></elems></response>"""
+            response_code = 200
+        mock_get.return_value = api()
+
+        results = list(NsNestedModel.objects.filter())
+        self.assertEqual(['hello', 'goodbye'], [result.field1 for result in results])
+
+
+class RecordModel(xml_models.Model):
+    name = xml_models.CharField(xpath='/record/name')
+    count = xml_models.IntField(xpath='/record/count')
+    price = xml_models.FloatField(xpath='/record/price')
+    active = xml_models.BoolField(xpath='/record/@active')
+    when = xml_models.DateField(xpath='/record/when')
+
+    finders = {(): 'http://example.com/records'}
+
+
+RECORDS = """<records>
+  <record active="true"><name>au</name><count>1</count><price>1.5</price><when>1970-01-01T00:00:01</when></record>
+  <record active="false"><name>au</name><count>2</count><price>2.5</price><when>1970-01-02T00:00:00</when></record>
+</records>"""
+
+
+class ColumnExportTestCases(unittest.TestCase):
+    @patch.object(rest_client.Client, "GET")
+    def test_exports_typed_columns(self, mock_get):
+        class api:
+            content = RECORDS
+        mock_get.return_value = api()
+
+        with patch.object(RecordModel, '__init__') as mock_init:
+            columns = RecordModel.objects.all().to_columns()
+            self.assertFalse(mock_init.called)
+
+        self.assertEqual(array('q', [1, 2]), columns['count'])
+        self.assertEqual(array('d', [1.5, 2.5]), columns['price'])
+        self.assertEqual(array('b', [1, 0]), columns['active'])
+        self.assertEqual(array('q', [1000000, 86400000000]), columns['when'])
+        self.assertEqual(['au', 'au'], columns['name'])
+        self.assertIs(columns['name'][0], columns['name'][1])
+
+    @patch.object(rest_client.Client, "GET")
+    def test_exports_selected_fields(self, mock_get):
+        class api:
+            content = RECORDS
+        mock_get.return_value = api()
+
+        columns = RecordModel.objects.all().to_columns(fields=['count'])
+        self.assertEqual(['count'], list(columns.keys()))
+
+        with self.assertRaises(AttributeError):
+            RecordModel.objects.all().to_columns(fields=['nope'])
+
+    @patch.object(rest_client.Client, "GET")
+    def test_missing_values_keep_none(self, mock_get):
+        class api:
+            content = "<records><record><count>1</count></record><record /></records>"
+        mock_get.return_value = api()
+
+        columns = RecordModel.objects.all().to_columns(fields=['count'])
+        self.assertEqual([1, None], columns['count'])
+
+    @patch.object(rest_client.Client, "GET")
+    def test_exports_the_rows_of_the_query(self, mock_get):
+        class api:
+            content = '<records>%s</records>' % ''.join('<record><name>n%d</name><count>%d</count></record>' % (i, i)
+                                                        for i in range(20))
+        mock_get.return_value = api()
+
+        query = RecordModel.objects.filter(count__gte=5).exclude(count=7).order_by('-count')
+        self.assertEqual(14, query.count())
+        self.assertEqual(list(range(19, 7, -1)) + [6, 5], list(query.to_columns(['count'])['count']))
+        self.assertEqual(['n2', 'n3'],
+                         RecordModel.objects.filter(count__lt=4, count__gt=1).to_columns(['name'])['name'])
+        self.assertEqual(20, len(RecordModel.objects.all().stream(high_watermark=4).to_columns(['count'])['count']))
+
+    @patch.object(rest_client.Client, "GET")
+    def test_exports_the_split_records_without_serializing_them(self, mock_get):
+        class api:
+            content = '<records>%s</records>' % ''.join('<record><name>n%d</name><count>%d</count></record>' % (i, i)
+                                                        for i in range(5))
+        mock_get.return_value = api()
+
+        with patch.object(etree, 'tostring', wraps=etree.tostring) as tostring:
+            with patch.object(etree, 'fromstring', wraps=etree.fromstring) as fromstring:
+                self.assertEqual(['n1', 'n2', 'n3'], RecordModel.objects.filter(count__gt=0, count__lt=4)
+                                 .to_columns(['name'])['name'])
+                self.assertEqual([4, 3, 2, 1, 0], list(RecordModel.objects.all().order_by('-count')
+                                                       .to_columns(['count'])['count']))
+        self.assertFalse(tostring.called)
+        self.assertFalse(fromstring.called)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_exports_fields_that_read_the_whole_record(self, mock_get):
+        class api:
+            content = RECORDS
+        mock_get.return_value = api()
+
+        class Counted(xml_models.Model):
+            name = xml_models.CharField(xpath='/record/name')
+            fields = xml_models.IntField(xpath='count(/record/*)')
+            finders = {(): 'http://example.com/records'}
+
+        self.assertEqual([4, 4], list(Counted.objects.all().to_columns(['fields'])['fields']))
+
+    @patch.object(rest_client.Client, "GET")
+    def test_converted_columns_are_batched(self, mock_get):
+        class api:
+            content = '<records>%s</records>' % ''.join('<record active="%s"><count>%d</count></record>'
+                                                        % ('true' if i % 2 else 'nope', i) for i in range(3000))
+        mock_get.return_value = api()
+
+        columns = RecordModel.objects.all().to_columns(fields=['count', 'active'])
+        self.assertEqual(array('q', range(3000)), columns['count'])
+        self.assertEqual([None, True] * 1500, columns['active'])
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    @patch.object(rest_client.Client, "GET")
+    def test_exports_numpy_arrays(self, mock_get):
+        class api:
+            content = RECORDS
+        mock_get.return_value = api()
+
+        columns = RecordModel.objects.all().to_numpy()
+        self.assertEqual(numpy.int64, columns['count'].dtype)
+        self.assertEqual([True, False], columns['active'].tolist())
+        self.assertEqual(numpy.datetime64('1970-01-02T00:00:00', 'us'), columns['when'][1])
+        self.assertEqual(object, columns['name'].dtype)
+
+
+class HydrationPolicyTestCases(unittest.TestCase):
+    @patch.object(rest_client.Client, "GET")
+    def test_queries_may_hydrate_eagerly(self, mock_get):
+        class api:
+            content = RECORDS
+        mock_get.return_value = api()
+
+        results = list(RecordModel.objects.all().hydrate(xml_models.EAGER))
+        self.assertEqual(5, len(results[0]._cache))
+
+    @patch.object(rest_client.Client, "GET")
+    def test_only_hydrates_the_named_fields(self, mock_get):
+        class api:
+            content = RECORDS
+        mock_get.return_value = api()
+
+        results = list(RecordModel.objects.all().only('name', 'count'))
+        self.assertEqual(set(['name', 'count']), set(field._name for field in results[0]._cache))
+        self.assertEqual(1.5, results[0].price)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_defer_skips_the_named_fields(self, mock_get):
+        class api:
+            content = "<record><name>au</name><count>1</count></record>"
+            response_code = 200
+        mock_get.return_value = api()
+
+        result = RecordModel.objects.all().defer('when').get()
+        self.assertEqual(4, len(result._cache))
+        self.assertNotIn(RecordModel._fields['when'], result._cache)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_background_hydration(self, mock_get):
+        class api:
+            content = RECORDS
+        mock_get.return_value = api()
+
+        results = list(RecordModel.objects.all().hydrate(xml_models.BACKGROUND).only('count'))
+        for result in results:
+            result._hydration_future.result()
+        self.assertEqual([1, 2], [result._cache[RecordModel._fields['count']] for result in results])
+
+    def test_rejects_unknown_fields_and_modes(self):
+        with self.assertRaises(AttributeError):
+            RecordModel.objects.all().only('nope')
+        with self.assertRaises(ValueError):
+            RecordModel.objects.all().hydrate('sometimes')
+
+
+class PeopleModel(xml_models.Model):
+    name = xml_models.CharField(xpath='/person/name')
+    age = xml_models.IntField(xpath='/person/age')
+    city = xml_models.CharField(xpath='/person/city')
+
+    finders = {
+        (): 'http://example.com/people',
+        (city,): 'http://example.com/people?city=%s',
+    }
+
+
+PEOPLE = """<people>
+  <person><name>Gonzo</name><age>30</age><city>Sydney</city></person>
+  <person><name>Kermit</name><age>50</age><city>Sydney</city></person>
+  <person><name>Fozzie</name><age>40</age><city>Sydney</city></person>
+  <person><name>Animal</name><city>Sydney</city></person>
+</people>"""
+
+
+class ClientSideFilteringTestCases(unittest.TestCase):
+    def setUp(self):
+        class api:
+            content = PEOPLE
+            response_code = 200
+        patcher = patch.object(rest_client.Client, "GET", return_value=api())
+        self.mock_get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def names(self, query):
+        return [person.name for person in query]
+
+    def test_uses_the_most_specific_finder_and_filters_the_rest(self):
+        query = PeopleModel.objects.filter(city='Sydney', name='Kermit')
+        self.assertEqual(['Kermit'], self.names(query))
+        self.assertEqual('http://example.com/people?city=Sydney', self.mock_get.call_args[0][0])
+
+    def test_supports_lookups(self):
+        self.assertEqual(['Kermit', 'Fozzie'], self.names(PeopleModel.objects.filter(age__gt=30)))
+        self.assertEqual(['Gonzo', 'Fozzie'], self.names(PeopleModel.objects.filter(age__in=['30', 40])))
+        self.assertEqual(['Animal'], self.names(PeopleModel.objects.filter(age__isnull=True)))
+        self.assertEqual(['Fozzie'], self.names(PeopleModel.objects.filter(name__startswith='F')))
+        self.assertEqual(2, PeopleModel.objects.filter(age__gte=40).count())
+
+    def test_exclude(self):
+        query = PeopleModel.objects.filter(city='Sydney').exclude(name='Gonzo').exclude(age__lt=50)
+        self.assertEqual(['Kermit', 'Animal'], self.names(query))
+
+    def test_non_matching_records_are_not_hydrated(self):
+        with patch.object(PeopleModel, '__init__', return_value=None) as mock_init:
+            list(PeopleModel.objects.filter(name='Kermit'))
+            self.assertEqual(1, mock_init.call_count)
+
+    def test_only_the_records_kept_are_serialized(self):
+        with patch.object(etree, 'tostring', wraps=etree.tostring) as tostring:
+            with patch.object(etree, 'fromstring', wraps=etree.fromstring) as fromstring:
+                self.assertEqual(2, PeopleModel.objects.filter(age__gte=40).order_by('-age').count())
+        self.assertEqual(2, tostring.call_count)
+        self.assertFalse(fromstring.called)
+
+    def test_filters_on_fields_that_read_the_whole_record(self):
+        class Counted(xml_models.Model):
+            name = xml_models.CharField(xpath='/person/name')
+            fields = xml_models.IntField(xpath='count(/person/*)')
+            finders = {(): 'http://example.com/people'}
+
+        self.assertEqual(['Animal'], self.names(Counted.objects.filter(fields=2)))
+        self.assertEqual(['Gonzo', 'Kermit', 'Fozzie'],
+                         self.names(Counted.objects.filter(fields__gt=2).order_by('-fields')))
+
+    def test_order_by(self):
+        self.assertEqual(['Gonzo', 'Fozzie', 'Kermit', 'Animal'], self.names(PeopleModel.objects.all().order_by('age')))
+        self.assertEqual(['Kermit', 'Fozzie', 'Gonzo', 'Animal'],
+                         self.names(PeopleModel.objects.all().order_by('-age')))
+
+    def test_slicing(self):
+        self.assertEqual(['Kermit', 'Fozzie'], self.names(PeopleModel.objects.all()[1:3]))
+        self.assertEqual(['Animal', 'Fozzie'], self.names(PeopleModel.objects.all().order_by('name')[:2]))
+        self.assertEqual('Fozzie', PeopleModel.objects.all().order_by('-age')[1].name)
+        with self.assertRaises(IndexError):
+            PeopleModel.objects.all()[10]
+        with self.assertRaises(ValueError):
+            PeopleModel.objects.all()[-1]
+
+    def test_get_filters_client_side(self):
+        self.assertEqual('Fozzie', PeopleModel.objects.get(name='Fozzie').name)
+        with self.assertRaises(DoesNotExist):
+            PeopleModel.objects.get(name='Rowlf')
+        with self.assertRaises(MultipleNodesReturnedException):
+            PeopleModel.objects.get(age__gt=30)
+
+    def test_unknown_fields_still_need_a_finder(self):
+        with self.assertRaises(NoRegisteredFinderError):
+            PeopleModel.objects.filter(colour='green').count()
+        with self.assertRaises(AttributeError):
+            PeopleModel.objects.all().exclude(colour='green')
+
+
+class RequestPolicyTestCases(unittest.TestCase):
+    @patch.object(rest_client.Client, "GET")
+    def test_model_request_policies_are_passed_to_the_client(self, mock_get):
+        class PolicyModel(xml_models.Model):
+            field1 = xml_models.CharField(xpath='/root/field1')
+            request_timeout = (1, 10)
+            retry_policy = xml_models.rest_client.RetryPolicy()
+            circuit_breakers = xml_models.rest_client.CircuitBreakers()
+            finders = {(field1,): "http://foo.com/simple/%s"}
+
+        class api:
+            content = "<root><field1>Hello</field1></root>"
+            response_code = 200
+        mock_get.return_value = api()
+
+        with patch.object(rest_client.Client, '__init__', return_value=None) as mock_init:
+            PolicyModel.objects.deadline(5).get(field1='a')
+        kwargs = mock_init.call_args[1]
+        self.assertEqual((1, 10), kwargs['timeout'])
+        self.assertIs(PolicyModel.retry_policy, kwargs['retry'])
+        self.assertIs(PolicyModel.circuit_breakers, kwargs['circuit_breakers'])
+        self.assertTrue(0 < kwargs['deadline'].remaining() <= 5)
+
+
+class WrittenModel(xml_models.Model):
+    id = xml_models.IntField(xpath='/person/@id')
+    name = xml_models.CharField(xpath='/person/name')
+
+    writers = {
+        'create': xml_models.BatchWriter('http://foo.com/people', collection_node='people', batch_size=2),
+        'update': xml_models.ItemWriter('http://foo.com/people/%s', fields=(id,), method='PUT'),
+    }
+
 
+class BulkWriteTestCases(unittest.TestCase):
+    def people(self, count):
+        return [WrittenModel.build(id=i, name='Person %s' % i) for i in range(count)]
+
+    def response(self, code):
+        return rest_client.Response('http://foo.com/people', code, {}, '')
+
+    @patch.object(rest_client.Client, "POST")
+    def test_bulk_create_sends_batches_of_collection_documents(self, mock_post):
+        mock_post.return_value = self.response(201)
+        results = WrittenModel.objects.bulk_create(self.people(5))
+
+        self.assertEqual(3, mock_post.call_count)
+        url, payload = mock_post.call_args_list[0][0]
+        self.assertEqual('http://foo.com/people', url)
+        self.assertEqual(b"<?xml version='1.0' encoding='utf-8'?>\n<people><person id=\"0\"><name>Person 0</name>"
+                         b"</person><person id=\"1\"><name>Person 1</name></person></people>", payload)
+        self.assertEqual('application/xml', mock_post.call_args[1]['headers']['Content-Type'])
+        self.assertEqual(5, len(results))
+        self.assertTrue(all(result.ok for result in results))
+
+    @patch.object(rest_client.Client, "PUT")
+    def test_bulk_update_sends_each_model_concurrently(self, mock_put):
+        mock_put.side_effect = lambda url, payload, headers: self.response(500 if url.endswith('/2') else 200)
+        people = self.people(4)
+        results = WrittenModel.objects.bulk_update(people, concurrency=2)
+
+        self.assertEqual(sorted('http://foo.com/people/%s' % i for i in range(4)),
+                         sorted(call[0][0] for call in mock_put.call_args_list))
+        self.assertEqual(people, [result.model for result in results])
+        self.assertEqual([True, True, False, True], [result.ok for result in results])
+        self.assertEqual(500, results[2].response.response_code)
+
+    @patch.object(rest_client.Client, "POST")
+    def test_errors_are_reported_for_each_model_in_the_batch(self, mock_post):
+        error = CircuitOpenError()
+        mock_post.side_effect = [self.response(201), error]
+        results = WrittenModel.objects.bulk_create(self.people(3), batch_size=2)
+
+        self.assertEqual([True, True, False], [result.ok for result in results])
+        self.assertIs(error, results[2].error)
+
+    def test_requires_a_writer(self):
+        with self.assertRaises(NoRegisteredWriterError):
+            SimpleModel.objects.bulk_create([])
@@ -1,6 +1,9 @@
 import unittest
-from mock import Mock
+from mock import Mock, patch
+from lxml import etree
 import xml_models
+from xml_models import xpath_finder
+from xml_models.xpath_finder import MultipleNodesReturnedException
 
 
 class Muppet(xml_models.Model):
@@ -151,3 +154,260 @@ class BaseModelTestCases(unittest.TestCase):
         # self.assertEqual(strip_whitespace(m.to_xml()),
         #                  '<entry><address>Test Address</address><country>Test Country</country></entry>\n')
 
+
+
+class Street(xml_models.Model):
+    name = xml_models.CharField(xpath='/street/name')
+    number = xml_models.IntField(xpath='/street/@number')
+
+
+class Town(xml_models.Model):
+    name = xml_models.CharField(xpath='/town/name')
+    high_street = xml_models.OneToOneField(Street, xpath='/town/high/street')
+    streets = xml_models.CollectionField(Street, xpath='/town/streets/street', order_by='name')
+
+
+class UnionStreet(xml_models.Model):
+    name = xml_models.CharField(xpath='/street/name | /road/name')
+
+
+class Phones(xml_models.Model):
+    street = xml_models.CharField(xpath='normalize-space(/A/street)')
+    phones = xml_models.IntField(xpath='count(/A/phone)')
+
+
+class Directory(xml_models.Model):
+    addresses = xml_models.CollectionField(Phones, xpath='/directory/A')
+
+
+class Country(xml_models.Model):
+    towns = xml_models.CollectionField(Town, xpath='/country/town')
+    roads = xml_models.CollectionField(UnionStreet, xpath='/country/road')
+
+
+TOWN = ('<town><name>Ambridge</name><high><street number="1"><name>High</name></street></high><streets>'
+        '<street number="3"><name>Main</name></street><street number="2"><name>Church</name></street>'
+        '</streets></town>')
+
+
+class NestedViewTestCases(unittest.TestCase):
+    def test_nested_models_are_views_onto_the_parent_tree(self):
+        town = Town(TOWN)
+        self.assertIs(town.to_tree(), town.high_street.to_tree().getparent().getparent())
+        self.assertEqual('High', town.high_street.name)
+        self.assertEqual(1, town.high_street.number)
+        self.assertEqual(['Church', 'Main'], [street.name for street in town.streets])
+
+    def test_changes_to_views_are_written_in_place(self):
+        town = Town(TOWN)
+        town.high_street.name = 'Broad'
+        town.streets[1].number = 7
+        self.assertEqual('<town><name>Ambridge</name><high><street number="1"><name>Broad</name></street></high>'
+                         '<streets><street number="2"><name>Church</name></street>'
+                         '<street number="7"><name>Main</name></street></streets></town>', town.to_xml())
+        self.assertTrue(all(street.to_tree().getparent() is not None for street in town.streets))
+
+    def test_views_assigned_to_another_model_are_copied(self):
+        town, other = Town(TOWN), Town(TOWN.replace('High', 'Low'))
+        other.high_street = town.high_street
+        self.assertIn('<high><street number="1"><name>High</name></street></high>', other.to_xml())
+        self.assertIn('<high><street number="1"><name>High</name></street></high>', town.to_xml())
+        self.assertIs(town.to_tree(), town.high_street.to_tree().getparent().getparent())
+
+    def test_views_nest(self):
+        country = Country('<country>%s<road><name>A1</name></road></country>' % TOWN)
+        self.assertEqual('High', country.towns[0].high_street.name)
+        country.towns[0].high_street.name = 'Upper High'
+        self.assertIn('<high><street number="1"><name>Upper High</name></street></high>', country.to_xml())
+
+    def test_models_with_xpaths_that_cannot_be_made_relative_are_copied(self):
+        country = Country('<country><road><name>A1</name></road></country>')
+        road = country.roads[0]
+        self.assertEqual('A1', road.name)
+        self.assertIsNone(road.to_tree().getparent())
+
+    def test_models_with_functions_of_absolute_paths_are_copied(self):
+        address = Directory('<directory><A><street> one </street><phone /><phone /></A></directory>').addresses[0]
+        self.assertEqual(('one', 2), (address.street, address.phones))
+
+    def test_models_given_an_element_read_its_document(self):
+        class Root(xml_models.Model):
+            name = xml_models.CharField(xpath='/root/P/name')
+
+        class PlannedRoot(Root):
+            name = xml_models.CharField(xpath='/root/P/name')
+            compile_fields = True
+
+        doc = etree.fromstring('<root><P><name>x</name></P></root>')
+        self.assertEqual('x', Root(dom=doc.find('P')).name)
+        self.assertEqual('x', PlannedRoot(dom=doc.find('P')).name)
+
+    def test_relative_xpaths(self):
+        self.assertEqual('self::a/b[@c]', xpath_finder.relative('/a/b[@c]'))
+        self.assertEqual('descendant-or-self::a/@b', xpath_finder.relative('//a/@b'))
+        self.assertEqual('./a', xpath_finder.relative('./a'))
+        self.assertIsNone(xpath_finder.relative('/a | /b'))
+        self.assertIsNone(xpath_finder.relative('/a/b[/a/c = 1]'))
+        self.assertIsNone(xpath_finder.relative('count(/a/b)'))
+        self.assertEqual('count(./b) + 1', xpath_finder.relative('count(./b) + 1'))
+
+
+class BuildTestCases(unittest.TestCase):
+    def test_values_set_back_after_serializing_are_written(self):
+        street = Street.build(name='High', number=5)
+        street.name, street.number = 'Low', 6
+        self.assertEqual('<street number="6"><name>Low</name></street>', street.to_xml())
+        street.name, street.number = 'High', 5
+        self.assertEqual('<street number="5"><name>High</name></street>', street.to_xml())
+
+    def test_builds_the_tree_from_values(self):
+        street = Street.build(name='High', number=1)
+        self.assertEqual('<street number="1"><name>High</name></street>', street.to_xml())
+        self.assertEqual('High', street.name)
+
+    def test_building_does_not_evaluate_xpaths(self):
+        with patch.object(xpath_finder, 'compile_xpath') as compile_xpath:
+            xml = Street.build(name='High', number=1).to_xml()
+        self.assertFalse(compile_xpath.called)
+        self.assertEqual('<street number="1"><name>High</name></street>', xml)
+
+    def test_builds_nested_models_and_collections(self):
+        town = Town.build(name='Ambridge', high_street=Street.build(name='High'),
+                          streets=[Street.build(name='Church', number=2), Street.build(name='Main')])
+        self.assertEqual('<town><name>Ambridge</name><high><street><name>High</name></street></high><streets>'
+                         '<street number="2"><name>Church</name></street><street><name>Main</name></street>'
+                         '</streets></town>', town.to_xml())
+        self.assertEqual(['Fozzie', 'Kermit'], Muppet.build(friends=['Fozzie', 'Kermit']).friends)
+        self.assertEqual('<root><kiddie><friends><friend>Fozzie</friend><friend>Kermit</friend></friends></kiddie>'
+                         '</root>', Muppet.build(friends=['Fozzie', 'Kermit']).to_xml())
+
+    def test_values_changed_after_building_are_written(self):
+        street = Street.build(name='High', number=1)
+        street.name = 'Low'
+        self.assertEqual('<street number="1"><name>Low</name></street>', street.to_xml())
+
+    def test_builds_namespaced_xml(self):
+        class NsStreet(xml_models.Model):
+            namespace = 'urn:test:streets'
+            name = xml_models.CharField(xpath='/street/name')
+
+        self.assertEqual('<street xmlns="urn:test:streets"><name>High</name></street>',
+                         NsStreet.build(name='High').to_xml())
+
+    def test_fields_that_cannot_be_planned_are_still_written(self):
+        class Mixed(xml_models.Model):
+            name = xml_models.CharField(xpath='/entry/name')
+            other = xml_models.CharField(xpath='//entry/other')
+
+        self.assertEqual('<entry><name>a</name><other>b</other></entry>', Mixed.build(name='a', other='b').to_xml())
+
+    def test_rejects_unknown_fields(self):
+        with self.assertRaises(AttributeError):
+            Street.build(nmae='High')
+
+
+class WideModel(xml_models.Model):
+    compile_fields = True
+
+    id = xml_models.IntField(xpath='/person/@id')
+    name = xml_models.CharField(xpath='/person/name')
+    city = xml_models.CharField(xpath='/person/address/city')
+    zip = xml_models.IntField(xpath='/person/address/zip', default=0)
+    active = xml_models.BoolField(xpath='/person/address/@active')
+    nickname = xml_models.CharField(xpath='/person/nicknames/name')
+    first_nickname = xml_models.CharField(xpath='/person/nicknames/name[1]')
+    nicknames = xml_models.CollectionField(xml_models.CharField, xpath='/person/nicknames/name')
+
+
+WIDE_XML = """<person id="7"><name>Gonzo</name><address active="true"><city>Muppetville</city></address>
+<nicknames><name>The Great</name><name>Weirdo</name></nicknames></person>"""
+
+
+class CompiledPlanTestCases(unittest.TestCase):
+    def test_only_simple_paths_are_planned(self):
+        fields = WideModel._fields
+        planned = set(name for name in WideModel.xml_fields if fields[name] in WideModel._plan)
+        self.assertEqual(set(['id', 'name', 'city', 'zip', 'active', 'nickname']), planned)
+
+    def test_plan_is_opt_in(self):
+        self.assertIsNone(Muppet._plan)
+
+    def test_planned_fields_are_read_in_one_walk(self):
+        model = WideModel(WIDE_XML)
+        with patch.object(xpath_finder, 'find_unique') as mock_find:
+            self.assertEqual(7, model.id)
+            self.assertEqual('Gonzo', model.name)
+            self.assertEqual('Muppetville', model.city)
+            self.assertEqual(0, model.zip)
+            self.assertTrue(model.active)
+            self.assertFalse(mock_find.called)
+
+    def test_complex_paths_fall_back_to_xpath(self):
+        model = WideModel(WIDE_XML)
+        self.assertEqual('The Great', model.first_nickname)
+        self.assertEqual(['The Great', 'Weirdo'], model.nicknames)
+
+    def test_raises_when_a_planned_path_matches_more_than_once(self):
+        model = WideModel(WIDE_XML)
+        with self.assertRaises(MultipleNodesReturnedException):
+            model.nickname
+
+    def test_missing_root_uses_defaults(self):
+        model = WideModel('<other />')
+        self.assertIsNone(model.name)
+        self.assertEqual(0, model.zip)
+
+    def test_planned_namespaced_fields(self):
+        class NsWideModel(xml_models.Model):
+            compile_fields = True
+            namespace = 'urn:test'
+            namespaces = {'x': 'urn:x'}
+            name = xml_models.CharField(xpath='/person/name')
+            kind = xml_models.CharField(xpath='/person/name/@x:kind')
+
+        model = NsWideModel('<person xmlns="urn:test" xmlns:y="urn:x"><name y:kind="frog">Kermit</name></person>')
+        self.assertEqual(2, len(NsWideModel._plan))
+        self.assertEqual('Kermit', model.name)
+        self.assertEqual('frog', model.kind)
+
+
+class HydrationTestCases(unittest.TestCase):
+    def test_lazy_models_parse_on_access(self):
+        model = Muppet("<root><kiddie><value>Gonzo</value></kiddie></root>")
+        self.assertEqual({}, model._cache)
+
+    def test_eager_models_parse_on_creation(self):
+        class EagerMuppet(Muppet):
+            hydration = xml_models.EAGER
+            name = xml_models.CharField(xpath='/root/kiddie/value')
+            age = xml_models.IntField(xpath='/root/kiddie/age')
+
+        model = EagerMuppet("<root><kiddie><value>Gonzo</value><age>3</age></kiddie></root>")
+        self.assertEqual(2, len(model._cache))
+        self.assertEqual(3, model.age)
+
+    def test_eager_models_without_xml_are_not_hydrated(self):
+        model = Muppet(hydration=xml_models.EAGER)
+        self.assertEqual({}, model._cache)
+
+    def test_hydrates_selected_fields(self):
+        model = Muppet("<root><kiddie><value>Gonzo</value></kiddie></root>", hydration=xml_models.EAGER,
+                       fields=['name'])
+        self.assertEqual([Muppet._fields['name']], list(model._cache.keys()))
+
+    def test_background_hydration(self):
+        model = Muppet("<root><kiddie><value>Gonzo</value><friends><friend>Fozzie</friend></friends></kiddie></root>",
+                       hydration=xml_models.BACKGROUND)
+        model._hydration_future.result()
+        self.assertEqual(2, len(model._cache))
+        self.assertEqual(['Fozzie'], model.friends)
+
+    def test_background_hydration_does_not_overwrite_set_values(self):
+        model = Muppet("<root><kiddie><value>Gonzo</value></kiddie></root>")
+        model.name = 'Kermit'
+        model.hydrate()
+        self.assertEqual('Kermit', model.name)
+
+    def test_rejects_unknown_modes(self):
+        with self.assertRaises(ValueError):
+            Muppet("<root />", hydration='sometimes')
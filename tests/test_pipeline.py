@@ -0,0 +1,153 @@
+import threading
+import time
+import unittest
+from mock import patch
+import xml_models
+from xml_models import pipeline
+from xml_models.managers import DoesNotExist
+from xml_models.rest_client import rest_client, Response
+
+
+class StreamedModel(xml_models.Model):
+    id = xml_models.IntField(xpath='/record/@id')
+
+    finders = {
+        (): "http://foo.com/records",
+    }
+
+
+class StreamedCollectionModel(xml_models.Model):
+    id = xml_models.IntField(xpath='/record/@id')
+
+    collection_node = 'records'
+    finders = {
+        (): "http://foo.com/records",
+    }
+
+
+def records(count):
+    return '<records>%s</records>' % ''.join('<record id="%s"/>' % i for i in range(count))
+
+
+class BoundedBufferTestCases(unittest.TestCase):
+    def test_producer_waits_for_the_low_watermark(self):
+        buffer = pipeline.BoundedBuffer(4, 1)
+        pipeline.produce(range(20), buffer)
+
+        taken = []
+        for item in buffer:
+            taken.append(item)
+            time.sleep(0.001)
+
+        self.assertEqual(list(range(20)), taken)
+        self.assertLessEqual(buffer.peak, 4)
+        self.assertGreater(buffer.pauses, 0)
+
+    def test_producer_errors_reach_the_consumer(self):
+        def failing():
+            yield 1
+            raise KeyError('oops')
+
+        buffer = pipeline.BoundedBuffer(4)
+        pipeline.produce(failing(), buffer)
+        taken = []
+        with self.assertRaises(KeyError):
+            for item in buffer:
+                taken.append(item)
+        self.assertEqual([1], taken)
+
+    def test_cancelling_stops_the_producer(self):
+        buffer = pipeline.BoundedBuffer(2)
+        thread = pipeline.produce(iter(int, 1), buffer)  # never ends
+        next(iter(buffer))
+        buffer.cancel()
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+
+    def test_watermarks_are_checked(self):
+        with self.assertRaises(ValueError):
+            pipeline.BoundedBuffer(0)
+        with self.assertRaises(ValueError):
+            pipeline.BoundedBuffer(4, 4)
+
+
+class StreamingTestCases(unittest.TestCase):
+    @patch.object(rest_client.Client, "GET")
+    def test_streamed_results_match(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/records", 200, {}, records(50))
+        self.assertEqual(list(range(50)), [r.id for r in StreamedModel.objects.all().stream(high_watermark=8)])
+
+        mock_get.return_value = Response("http://foo.com/records", 200, {},
+                                         '<feed><meta/>%s<records><record id="99"/></records></feed>' % records(50))
+        self.assertEqual(list(range(50)) + [99],
+                         [r.id for r in StreamedCollectionModel.objects.all().stream(high_watermark=8)])
+
+    @patch.object(rest_client.Client, "GET")
+    def test_memory_is_bounded_by_the_high_watermark(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/records", 200, {}, records(200))
+        query = StreamedModel.objects.all().stream(high_watermark=10, low_watermark=2)
+
+        for _ in query:
+            time.sleep(0.0005)
+
+        self.assertLessEqual(query.buffer.peak, 10)
+        self.assertGreater(query.buffer.pauses, 0)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_small_results_are_kept_for_iterating_again(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/records", 200, {}, records(3))
+        query = StreamedModel.objects.all().stream(window=5)
+
+        self.assertEqual(3, len(list(query)))
+        self.assertEqual(3, query.count())
+        self.assertEqual(1, mock_get.call_count)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_results_beyond_the_window_are_fetched_again(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/records", 200, {}, records(3))
+        query = StreamedModel.objects.all().stream(window=2)
+
+        self.assertEqual(3, sum(1 for _ in query))
+        self.assertEqual(3, query.count())
+        self.assertEqual(2, mock_get.call_count)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_listing_a_stream_fetches_it_once(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/records", 200, {}, records(20))
+        query = StreamedModel.objects.all().stream(high_watermark=4)
+
+        self.assertEqual(list(range(20)), [r.id for r in list(query)])
+        self.assertEqual(1, mock_get.call_count)
+        with self.assertRaises(TypeError):
+            len(query)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_filters_and_bounded_ordering_stream(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/records", 200, {}, records(20))
+
+        self.assertEqual([15, 16], [r.id for r in StreamedModel.objects.filter(id__gt=14).stream()[:2]])
+        self.assertEqual([19, 18], [r.id for r in StreamedModel.objects.all().order_by('-id').stream()[:2]])
+        with self.assertRaises(ValueError):
+            list(StreamedModel.objects.all().order_by('id').stream())
+
+    @patch.object(rest_client.Client, "GET")
+    def test_errors_are_raised_while_iterating(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/records", 200, {}, '')
+        with self.assertRaises(DoesNotExist):
+            list(StreamedModel.objects.all().stream())
+
+    @patch.object(rest_client.Client, "GET")
+    def test_abandoned_streams_stop_producing(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/records", 200, {}, records(1000))
+        before = threading.active_count()
+
+        query = StreamedModel.objects.all().stream(high_watermark=4)
+        self.assertEqual(0, StreamedModel.objects.all().stream(high_watermark=4)[0].id)
+        iterator = iter(query)
+        next(iterator)
+        iterator.close()
+
+        deadline = time.time() + 1
+        while threading.active_count() > before and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(before, threading.active_count())
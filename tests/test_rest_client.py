@@ -0,0 +1,224 @@
+import threading
+import unittest
+import requests
+from mock import patch, Mock
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+try:
+    import httpx
+except ImportError:
+    httpx = None
+import xml_models
+from xml_models.rest_client import rest_client
+from xml_models.rest_client import (RetryPolicy, CircuitBreaker, CircuitBreakers, CircuitOpenError, Deadline,
+                                    DeadlineExceeded, RequestsTransport, HttpxTransport)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def http_response(status_code, text='<root />'):
+    return Mock(status_code=status_code, headers={}, text=text)
+
+
+class ClientTimeoutTestCases(unittest.TestCase):
+    @patch.object(requests, 'get')
+    def test_passes_timeout(self, mock_get):
+        mock_get.return_value = http_response(200)
+        rest_client.Client("http://example.com", timeout=(1, 5)).GET("/a")
+        self.assertEqual((1, 5), mock_get.call_args[1]['timeout'])
+
+    @patch.object(requests, 'get')
+    def test_deadline_shortens_timeout(self, mock_get):
+        mock_get.return_value = http_response(200)
+        rest_client.Client("http://example.com", timeout=(1, 5), deadline=Deadline(2)).GET("/a")
+        connect, read = mock_get.call_args[1]['timeout']
+        self.assertEqual(1, connect)
+        self.assertTrue(1 < read <= 2)
+
+    @patch.object(requests, 'get')
+    def test_expired_deadline_raises(self, mock_get):
+        with self.assertRaises(DeadlineExceeded):
+            rest_client.Client("http://example.com", deadline=Deadline(-1)).GET("/a")
+        self.assertFalse(mock_get.called)
+
+
+class ClientRetryTestCases(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('time.sleep')
+        self.mock_sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch.object(requests, 'get')
+    def test_retries_idempotent_requests(self, mock_get):
+        mock_get.side_effect = [requests.ConnectionError(), http_response(503), http_response(200)]
+        response = rest_client.Client("http://example.com", retry=RetryPolicy(retries=3)).GET("/a")
+        self.assertEqual(200, response.response_code)
+        self.assertEqual(3, mock_get.call_count)
+        self.assertEqual(2, self.mock_sleep.call_count)
+
+    @patch.object(requests, 'get')
+    def test_gives_up_after_retries(self, mock_get):
+        mock_get.side_effect = requests.Timeout()
+        with self.assertRaises(requests.Timeout):
+            rest_client.Client("http://example.com", retry=RetryPolicy(retries=2)).GET("/a")
+        self.assertEqual(3, mock_get.call_count)
+
+    @patch.object(requests, 'post')
+    def test_does_not_retry_posts(self, mock_post):
+        mock_post.return_value = http_response(503)
+        response = rest_client.Client("http://example.com", retry=RetryPolicy()).POST("/a", "<root />")
+        self.assertEqual(503, response.response_code)
+        self.assertEqual(1, mock_post.call_count)
+
+    def test_backoff_is_jittered_and_capped(self):
+        policy = RetryPolicy(backoff=1, max_backoff=3)
+        delays = [policy.delay(5) for _ in range(50)]
+        self.assertTrue(all(0 <= delay <= 3 for delay in delays))
+        self.assertTrue(len(set(delays)) > 1)
+
+
+class CircuitBreakerTestCases(unittest.TestCase):
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        breaker.before_request()
+        breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_request()
+
+    def test_half_opens_after_reset_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        breaker.before_request()
+        self.assertEqual(CircuitBreaker.HALF_OPEN, breaker.state)
+        breaker.record_failure()
+        self.assertEqual(CircuitBreaker.OPEN, breaker.state)
+        breaker.before_request()
+        breaker.record_success()
+        self.assertEqual(CircuitBreaker.CLOSED, breaker.state)
+
+    def test_breakers_are_per_host(self):
+        breakers = CircuitBreakers()
+        self.assertIs(breakers.for_url('http://a.com/x'), breakers.for_url('http://a.com/y'))
+        self.assertIsNot(breakers.for_url('http://a.com/x'), breakers.for_url('http://b.com/x'))
+
+    @patch.object(requests, 'get')
+    def test_client_fails_fast_when_open(self, mock_get):
+        mock_get.return_value = http_response(500)
+        client = rest_client.Client("http://example.com", circuit_breakers=CircuitBreakers(failure_threshold=1))
+        client.GET("/a")
+        with self.assertRaises(CircuitOpenError):
+            client.GET("/b")
+        self.assertEqual(1, mock_get.call_count)
+
+    @patch.object(requests, 'get')
+    def test_expired_deadlines_do_not_take_the_trial_request(self, mock_get):
+        mock_get.return_value = http_response(500)
+        breakers = CircuitBreakers(failure_threshold=1, reset_timeout=0)
+        rest_client.Client("http://example.com", circuit_breakers=breakers).GET("/a")
+        with self.assertRaises(DeadlineExceeded):
+            rest_client.Client("http://example.com", circuit_breakers=breakers, deadline=Deadline(0)).GET("/a")
+        self.assertEqual(CircuitBreaker.OPEN, breakers.for_url("http://example.com/a").state)
+
+        mock_get.return_value = http_response(200)
+        rest_client.Client("http://example.com", circuit_breakers=breakers).GET("/a")
+        self.assertEqual(CircuitBreaker.CLOSED, breakers.for_url("http://example.com/a").state)
+
+    @patch.object(requests, 'get')
+    def test_other_errors_fail_the_trial_request(self, mock_get):
+        mock_get.return_value = http_response(500)
+        breakers = CircuitBreakers(failure_threshold=1, reset_timeout=0)
+        client = rest_client.Client("http://example.com", circuit_breakers=breakers)
+        client.GET("/a")
+        mock_get.side_effect = ValueError('bad response')
+        with self.assertRaises(ValueError):
+            client.GET("/a")
+        self.assertEqual(CircuitBreaker.OPEN, breakers.for_url("http://example.com/a").state)
+
+        mock_get.side_effect = None
+        mock_get.return_value = http_response(200)
+        client.GET("/a")
+        self.assertEqual(CircuitBreaker.CLOSED, breakers.for_url("http://example.com/a").state)
+
+
+
+class _XmlHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._reply(200, ('<root><path>%s</path></root>' % self.path).encode())
+
+    def do_POST(self):
+        self._reply(201, self.rfile.read(int(self.headers['Content-Length'])))
+
+    def _reply(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TransportTestCases(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _XmlHandler)
+        cls.base_url = 'http://127.0.0.1:%s' % cls.server.server_address[1]
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def exercise(self, transport):
+        client = rest_client.Client(self.base_url, transport=transport)
+        try:
+            response = client.GET('/people/1')
+            self.assertEqual(200, response.response_code)
+            self.assertEqual('<root><path>/people/1</path></root>', response.content)
+
+            response = client.POST('/people', '<person />')
+            self.assertEqual(201, response.response_code)
+            self.assertEqual('<person />', response.content)
+        finally:
+            transport.close()
+
+    def test_requests_transport(self):
+        self.exercise(RequestsTransport())
+
+    def test_requests_transport_with_a_pooled_session(self):
+        self.exercise(RequestsTransport(session=requests.Session()))
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    def test_httpx_transport(self):
+        self.exercise(HttpxTransport(http2=False))
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    def test_httpx_transport_errors_are_retryable(self):
+        transport = HttpxTransport(http2=False)
+        client = rest_client.Client('http://127.0.0.1:1', transport=transport,
+                                    circuit_breakers=CircuitBreakers(failure_threshold=1))
+        with self.assertRaises(httpx.TransportError):
+            client.GET('/')
+        with self.assertRaises(CircuitOpenError):
+            client.GET('/')
+
+    def test_models_use_their_transport(self):
+        class TransportModel(xml_models.Model):
+            path = xml_models.CharField(xpath='/root/path')
+            http_transport = RequestsTransport(session=requests.Session())
+            finders = {(path,): self.base_url + '/people/%s'}
+
+        self.assertEqual('/people/7', TransportModel.objects.get(path=7).path)
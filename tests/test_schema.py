@@ -0,0 +1,116 @@
+import unittest
+from mock import patch
+import xml_models
+from xml_models.managers import ValidationError
+from xml_models.rest_client import rest_client
+
+PERSON_XSD = """<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:element name="person">
+    <xs:complexType>
+      <xs:sequence><xs:element name="age" type="xs:int"/></xs:sequence>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>"""
+
+PERSON_RNG = """<element name="person" xmlns="http://relaxng.org/ns/structure/1.0"
+                         datatypeLibrary="http://www.w3.org/2001/XMLSchema-datatypes">
+  <element name="age"><data type="int"/></element>
+</element>"""
+
+PERSON_SCH = """<schema xmlns="http://purl.oclc.org/dsdl/schematron">
+  <pattern><rule context="person"><assert test="number(age) &gt;= 0">age must not be negative</assert></rule></pattern>
+</schema>"""
+
+PEOPLE = "<people><person><age>1</age></person><person><age>old</age></person><person><age>3</age></person></people>"
+
+
+class Person(xml_models.Model):
+    age = xml_models.IntField(xpath='/person/age')
+    schema = xml_models.Schema(PERSON_XSD)
+
+    finders = {(): "http://foo.com/people"}
+
+
+class SkippingPerson(xml_models.Model):
+    age = xml_models.IntField(xpath='/person/age')
+    schema = xml_models.Schema(PERSON_XSD, on_invalid='skip')
+    collection_node = 'people'
+
+    finders = {(): "http://foo.com/people"}
+
+
+class CoalescedPerson(xml_models.Model):
+    age = xml_models.IntField(xpath='/person/age')
+    schema = xml_models.Schema(PERSON_XSD)
+    coalesce_requests = True
+    coalesce_parsing = True
+
+    finders = {(): "http://foo.com/people"}
+
+
+class SchemaTestCases(unittest.TestCase):
+    def test_models_are_validated_on_load(self):
+        self.assertEqual(3, Person('<person><age>3</age></person>').age)
+        with self.assertRaises(ValidationError):
+            Person('<person><age>three</age></person>')
+
+    def test_detects_the_kind_of_schema(self):
+        for source in (PERSON_XSD, PERSON_RNG, PERSON_SCH):
+            schema = xml_models.Schema(source)
+            self.assertTrue(schema.accepts(xml_models.xpath_finder.domify('<person><age>3</age></person>')))
+            with self.assertRaises(ValidationError):
+                schema.assert_valid(xml_models.xpath_finder.domify('<person><age>-3</age><x/></person>'))
+
+    def test_rejects_unknown_schemas(self):
+        with self.assertRaises(ValueError):
+            xml_models.Schema('<nonsense/>').validator()
+
+    def test_compiles_once(self):
+        schema = xml_models.Schema(PERSON_XSD)
+        self.assertIs(schema.validator(), schema.validator())
+
+    @patch.object(rest_client.Client, "GET")
+    def test_invalid_query_records_raise(self, mock_get):
+        class api:
+            content = PEOPLE
+            response_code = 200
+        mock_get.return_value = api()
+        with self.assertRaises(ValidationError):
+            list(Person.objects.all())
+
+    @patch.object(rest_client.Client, "GET")
+    def test_invalid_query_records_can_be_skipped(self, mock_get):
+        class api:
+            content = PEOPLE
+            response_code = 200
+        mock_get.return_value = api()
+        self.assertEqual([1, 3], [person.age for person in SkippingPerson.objects.all()])
+        self.assertEqual(1, SkippingPerson.schema.rejected)
+
+    def test_sampled_validation(self):
+        schema = xml_models.Schema(PERSON_XSD, sample=0.25, on_invalid='skip')
+        invalid = xml_models.xpath_finder.domify('<person><age>old</age></person>')
+        accepted = [schema.accepts(invalid) for _ in range(8)]
+        self.assertEqual(2, schema.checked)
+        self.assertEqual(6, accepted.count(True))
+
+    @patch.object(rest_client.Client, "GET")
+    def test_get_validates(self, mock_get):
+        class api:
+            content = "<person><age>old</age></person>"
+            response_code = 200
+        mock_get.return_value = api()
+        with self.assertRaises(ValidationError):
+            Person.objects.get()
+
+    @patch.object(rest_client.Client, "GET")
+    def test_get_with_coalesced_parsing_validates_the_whole_record(self, mock_get):
+        class api:
+            content = "<person><age>3</age></person>"
+            response_code = 200
+        mock_get.return_value = api()
+        self.assertEqual(3, CoalescedPerson.objects.get().age)
+
+        api.content = "<person><age>old</age></person>"
+        with self.assertRaises(ValidationError):
+            CoalescedPerson.objects.get()
@@ -0,0 +1,109 @@
+import threading
+import time
+import unittest
+from mock import patch
+import xml_models
+from xml_models.rest_client import rest_client
+from xml_models.singleflight import SingleFlight
+
+
+def run_concurrently(func, count=8):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(func())) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class SingleFlightTestCases(unittest.TestCase):
+    def test_concurrent_calls_share_one_result(self):
+        group = SingleFlight()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.1)
+            return object()
+
+        results = run_concurrently(lambda: group.do('key', slow))
+        self.assertEqual(1, len(calls))
+        self.assertEqual(1, len(set(id(result) for result in results)))
+        self.assertEqual(0, group.in_flight())
+
+    def test_errors_are_shared(self):
+        group = SingleFlight()
+
+        def fail():
+            time.sleep(0.05)
+            raise ValueError('nope')
+
+        errors = []
+
+        def call():
+            try:
+                group.do('key', fail)
+            except ValueError as error:
+                errors.append(error)
+
+        run_concurrently(call, count=4)
+        self.assertEqual(4, len(errors))
+
+    def test_sequential_calls_are_not_cached(self):
+        group = SingleFlight()
+        self.assertEqual(1, group.do('key', lambda: 1))
+        self.assertEqual(2, group.do('key', lambda: 2))
+
+
+class CoalescedModel(xml_models.Model):
+    field1 = xml_models.CharField(xpath='/root/field1')
+    coalesce_requests = True
+
+    finders = {(field1,): "http://foo.com/coalesced/%s"}
+
+
+class CoalescedParsingModel(xml_models.Model):
+    field1 = xml_models.CharField(xpath='/root/field1')
+    coalesce_requests = True
+    coalesce_parsing = True
+
+    finders = {(field1,): "http://foo.com/coalesced/%s"}
+
+
+class CoalescedQueryTestCases(unittest.TestCase):
+    def slow_get(self, url, headers=None):
+        time.sleep(0.1)
+
+        class api:
+            content = "<elems><root><field1>hello</field1></root><root><field1>goodbye</field1></root></elems>"
+            response_code = 200
+        if url.endswith('/single'):
+            api.content = "<root><field1>hello</field1></root>"
+        return api()
+
+    def test_concurrent_gets_make_one_request(self):
+        with patch.object(rest_client.Client, "GET", side_effect=self.slow_get) as mock_get:
+            results = run_concurrently(lambda: CoalescedModel.objects.get(field1='single').field1)
+        self.assertEqual(1, mock_get.call_count)
+        self.assertEqual(['hello'] * 8, results)
+
+    def test_different_urls_are_not_coalesced(self):
+        keys = iter(range(4))
+        lock = threading.Lock()
+
+        def get():
+            with lock:
+                key = next(keys)
+            return CoalescedModel.objects.get(field1=key)
+
+        with patch.object(rest_client.Client, "GET", side_effect=self.slow_get) as mock_get:
+            run_concurrently(get, count=4)
+        self.assertEqual(4, mock_get.call_count)
+
+    def test_concurrent_queries_share_parsed_fragments(self):
+        with patch.object(rest_client.Client, "GET", side_effect=self.slow_get) as mock_get:
+            results = run_concurrently(
+                lambda: [model.field1 for model in CoalescedParsingModel.objects.filter(field1='a')])
+        self.assertEqual(1, mock_get.call_count)
+        self.assertEqual([['hello', 'goodbye']] * 8, results)
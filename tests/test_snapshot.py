@@ -0,0 +1,88 @@
+import copy
+import datetime
+import pickle
+import unittest
+from dateutil.tz import tzutc
+import xml_models
+from xml_models import snapshot
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class SnapAddress(xml_models.Model):
+    street = xml_models.CharField(xpath='/address/street')
+
+
+class SnapPerson(xml_models.Model):
+    id = xml_models.IntField(xpath='/person/@id')
+    name = xml_models.CharField(xpath='/person/name')
+    born = xml_models.DateField(xpath='/person/born')
+    score = xml_models.FloatField(xpath='/person/score')
+    active = xml_models.BoolField(xpath='/person/active')
+    tags = xml_models.CollectionField(xml_models.CharField, xpath='/person/tags/tag')
+    address = xml_models.OneToOneField(SnapAddress, xpath='/person/address')
+    previous = xml_models.CollectionField(SnapAddress, xpath='/person/previous/address')
+
+
+PERSON = ('<person id="3"><name>Bob</name><born>2001-02-03T04:05:06+02:00</born><score>1.5</score>'
+          '<active>true</active><tags><tag>a</tag><tag>b</tag></tags><address><street>Main</street></address>'
+          '<previous><address><street>Old</street></address></previous></person>')
+
+
+class SnapshotTestCases(unittest.TestCase):
+    def assertSamePerson(self, person):
+        self.assertEqual(3, person.id)
+        self.assertEqual('Bob', person.name)
+        self.assertEqual(datetime.timedelta(hours=2), person.born.utcoffset())
+        self.assertEqual(datetime.datetime(2001, 2, 3, 2, 5, 6, tzinfo=tzutc()), person.born)
+        self.assertEqual(1.5, person.score)
+        self.assertTrue(person.active)
+        self.assertEqual(['a', 'b'], person.tags)
+        self.assertEqual('Main', person.address.street)
+        self.assertEqual(['Old'], [address.street for address in person.previous])
+
+    def test_round_trips_field_values(self):
+        data = SnapPerson(PERSON).to_snapshot()
+        self.assertLess(len(data), len(PERSON))
+        self.assertSamePerson(SnapPerson.from_snapshot(data))
+
+    def test_missing_values(self):
+        person = SnapPerson.from_snapshot(SnapPerson('<person />').to_snapshot())
+        self.assertIsNone(person.born)
+        self.assertIsNone(person.address)
+        self.assertEqual([], person.tags)
+
+    def test_loaded_models_can_be_written_out(self):
+        person = SnapAddress.from_snapshot(SnapAddress('<address><street>Main</street></address>').to_snapshot())
+        self.assertEqual('<address><street>Main</street></address>', person.to_xml())
+
+    def test_models_pickle_with_their_xml(self):
+        person = pickle.loads(pickle.dumps(SnapPerson(PERSON.replace('</person>', '<extra>1</extra></person>'))))
+        self.assertSamePerson(person)
+        self.assertIn('<extra>1</extra>', person.to_xml())
+
+    def test_copies_keep_unmapped_xml(self):
+        person = SnapPerson(PERSON.replace('</person>', '<extra>1</extra></person>'))
+        person.name = 'Alice'
+        for copied in (copy.copy(person), copy.deepcopy(person)):
+            self.assertEqual('Alice', copied.name)
+            self.assertIn('<extra>1</extra>', copied.to_xml())
+            self.assertIsNot(person._dom, copied._dom)
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack_encoding(self):
+        self.assertSamePerson(SnapPerson.from_snapshot(SnapPerson(PERSON).to_snapshot(snapshot.MSGPACK)))
+
+    def test_rejects_snapshots_of_other_definitions(self):
+        data = SnapAddress('<address><street>Main</street></address>').to_snapshot()
+
+        class SnapAddress2(xml_models.Model):
+            street = xml_models.CharField(xpath='/address/road')
+        SnapAddress2.__name__ = 'SnapAddress'
+
+        with self.assertRaises(snapshot.SnapshotError):
+            SnapAddress2.from_snapshot(data)
+        with self.assertRaises(snapshot.SnapshotError):
+            SnapAddress.from_snapshot(b'<address />')
@@ -0,0 +1,131 @@
+import datetime
+import shutil
+import tempfile
+import unittest
+from mock import patch
+import xml_models
+from xml_models.cache import CachedResponse, DiskCache, cache_key
+from xml_models.rest_client import rest_client, Response
+
+
+class Synced(xml_models.Model):
+    id = xml_models.IntField(xpath='/person/@id')
+    name = xml_models.CharField(xpath='/person/name')
+
+    primary_key = 'id'
+    finders = {
+        (): "http://foo.com/people",
+    }
+
+
+class DeltaSynced(xml_models.Model):
+    id = xml_models.IntField(xpath='/person/@id')
+    name = xml_models.CharField(xpath='/person/name')
+
+    primary_key = 'id'
+    finders = {
+        (): "http://foo.com/people",
+    }
+    delta_finder = "http://foo.com/people?since=%s"
+
+
+def people(*names):
+    return '<people>%s</people>' % ''.join('<person id="%s"><name>%s</name></person>' % (i, name)
+                                           for i, name in names)
+
+
+class RefreshTestCases(unittest.TestCase):
+    @patch.object(rest_client.Client, "GET")
+    def test_first_refresh_fetches_the_whole_collection(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/people", 200, {}, people((1, 'Kermit'), (2, 'Piggy')))
+
+        collection = Synced.objects.refresh()
+
+        self.assertEqual("http://foo.com/people", mock_get.call_args[0][0])
+        self.assertEqual([1, 2], sorted(collection.keys()))
+        self.assertEqual('Piggy', collection[2].name)
+        self.assertEqual([1, 2], collection.added)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_only_changed_records_are_replaced(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/people", 200, {}, people((1, 'Kermit'), (2, 'Piggy')))
+        collection = Synced.objects.refresh()
+        kermit = collection[1]
+
+        mock_get.return_value = Response("http://foo.com/people", 200, {},
+                                         people((1, 'Kermit'), (2, 'Miss Piggy'), (3, 'Gonzo')))
+        Synced.objects.refresh(collection)
+
+        self.assertIs(kermit, collection[1])
+        self.assertEqual('Miss Piggy', collection[2].name)
+        self.assertEqual(([3], [2], []), (collection.added, collection.updated, collection.removed))
+
+    @patch.object(rest_client.Client, "GET")
+    def test_complete_fetches_remove_missing_records(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/people", 200, {}, people((1, 'Kermit'), (2, 'Piggy')))
+        collection = Synced.objects.refresh()
+
+        mock_get.return_value = Response("http://foo.com/people", 200, {}, people((2, 'Piggy')))
+        Synced.objects.refresh(collection)
+
+        self.assertEqual([2], collection.keys())
+        self.assertEqual([1], collection.removed)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_whole_collection_is_revalidated_with_last_modified(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/people", 200,
+                                         {'Last-Modified': 'Mon, 19 Oct 2026 10:00:00 GMT'}, people((1, 'Kermit')))
+        collection = Synced.objects.refresh()
+
+        mock_get.return_value = Response("http://foo.com/people", 304, {}, '')
+        Synced.objects.refresh(collection)
+
+        self.assertEqual('Mon, 19 Oct 2026 10:00:00 GMT', mock_get.call_args[1]['headers']['If-Modified-Since'])
+        self.assertEqual(['Kermit'], [person.name for person in collection])
+        self.assertEqual(([], [], []), (collection.added, collection.updated, collection.removed))
+
+    @patch.object(rest_client.Client, "GET")
+    def test_deltas_are_fetched_since_the_previous_refresh(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/people", 200, {}, people((1, 'Kermit'), (2, 'Piggy')))
+        collection = DeltaSynced.objects.refresh()
+        collection.synced_at = datetime.datetime(2026, 10, 19, 10, 0, 0)
+
+        mock_get.return_value = Response("http://foo.com/people", 200, {}, people((2, 'Miss Piggy')))
+        DeltaSynced.objects.refresh(collection)
+
+        self.assertEqual("http://foo.com/people?since=2026-10-19T10%3A00%3A00Z", mock_get.call_args[0][0])
+        self.assertEqual([1, 2], sorted(collection.keys()))
+        self.assertEqual([2], collection.updated)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_empty_deltas(self, mock_get):
+        mock_get.return_value = Response("http://foo.com/people", 200, {}, people((1, 'Kermit')))
+        collection = DeltaSynced.objects.refresh()
+
+        mock_get.return_value = Response("http://foo.com/people", 200, {}, '<people />')
+        DeltaSynced.objects.refresh(collection)
+
+        self.assertEqual([1], collection.keys())
+        self.assertEqual([], collection.updated)
+
+    @patch.object(rest_client.Client, "GET")
+    def test_replayed_bodies_are_parsed_in_place(self, mock_get):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        cache = DiskCache(directory)
+        mock_get.return_value = cache.set(cache_key("http://foo.com/people"), Response(
+            "http://foo.com/people", 200, {}, people((1, 'Kermit'), (2, 'Piggy'))))
+
+        def unread(response):
+            raise AssertionError('the body was read into a string')
+
+        with patch.object(CachedResponse, 'content', property(unread)):
+            collection = Synced.objects.refresh()
+        self.assertEqual([1, 2], sorted(collection.keys()))
+
+    def test_models_need_a_primary_key(self):
+        class Keyless(xml_models.Model):
+            name = xml_models.CharField(xpath='/person/name')
+
+        with self.assertRaises(AttributeError):
+            Keyless.objects.refresh()
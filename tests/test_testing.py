@@ -0,0 +1,75 @@
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import xml_models
+from xml_models.managers import DoesNotExist
+from xml_models.testing import StubTransport, RecordingTransport, ReplayTransport
+
+
+class StubbedModel(xml_models.Model):
+    name = xml_models.CharField(xpath='/Person/name')
+    id = xml_models.IntField(xpath='/Person/@id')
+
+    finders = {(id,): "http://example.com/person/%s"}
+
+
+def person(match):
+    return '<Person id="%s"><name>Person %s</name></Person>' % (match.group(1), match.group(1))
+
+
+class StubTransportTestCases(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, StubbedModel, 'http_transport', None)
+
+    def test_serves_canned_xml_by_url_pattern(self):
+        StubbedModel.http_transport = StubTransport().add(r'/person/(\d+)$', person)
+        self.assertEqual('Person 3', StubbedModel.objects.get(id=3).name)
+        self.assertEqual(1, StubbedModel.http_transport.calls)
+
+    def test_unmatched_urls_are_not_found(self):
+        StubbedModel.http_transport = StubTransport({r'/person/1$': '<Person id="1" />'})
+        with self.assertRaises(DoesNotExist):
+            StubbedModel.objects.get(id=2)
+
+    def test_latency_and_bandwidth_are_applied(self):
+        transport = StubTransport(latency=0.05, bandwidth=1000).add(r'/person/', 'x' * 50)
+        start = time.time()
+        transport.request('get', 'http://example.com/person/1')
+        self.assertTrue(time.time() - start >= 0.1)
+
+    def test_concurrent_requests_overlap(self):
+        StubbedModel.http_transport = StubTransport(latency=0.1).add(r'/person/(\d+)$', person)
+        threads = [threading.Thread(target=StubbedModel.objects.get, kwargs={'id': i}) for i in range(8)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(time.time() - start < 0.5)
+        self.assertEqual(8, StubbedModel.http_transport.calls)
+
+
+class RecordReplayTestCases(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(setattr, StubbedModel, 'http_transport', None)
+
+    def test_replays_recorded_responses_from_memory_maps(self):
+        upstream = StubTransport().add(r'/person/(\d+)$', person)
+        StubbedModel.http_transport = RecordingTransport(self.directory, transport=upstream)
+        self.assertEqual('Person 5', StubbedModel.objects.get(id=5).name)
+
+        StubbedModel.http_transport = ReplayTransport(self.directory)
+        response = StubbedModel.http_transport.request('get', 'http://example.com/person/5', headers={})
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(hasattr(response, 'open'))
+        self.assertEqual('Person 5', StubbedModel.objects.get(id=5).name)
+        self.assertEqual(1, upstream.calls)
+
+    def test_unrecorded_requests_are_not_found(self):
+        StubbedModel.http_transport = ReplayTransport(self.directory)
+        with self.assertRaises(DoesNotExist):
+            StubbedModel.objects.get(id=1)
@@ -0,0 +1,290 @@
+import threading
+import unittest
+from lxml import etree
+from mock import patch
+import xml_models
+from xml_models import xpath_finder
+from xml_models.rest_client import RequestsTransport, rest_client
+from xml_models.testing import StubTransport
+
+THREADS = 8
+
+
+class ThreadedModel(xml_models.Model):
+    id = xml_models.IntField(xpath='/Person/@id')
+    name = xml_models.CharField(xpath='/Person/name')
+    tags = xml_models.CollectionField(xml_models.CharField, xpath='/Person/tag', intern=True)
+
+    finders = {(id,): "http://example.com/person/%s"}
+
+
+class PeopleModel(xml_models.Model):
+    id = xml_models.IntField(xpath='/Person/@id')
+    name = xml_models.CharField(xpath='/Person/name')
+    tags = xml_models.CollectionField(xml_models.CharField, xpath='/Person/tag')
+
+    collection_node = 'people'
+    finders = {(): "http://example.com/people"}
+
+    def validate_on_load(self):
+        if self.name == 'Person 13':
+            raise ValueError('unlucky')
+
+
+def people(count):
+    return '<people>%s</people>' % ''.join(person(number) for number in range(count))
+
+
+def person(number):
+    return '<Person id="%s"><name>Person %s</name><tag>even%s</tag><tag>tag%s</tag></Person>' % (
+        number, number, number % 2, number % 3)
+
+
+def person_route(match):
+    return person(int(match.group(1)))
+
+
+def run_threads(target, count=THREADS):
+    """
+    Run ``target(number)`` on ``count`` threads started together
+
+    :return: list of the results, or raises the first exception
+    """
+    start = threading.Event()
+    results = [None] * count
+    errors = []
+
+    def run(number):
+        start.wait()
+        try:
+            results[number] = target(number)
+        except Exception as error:  # pylint: disable=broad-except
+            errors.append(error)
+
+    threads = [threading.Thread(target=run, args=(number,)) for number in range(count)]
+    for thread in threads:
+        thread.start()
+    start.set()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+class ThreadSafetyTestCases(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, ThreadedModel, 'http_transport', None)
+
+    def test_models_of_one_class_are_hydrated_concurrently(self):
+        def hydrate(number):
+            return [(model.id, model.name, model.tags) for model in
+                    (ThreadedModel(person(key)) for key in range(number * 100, number * 100 + 100))]
+
+        results = run_threads(hydrate)
+        for number, values in enumerate(results):
+            self.assertEqual([(key, 'Person %s' % key, ['even%s' % (key % 2), 'tag%s' % (key % 3)])
+                              for key in range(number * 100, number * 100 + 100)], values)
+
+    def test_class_metadata_is_immutable(self):
+        self.assertIsInstance(ThreadedModel.xml_fields, tuple)
+        tags = ThreadedModel._fields['tags']
+        item_field = tags._item_field
+        ThreadedModel(person(1)).tags
+        self.assertIs(item_field, tags._item_field)
+
+    def test_first_use_of_a_model_creates_one_manager(self):
+        class FreshModel(xml_models.Model):
+            id = xml_models.IntField(xpath='/Person/@id')
+            headers = {'Accept': 'application/xml'}
+
+        managers = run_threads(lambda number: FreshModel.objects)
+        self.assertEqual(1, len(set(id(manager) for manager in managers)))
+        self.assertIs(FreshModel.objects, managers[0])
+        self.assertEqual({'Accept': 'application/xml'}, managers[0].headers)
+
+    def test_queries_run_concurrently(self):
+        ThreadedModel.http_transport = StubTransport(latency=0.01).add(r'/person/(\d+)$', person_route)
+
+        results = run_threads(lambda number: [ThreadedModel.objects.get(id=number * 10 + i).name for i in range(10)])
+
+        for number, names in enumerate(results):
+            self.assertEqual(['Person %s' % (number * 10 + i) for i in range(10)], names)
+        self.assertEqual(THREADS * 10, ThreadedModel.http_transport.calls)
+
+    def test_queries_copy_the_manager_headers(self):
+        manager = ThreadedModel.objects
+        self.addCleanup(setattr, manager, 'headers', manager.headers)
+        manager.headers = {'X-Tenant': 'a'}
+        query = manager.filter(id=1)
+        manager.headers['X-Tenant'] = 'b'
+        query.headers['X-Trace'] = '1'
+        self.assertEqual({'X-Tenant': 'a', 'X-Trace': '1'}, query.headers)
+        self.assertEqual({'X-Tenant': 'b'}, manager.headers)
+
+    def test_schema_validators_are_per_thread(self):
+        schema = xml_models.Schema('<grammar xmlns="http://relaxng.org/ns/structure/1.0">'
+                                   '<start><element name="Person"><attribute name="id"><data type="int" '
+                                   'datatypeLibrary="http://www.w3.org/2001/XMLSchema-datatypes"/></attribute>'
+                                   '<zeroOrMore><element name="tag"><text/></element></zeroOrMore></element></start>'
+                                   '</grammar>')
+        validators = run_threads(lambda number: schema.validator())
+        self.assertEqual(THREADS, len(set(id(validator) for validator in validators)))
+        self.assertIs(schema.validator(), schema.validator())
+
+
+class ThreadedQueryTestCases(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, PeopleModel, 'http_transport', None)
+
+    def serve(self, count):
+        PeopleModel.http_transport = StubTransport().add(r'/people$', people(count))
+
+    def test_models_are_hydrated_on_worker_threads_in_order(self):
+        self.serve(12)
+        threads = set()
+        original = PeopleModel.hydrate
+
+        def hydrate(model, fields=None):
+            threads.add(threading.current_thread())
+            original(model, fields)
+
+        with patch.object(PeopleModel, 'hydrate', hydrate):
+            models = list(PeopleModel.objects.all().threaded(workers=3, chunk_size=2))
+        self.assertEqual(list(range(12)), [model.id for model in models])
+        self.assertEqual(['Person 5', ['even1', 'tag2']], [models[5].name, models[5].tags])
+        self.assertNotIn(threading.current_thread(), threads)
+        for model in models:
+            self.assertEqual(3, len(model._cache))
+
+    def test_threaded_results_match_unthreaded(self):
+        self.serve(10)
+        expected = [(model.id, model.name, model.tags) for model in PeopleModel.objects.all()]
+        query = PeopleModel.objects.filter(name__startswith='Person').threaded(workers=4, chunk_size=3)
+        self.assertEqual(expected, [(model.id, model.name, model.tags) for model in query])
+
+    def test_slices_are_hydrated_on_worker_threads(self):
+        self.serve(10)
+        models = PeopleModel.objects.all().threaded(workers=2, chunk_size=1)[2:5]
+        self.assertEqual([2, 3, 4], [model.id for model in models])
+
+    def test_an_explicit_hydration_mode_is_kept(self):
+        self.serve(3)
+        models = list(PeopleModel.objects.all().hydrate(xml_models.LAZY).threaded(workers=2))
+        self.assertEqual([1, 1, 1], [len(model._cache) for model in models])  # only the name validate_on_load read
+
+    def test_errors_are_raised_to_the_consumer(self):
+        self.serve(20)
+        with self.assertRaises(ValueError):
+            list(PeopleModel.objects.all().threaded(workers=2, chunk_size=4))
+
+    def test_stopping_early_cancels_the_remaining_chunks(self):
+        self.serve(200)
+        for model in PeopleModel.objects.all().threaded(workers=2, chunk_size=1):
+            break
+        self.assertEqual(0, model.id)
+
+    def test_workers_default_to_the_cores(self):
+        with patch('multiprocessing.cpu_count', return_value=6):
+            self.assertEqual(6, PeopleModel.objects.all().threaded().workers)
+
+
+class VerifyTestCases(unittest.TestCase):
+    def tearDown(self):
+        xml_models.VERIFY = True
+        if 'verify_ssl' in PeopleModel.__dict__:
+            del PeopleModel.verify_ssl
+
+    def test_verify_is_read_when_the_query_is_created(self):
+        query = PeopleModel.objects.all()
+        xml_models.VERIFY = False
+        self.assertTrue(query._client().verify)
+        self.assertFalse(PeopleModel.objects.all()._client().verify)
+
+    def test_models_can_set_their_own_verify(self):
+        PeopleModel.verify_ssl = '/etc/ssl/internal-ca.pem'
+        self.assertEqual('/etc/ssl/internal-ca.pem', PeopleModel.objects.all()._client().verify)
+
+    @patch.object(rest_client.Client, 'GET')
+    def test_requests_use_the_verify_of_their_query(self, get):
+        get.return_value = rest_client.Response('http://example.com/people', 200, {}, people(1))
+        PeopleModel.verify_ssl = False
+        clients = []
+        with patch.object(rest_client.Client, '__init__', side_effect=lambda *args, **kw: clients.append(kw),
+                          autospec=True) as init:
+            init.return_value = None
+            list(PeopleModel.objects.all())
+        self.assertEqual([False], [kw['verify'] for kw in clients])
+
+
+class LocalXPathTestCases(unittest.TestCase):
+    def test_each_thread_compiles_its_own_copy(self):
+        xpath = xpath_finder.local_xpath('/Person/name')
+        tree = etree.fromstring(person(1))
+        compiled = []
+
+        def evaluate(number):
+            result = xpath(tree)[0].text
+            compiled.append(xpath._local.xpath)
+            return result
+
+        self.assertEqual(['Person 1'] * THREADS, run_threads(evaluate))
+        self.assertEqual(THREADS, len(set(id(copy) for copy in compiled)))
+
+    def test_expressions_are_shared_by_key(self):
+        self.assertIs(xpath_finder.local_xpath('/a/b', 'urn:a'), xpath_finder.local_xpath('/a/b', 'urn:a'))
+        self.assertIsNot(xpath_finder.local_xpath('/a/b'), xpath_finder.local_xpath('/a/b', smart_strings=False))
+
+    def test_names_are_bound_to_the_default_namespace(self):
+        tree = etree.fromstring('<a xmlns="urn:a"><b>x</b></a>')
+        self.assertEqual('x', xpath_finder.local_xpath('/a/b', 'urn:a')(tree)[0].text)
+
+    def test_syntax_errors_are_raised_when_compiled(self):
+        with self.assertRaises(etree.XPathSyntaxError):
+            xpath_finder.local_xpath('/a/[')
+
+    def test_compiled_expressions_pass_through(self):
+        xpath = xpath_finder.local_xpath('/a')
+        self.assertIs(xpath, xpath_finder.compile_xpath(xpath))
+
+
+class RequestsTransportThreadTestCases(unittest.TestCase):
+    def test_each_thread_gets_its_own_session(self):
+        transport = RequestsTransport(session_factory=FakeSession)
+
+        sessions = run_threads(lambda number: (transport.session, transport.session))
+
+        for first, second in sessions:
+            self.assertIs(first, second)
+        self.assertEqual(THREADS, len(set(id(first) for first, _ in sessions)))
+        transport.close()
+        self.assertTrue(all(first.closed for first, _ in sessions))
+
+    def test_requests_use_the_session_of_the_thread(self):
+        transport = RequestsTransport(session_factory=FakeSession)
+        transport.request('get', 'http://example.com/', headers={})
+        self.assertEqual([('get', 'http://example.com/')], transport.session.requests)
+
+    def test_a_given_session_is_used_by_every_thread(self):
+        session = FakeSession()
+        transport = RequestsTransport(session=session)
+        self.assertEqual([session] * THREADS, run_threads(lambda number: transport.session))
+
+    @patch('requests.get')
+    def test_without_a_session_requests_are_made_directly(self, get):
+        transport = RequestsTransport()
+        self.assertIsNone(transport.session)
+        transport.request('get', 'http://example.com/')
+        self.assertTrue(get.called)
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.closed = False
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url))
+
+    def close(self):
+        self.closed = True
@@ -1,5 +1,9 @@
 from __future__ import absolute_import
 
 from xml_models.xml_models import *
+from xml_models.cache import DiskCache, MemoryCache, SqliteCache
 
-VERIFY=True
\ No newline at end of file
+VERIFY=True
+
+# number of worker threads used for background hydration, read when the first background hydration starts
+BACKGROUND_WORKERS=4
\ No newline at end of file
@@ -0,0 +1,553 @@
+"""
+Response and model caching for :class:`xml_models.managers.ModelQuery` fetches.
+
+Caches are opt-in and are enabled by setting a ``response_cache`` attribute on a Model, and a ``model_cache`` for
+snapshots of the models ``get`` returns:
+
+.. code-block:: python
+
+    class Person(xml_models.Model):
+        ...
+        response_cache = xml_models.DiskCache('/var/cache/people', max_age=300)
+        model_cache = xml_models.SqliteCache('/dev/shm/people.db', max_age=60, max_size=256 * 1024 * 1024)
+
+:class:`DiskCache` and :class:`SqliteCache` are shared by every process using the same path.  :class:`MemoryCache`
+belongs to a single process.
+"""
+from __future__ import absolute_import
+
+import binascii
+import collections
+import errno
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from xml_models import snapshot
+from xml_models.rest_client import Response
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+def cache_key(url, headers=None):
+    """
+    Build a stable key for a request from its ``url`` and ``headers``
+
+    :param url: fully resolved URL
+    :param headers: request headers
+    :return: hex digest
+    """
+    parts = [url] + ['%s=%s' % (k, v) for k, v in sorted((headers or {}).items())]
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+class StoredResponse(Response):
+    """
+    A :class:`Response` replayed from a cache.
+
+    ``version`` identifies the stored body: it changes when a different body is stored under the same key, but not
+    when the entry is revalidated.
+    """
+
+    def __init__(self, url, response_code, headers, content, stored_at, version=None):
+        Response.__init__(self, url, response_code, headers, content)
+        self.stored_at = stored_at
+        self.version = version
+
+    @property
+    def etag(self):
+        """The ``ETag`` the response was stored with, if any"""
+        return _header(self.headers, 'ETag')
+
+    @property
+    def last_modified(self):
+        """The ``Last-Modified`` header the response was stored with, if any"""
+        return _header(self.headers, 'Last-Modified')
+
+
+class CachedResponse(StoredResponse):
+    """
+    A :class:`Response` replayed from a :class:`DiskCache`.
+
+    The body is not read into memory until ``content`` is accessed.  :meth:`open` gives a memory mapped view of the
+    body which lxml can parse directly.
+    """
+
+    def __init__(self, url, response_code, headers, path, stored_at, version=None):
+        StoredResponse.__init__(self, url, response_code, headers, None, stored_at, version)
+        self._path = path
+
+    @property
+    def content(self):
+        """The response body, as a string, read from disk on first access"""
+        if self._content is None:
+            with open(self._path, 'rb') as body:
+                self._content = body.read().decode('utf-8')
+        return self._content
+
+    def open(self):
+        """
+        Memory map the stored body.
+
+        :return: a read only :class:`mmap.mmap` positioned at the start of the body
+        """
+        with open(self._path, 'rb') as body:
+            return mmap.mmap(body.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class ResponseCache(object):
+    """
+    The interface shared by the caches.
+
+    Stored responses are served without contacting the server while they are younger than ``max_age`` seconds.  Older
+    responses are revalidated with ``If-None-Match`` / ``If-Modified-Since`` and a ``304 Not Modified`` refreshes the
+    entry in place.  With ``offline`` set, stored responses are always served as-is, which makes benchmarking and
+    profiling repeatable without network access.
+
+    Model snapshots are served while they are younger than ``max_age`` seconds and are never revalidated.
+
+    Subclasses store responses with :meth:`get`, :meth:`set` and :meth:`touch` and snapshots with :meth:`load` and
+    :meth:`store`, and call :meth:`__init__`.
+
+    The indexes of stored responses, see :mod:`xml_models.index`, are kept in the memory of the cache object, and only
+    for the ``max_indexes`` responses looked up most recently.
+    """
+
+    max_age = 0
+    offline = False
+    max_indexes = 32
+
+    def __init__(self, max_age=0, offline=False):
+        """
+        :param max_age: seconds a stored response is served without revalidation
+        :param offline: never revalidate stored responses
+        """
+        self.max_age = max_age
+        self.offline = offline
+        self._indexes = collections.OrderedDict()
+        self._indexes_lock = threading.Lock()
+
+    def fetch(self, client, url, headers=None):
+        """
+        GET ``url`` through the cache.
+
+        :param client: :class:`xml_models.rest_client.Client` used on a cache miss or to revalidate
+        :param url: fully resolved URL
+        :param headers: request headers, also part of the cache key
+        :return: :class:`StoredResponse` or, for responses that are not cacheable, the client's response
+        """
+        key = cache_key(url, headers)
+        cached = self.get(key)
+        if cached is not None and self.is_fresh(cached):
+            return cached
+
+        request_headers = dict(headers or {})
+        if cached is not None:
+            if cached.etag:
+                request_headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                request_headers['If-Modified-Since'] = cached.last_modified
+
+        response = client.GET(url, headers=request_headers)
+        if cached is not None and response.response_code == 304:
+            self.touch(key)
+            return cached
+        if response.response_code != 200 or not response.content:
+            return response
+        return self.set(key, response)
+
+    def is_fresh(self, cached):
+        """
+        :param cached: :class:`StoredResponse`
+        :return: True if ``cached`` can be served without revalidation
+        """
+        return self._is_fresh(cached.stored_at)
+
+    def _is_fresh(self, stored_at):
+        return self.offline or time.time() - stored_at < self.max_age
+
+    def load_model(self, model_class, url, headers=None):
+        """
+        :param model_class: the :class:`xml_models.Model` class to load
+        :param url: fully resolved URL the model was fetched from
+        :param headers: request headers
+        :return: a fresh, stored, ``model_class`` instance or None
+        """
+        stored = self.load(_model_key(model_class, url, headers))
+        if stored is None or not self._is_fresh(stored[1]):
+            return None
+        try:
+            return snapshot.loads(model_class, stored[0])
+        except (ValueError, EOFError, TypeError):
+            # stored by another version of the model, or of Python
+            return None
+
+    def store_model(self, model, url, headers=None):
+        """
+        Store a snapshot of ``model``, fully hydrating it
+
+        :param model: :class:`xml_models.Model` instance
+        :param url: fully resolved URL the model was fetched from
+        :param headers: request headers
+        """
+        self.store(_model_key(type(model), url, headers), snapshot.dumps(model))
+
+    def get_index(self, key):
+        """
+        :param key: ``(model class, cache key)`` of the indexed response
+        :return: the :class:`xml_models.index.RecordIndex` kept for ``key``, or None
+        """
+        with self._indexes_lock:
+            indexes = self._indexes
+            index = indexes.pop(key, None)
+            if index is not None:
+                indexes[key] = index  # most recently used indexes are kept last
+            return index
+
+    def set_index(self, key, index):
+        """
+        Keep ``index``, dropping the least recently used index once there are more than ``max_indexes``
+
+        :param key: ``(model class, cache key)`` of the indexed response
+        :param index: :class:`xml_models.index.RecordIndex`
+        """
+        with self._indexes_lock:
+            indexes = self._indexes
+            indexes.pop(key, None)
+            indexes[key] = index
+            while len(indexes) > self.max_indexes:
+                indexes.popitem(last=False)
+
+    def get(self, key):
+        """
+        :param key: see :func:`cache_key`
+        :return: the stored :class:`StoredResponse` or None
+        """
+        raise NotImplementedError
+
+    def set(self, key, response):
+        """
+        Store ``response`` under ``key``
+
+        :param key: see :func:`cache_key`
+        :param response: :class:`xml_models.rest_client.Response`
+        :return: the stored :class:`StoredResponse`
+        """
+        raise NotImplementedError
+
+    def touch(self, key):
+        """
+        Mark the entry under ``key`` as freshly validated
+
+        :param key: see :func:`cache_key`
+        """
+        raise NotImplementedError
+
+    def load(self, key):
+        """
+        :param key: snapshot key
+        :return: ``(data, stored_at)`` or None
+        """
+        raise NotImplementedError
+
+    def store(self, key, data):
+        """
+        :param key: snapshot key
+        :param data: snapshot bytes
+        """
+        raise NotImplementedError
+
+
+class DiskCache(ResponseCache):
+    """
+    A persistent, content-addressed cache of response bodies.
+
+    Bodies are stored once per unique content under ``directory/objects`` and each request key points at a body
+    through a small metadata record under ``directory/entries``.  Replayed bodies are memory mapped rather than read
+    into Python memory.  Entries are as old as the modification time of their metadata record.  Nothing is evicted.
+    """
+
+    def __init__(self, directory, max_age=0, offline=False):
+        """
+        :param directory: where to keep the cache.  Created if missing.
+        :param max_age: seconds a stored response is served without revalidation
+        :param offline: never revalidate stored responses
+        """
+        ResponseCache.__init__(self, max_age, offline)
+        self.directory = directory
+        for sub in ('objects', 'entries', 'snapshots'):
+            _makedirs(os.path.join(directory, sub))
+
+    def get(self, key):
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path) as entry_file:
+                entry = json.load(entry_file)
+            stored_at = os.path.getmtime(entry_path)
+        except (IOError, OSError, ValueError):
+            return None
+        body_path = self._object_path(entry['digest'])
+        if not os.path.exists(body_path):
+            return None
+        return CachedResponse(entry['url'], entry['status'], entry['headers'], body_path, stored_at, entry['digest'])
+
+    def set(self, key, response):
+        body = response.content
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        digest = _digest(body)
+        body_path = self._object_path(digest)
+        if not os.path.exists(body_path):
+            _makedirs(os.path.dirname(body_path))
+            self._write(body_path, body)
+
+        entry = {'url': response.url, 'status': response.response_code, 'headers': dict(response.headers),
+                 'digest': digest}
+        self._write(self._entry_path(key), json.dumps(entry).encode('utf-8'))
+        return self.get(key)
+
+    def touch(self, key):
+        os.utime(self._entry_path(key), None)
+
+    def load(self, key):
+        path = os.path.join(self.directory, 'snapshots', key)
+        try:
+            with open(path, 'rb') as stored:
+                return stored.read(), os.path.getmtime(path)
+        except (IOError, OSError):
+            return None
+
+    def store(self, key, data):
+        self._write(os.path.join(self.directory, 'snapshots', key), data)
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, 'entries', key)
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest[2:])
+
+    @staticmethod
+    def _write(path, data):
+        handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(handle, 'wb') as tmp:
+            tmp.write(data)
+        _replace(tmp_path, path)
+
+
+class MemoryCache(ResponseCache):
+    """
+    A cache in the memory of one process.
+
+    The least recently used entries are evicted once the stored bodies and snapshots take more than ``max_size``
+    bytes, and entries older than ``ttl`` seconds are never served.
+    """
+
+    def __init__(self, max_age=0, offline=False, max_size=None, ttl=None):
+        """
+        :param max_age: seconds a stored response is served without revalidation
+        :param offline: never revalidate stored responses
+        :param max_size: most bytes of bodies and snapshots to keep, or None for no limit
+        :param ttl: seconds after which entries are dropped, or None to keep them until evicted for space
+        """
+        ResponseCache.__init__(self, max_age, offline)
+        self.max_size = max_size
+        self.ttl = ttl
+        self.size = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        entry = self._get(key)
+        return None if entry is None or not isinstance(entry[0], StoredResponse) else entry[0]
+
+    def set(self, key, response):
+        stored = StoredResponse(response.url, response.response_code, response.headers, response.content, time.time(),
+                                _digest(response.content))
+        self._put(key, stored, len(response.content))
+        return stored
+
+    def touch(self, key):
+        entry = self._get(key)
+        if entry is not None:
+            entry[0].stored_at = time.time()
+            self._put(key, entry[0], entry[1])
+
+    def load(self, key):
+        entry = self._get(key)
+        if entry is None or isinstance(entry[0], StoredResponse):
+            return None
+        return entry[0], entry[2]
+
+    def store(self, key, data):
+        self._put(key, data, len(data))
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            if self.ttl is not None and time.time() - entry[2] >= self.ttl:
+                self.size -= entry[1]
+                return None
+            self._entries[key] = entry  # most recently used entries are kept last
+            return entry
+
+    def _put(self, key, value, size):
+        stored_at = value.stored_at if isinstance(value, StoredResponse) else time.time()
+        with self._lock:
+            replaced = self._entries.pop(key, None)
+            if replaced is not None:
+                self.size -= replaced[1]
+            self._entries[key] = (value, size, stored_at)
+            self.size += size
+            while self.max_size is not None and self.size > self.max_size:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self.size -= evicted
+
+
+class SqliteCache(ResponseCache):
+    """
+    A cache in an SQLite database, shared by every process that opens the same ``path``, such as the workers of a
+    pre-forking server.  Keep the database on a memory backed filesystem like ``/dev/shm`` to keep it off the disk.
+
+    The database is in write-ahead log mode, so readers take no locks and neither wait for writers nor hold them up.
+    Each write drops entries older than ``ttl`` seconds and then the oldest entries until the stored bodies and
+    snapshots fit in ``max_size`` bytes.  Entries are evicted in the order they were stored rather than used, as
+    recording each use would turn every read into a write.  Writes are skipped when another process holds the write
+    lock for longer than ``timeout`` seconds.
+    """
+
+    def __init__(self, path, max_age=0, offline=False, max_size=None, ttl=None, timeout=5):
+        """
+        :param path: the database file.  Created if missing.
+        :param max_age: seconds a stored response is served without revalidation
+        :param offline: never revalidate stored responses
+        :param max_size: most bytes of bodies and snapshots to keep, or None for no limit
+        :param ttl: seconds after which entries are dropped, or None to keep them until evicted for space
+        :param timeout: seconds a write waits for the write lock
+        """
+        ResponseCache.__init__(self, max_age, offline)
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.timeout = timeout
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, meta TEXT, body BLOB NOT NULL, '
+                           'size INTEGER NOT NULL, stored_at REAL NOT NULL)')
+        connection.execute('CREATE INDEX IF NOT EXISTS entries_by_age ON entries (stored_at)')
+
+    def get(self, key):
+        row = self._connection().execute('SELECT meta, body, stored_at FROM entries '
+                                         'WHERE key = ? AND meta IS NOT NULL AND stored_at >= ?',
+                                         (key, self._cutoff())).fetchone()
+        if row is None:
+            return None
+        meta = json.loads(row[0])
+        return StoredResponse(meta['url'], meta['status'], meta['headers'], bytes(row[1]).decode('utf-8'), row[2],
+                              meta['digest'])
+
+    def set(self, key, response):
+        body = response.content
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        digest = _digest(body)
+        meta = json.dumps({'url': response.url, 'status': response.response_code, 'headers': dict(response.headers),
+                           'digest': digest})
+        stored_at = self._put(key, meta, body)
+        return StoredResponse(response.url, response.response_code, response.headers, response.content, stored_at,
+                              digest)
+
+    def touch(self, key):
+        try:
+            self._connection().execute('UPDATE entries SET stored_at = ? WHERE key = ?', (time.time(), key))
+        except sqlite3.OperationalError:
+            pass  # locked, the entry is revalidated again next time
+
+    def load(self, key):
+        row = self._connection().execute('SELECT body, stored_at FROM entries '
+                                         'WHERE key = ? AND meta IS NULL AND stored_at >= ?',
+                                         (key, self._cutoff())).fetchone()
+        return None if row is None else (bytes(row[0]), row[1])
+
+    def store(self, key, data):
+        self._put(key, None, data)
+
+    def _cutoff(self):
+        return float('-inf') if self.ttl is None else time.time() - self.ttl
+
+    def _put(self, key, meta, body):
+        stored_at = time.time()
+        connection = self._connection()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+        except sqlite3.OperationalError:
+            return stored_at  # locked, caching is best effort
+        try:
+            connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                               (key, meta, sqlite3.Binary(body), len(body), stored_at))
+            self._evict(connection, stored_at)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return stored_at
+
+    def _evict(self, connection, now):
+        if self.ttl is not None:
+            connection.execute('DELETE FROM entries WHERE stored_at < ?', (now - self.ttl,))
+        if self.max_size is None:
+            return
+        excess = connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0] - self.max_size
+        evicted = []
+        for key, size in connection.execute('SELECT key, size FROM entries ORDER BY stored_at'):
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+        connection.executemany('DELETE FROM entries WHERE key = ?', evicted)
+
+    def _connection(self):
+        # connections must not be shared between threads, or used in a process forked after they were opened
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                               check_same_thread=False)
+            local.connection.execute('PRAGMA synchronous=NORMAL')
+            local.pid = os.getpid()
+        return local.connection
+
+
+def _model_key(model_class, url, headers):
+    # keyed on the model's definition too, so that snapshots of a changed model are never loaded
+    print_ = binascii.hexlify(snapshot.fingerprint(model_class)).decode('ascii')
+    return 'model-%s-%s' % (print_, cache_key(url, headers))
+
+
+def _makedirs(path):
+    # other threads and processes may create the directory at the same time
+    try:
+        os.makedirs(path)
+    except OSError as error:
+        if error.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
+
+
+def _digest(body):
+    if not isinstance(body, bytes):
+        body = body.encode('utf-8')
+    return hashlib.sha1(body).hexdigest()
+
+
+def _header(headers, name):
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
@@ -0,0 +1,153 @@
+"""
+Columnar export of query results, see :meth:`xml_models.managers.ModelQuery.to_columns`
+"""
+from __future__ import absolute_import
+
+import datetime
+from array import array
+
+try:
+    from sys import intern
+except ImportError:  # Python 2, intern is a builtin
+    pass
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_UTC_EPOCH = None
+
+# rows whose raw values are kept before the converted fields convert them in one batch
+_BATCH_SIZE = 1024
+
+
+def _epoch_micros(value):
+    global _UTC_EPOCH
+    if value.tzinfo is None:
+        delta = value - _EPOCH
+    else:
+        if _UTC_EPOCH is None:
+            from dateutil.tz import tzutc
+
+            _UTC_EPOCH = _EPOCH.replace(tzinfo=tzutc())
+        delta = value - _UTC_EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+class Column(object):
+    """
+    An append-only buffer of the values of one field.
+
+    Values of fields with a ``_typecode`` are packed into an :class:`array.array`, dates as microseconds since the
+    epoch. Strings are interned so that repeated values share storage. A typed column that meets a missing value falls
+    back to a plain list so that ``None`` can be kept.
+    """
+
+    def __init__(self, field):
+        from xml_models.xml_models import DateField
+
+        self.field = field
+        self.typecode = field._typecode
+        self.values = array(self.typecode) if self.typecode else []
+        self._is_date = isinstance(field, DateField)
+
+    def append(self, value):
+        if value is None:
+            if self.typecode:
+                self.values = self.values.tolist()
+                if self._is_date:
+                    self.values = [_from_micros(v) for v in self.values]
+                self.typecode = None
+            self.values.append(None)
+        elif self.typecode:
+            self.values.append(_epoch_micros(value) if self._is_date else value)
+        elif type(value) is str:  # pylint: disable=unidiomatic-typecheck
+            # str subclasses, such as the members of string enums, cannot be interned
+            self.values.append(intern(value))
+        else:
+            self.values.append(value)
+
+    def extend(self, values):
+        if self.typecode and not self._is_date and None not in values:
+            self.values.extend(values)
+        else:
+            for value in values:
+                self.append(value)
+
+    def to_numpy(self):
+        """
+        :return: the column as a numpy array.  Dates become ``datetime64[us]``, untyped columns ``object`` arrays.
+        """
+        numpy = require_numpy()
+        if not self.typecode:
+            result = numpy.empty(len(self.values), dtype=object)
+            result[:] = self.values
+            return result
+        result = numpy.frombuffer(self.values, dtype=numpy.dtype(self.typecode))
+        if self._is_date:
+            return result.view('datetime64[us]')
+        if self.typecode == 'b':
+            return result.view(numpy.bool_)
+        return result
+
+
+def _from_micros(value):
+    return _EPOCH + datetime.timedelta(microseconds=value)
+
+
+def build_columns(model, trees, fields=None):
+    """
+    Read ``fields`` from each of ``trees`` straight into per-field columns, without creating ``model`` instances.
+    Trees may be elements of a larger document, such as the records split out of a response, which are read in place
+    as :meth:`xml_models.xml_models.BaseField.parse_view` reads them.
+
+    :param model: the :class:`xml_models.Model` class describing the fragments
+    :param trees: iterable of :class:`etree.Element`
+    :param fields: names of the fields to export, defaults to all of the model's fields
+    :return: dict of field name to :class:`Column`
+    """
+    names = list(fields) if fields is not None else list(model.xml_fields)
+    unknown = [name for name in names if name not in model._fields]
+    if unknown:
+        raise AttributeError('%s has no fields %s' % (model.__name__, ', '.join(unknown)))
+
+    from xml_models.compiler import _uses_builtin_parse
+    from xml_models.xml_models import BoolField, FloatField, IntField, _local
+
+    columns = [(name, Column(model._fields[name])) for name in names]
+    nsmap = model._nsmap
+    # the raw values of fields with a converter are collected and converted a batch of rows at a time
+    batched = [column for _, column in columns if _uses_builtin_parse(column.field, (IntField, FloatField, BoolField))]
+    parsed = [column for _, column in columns if column not in batched]
+    raw = [[] for _ in batched]
+    previous = getattr(_local, 'view', None)
+    try:
+        for tree in trees:
+            _local.view = tree  # set per row rather than per value, see BaseField.parse_view
+            for column in parsed:
+                column.append(column.field.parse(tree, nsmap))
+            for column, values in zip(batched, raw):
+                values.append(column.field._fetch_by_xpath(tree, nsmap))
+            if batched and len(raw[0]) >= _BATCH_SIZE:
+                _convert(batched, raw)
+    finally:
+        _local.view = previous
+    _convert(batched, raw)
+    return dict(columns)
+
+
+def _convert(columns, raw):
+    for column, values in zip(columns, raw):
+        column.extend(column.field.converter.convert_many(values))
+        del values[:]
+
+
+def require_numpy():
+    """
+    Import numpy, which is only loaded when needed as it is slow to import
+
+    :return: the numpy module
+    :raises ImportError: if numpy is not installed
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('numpy is required for to_numpy()')
+    return numpy
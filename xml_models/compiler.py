@@ -0,0 +1,243 @@
+"""
+Compiles the simple field xpaths of a model into a single extraction plan.
+
+Each field normally evaluates its own xpath from the root of the document, so a model with many fields searches the
+document many times.  Most field xpaths are plain child paths such as ``/Person/address/city`` or
+``/Person/@id``.  These are merged into a trie of tags which is matched in one walk down the tree, visiting only the
+branches some field is interested in.  Anything more complex is left to the field's own xpath.
+
+The same trie is used the other way round by :class:`BuildPlan` to create the elements for a new model's values
+directly.
+"""
+from __future__ import absolute_import
+
+import copy
+import re
+
+from lxml import etree
+
+from xml_models import xpath_finder
+from xml_models.xpath_finder import MultipleNodesReturnedException
+
+_NAME = r'[A-Za-z_][\w.-]*(?::[A-Za-z_][\w.-]*)?'
+_SIMPLE_PATH = re.compile(r'^((?:/%s)+)(?:/@(%s))?$' % (_NAME, _NAME))
+
+_MULTIPLE = object()
+
+
+class _Node(object):
+    def __init__(self):
+        self.children = {}
+        self.element_fields = []  # FieldPlan keeps each field with the function converting its raw value
+        self.attribute_fields = []
+        self.fields = set()  # every field at or below this node
+
+    def is_empty(self):
+        return not (self.children or self.element_fields or self.attribute_fields)
+
+
+class FieldPlan(object):
+    """
+    A one pass extraction plan for the fields of a model.
+
+    Only fields whose ``parse`` is the builtin xpath lookup of one of ``scalar_types`` with a simple absolute path
+    are planned.
+    """
+
+    def __init__(self, fields, namespaces, scalar_types):
+        """
+        :param fields: the model's fields
+        :param namespaces: dict of prefix to namespace URI
+        :param scalar_types: the field classes whose ``parse`` may be replaced by the plan
+        """
+        self.root_tag = None
+        self.root = _Node()
+        self.fields = set()
+        for field in fields:
+            if not _uses_builtin_parse(field, scalar_types):
+                continue
+            match = _SIMPLE_PATH.match(field.xpath)
+            if not match:
+                continue
+            steps = [xpath_finder.clark(step, namespaces) for step in match.group(1).split('/')[1:]]
+            if self.root_tag not in (None, steps[0]):
+                continue  # can never match alongside the planned fields
+            self.root_tag = steps[0]
+
+            node = self.root
+            for step in steps[1:]:
+                node = node.children.setdefault(step, _Node())
+            if match.group(2):
+                attribute = match.group(2)
+                if ':' in attribute:
+                    attribute = xpath_finder.clark(attribute, namespaces)
+                node.attribute_fields.append((attribute, field,
+                                              xpath_finder.converter(xpath_finder.STRING, field.strip)))
+            else:
+                node.element_fields.append((field, xpath_finder.converter(xpath_finder.ELEMENT, field.strip)))
+            self.fields.add(field)
+
+    def __contains__(self, field):
+        return field in self.fields
+
+    def __len__(self):
+        return len(self.fields)
+
+    def extract(self, element):
+        """
+        Find the raw values of all planned fields in one walk of the tree
+
+        :param element: the element matched against the first step of the paths, the root unless the model is a view
+            onto part of a larger document
+        :return: dict of field to raw value.  Fields without a match are missing.
+        """
+        found = {}
+        if element.tag == self.root_tag:
+            _walk(element, self.root, found)
+        return found
+
+    @staticmethod
+    def value(field, found):
+        """
+        Convert the raw value of ``field`` as :meth:`extract` found it
+
+        :param field: a planned field
+        :param found: the result of :meth:`extract`
+        :raises MultipleNodesReturnedException: if the field's xpath matched more than once
+        """
+        raw = found.get(field)
+        if raw is _MULTIPLE:
+            raise MultipleNodesReturnedException
+        return field._to_python(field._or_default(raw))
+
+
+def _walk(element, node, found):
+    for field, convert in node.element_fields:
+        _add(found, field, convert(element))
+    for attribute, field, convert in node.attribute_fields:
+        value = element.get(attribute)
+        if value is not None:
+            _add(found, field, convert(value))
+    if node.children:
+        for child in element:
+            child_node = node.children.get(child.tag)
+            if child_node is not None:
+                _walk(child, child_node, found)
+
+
+def _add(found, field, value):
+    found[field] = _MULTIPLE if field in found else value
+
+
+def _uses_builtin_parse(field, scalar_types):
+    for cls in type(field).__mro__:
+        if 'parse' in cls.__dict__:
+            return cls in scalar_types
+    return False
+
+
+class BuildPlan(object):
+    """
+    Creates the tree for a new model from its field values with one ``SubElement`` per node, rather than locating
+    each field's position with xpath.
+
+    Fields with simple absolute paths are planned.  Values are written as strings, models as their trees and
+    collections as one element per item.
+    """
+
+    def __init__(self, fields, namespaces, collection_type):
+        """
+        :param fields: the model's fields
+        :param namespaces: dict of prefix to namespace URI
+        :param collection_type: the field class whose values are lists of items
+        """
+        self.root_tag = None
+        self.root = _Node()
+        self.fields = set()
+        self.collections = set()
+        for field in fields:
+            match = _SIMPLE_PATH.match(field.xpath)
+            if not match:
+                continue
+            steps = [xpath_finder.clark(step, namespaces) for step in match.group(1).split('/')[1:]]
+            if self.root_tag not in (None, steps[0]):
+                continue
+            is_collection = isinstance(field, collection_type)
+            if is_collection and (match.group(2) or len(steps) < 2):
+                continue  # items need an element of their own below the root
+
+            path = [self.root]
+            for step in steps[1:]:
+                path.append(path[-1].children.get(step) or _Node())
+            node = path[-1]
+            if any(parent in self.collections for parent in path) or (is_collection and not node.is_empty()):
+                continue  # collection items are written whole, nothing else can share their elements
+
+            self.root_tag = steps[0]
+            for parent, step, child in zip(path, steps[1:], path[1:]):
+                parent.children.setdefault(step, child)
+            for parent in path:
+                parent.fields.add(field)
+            if match.group(2):
+                attribute = match.group(2)
+                if ':' in attribute:
+                    attribute = xpath_finder.clark(attribute, namespaces)
+                node.attribute_fields.append((attribute, field))
+            else:
+                node.element_fields.append(field)
+            if is_collection:
+                self.collections.add(node)
+            self.fields.add(field)
+
+    def __contains__(self, field):
+        return field in self.fields
+
+    def build(self, values, nsmap=None):
+        """
+        :param values: dict of field to value.  Fields that are not planned, or whose value is None, are skipped.
+        :param nsmap: namespace declarations for the root element
+        :return: the root element, or None if no field is planned
+        """
+        if self.root_tag is None:
+            return None
+        root = etree.Element(self.root_tag, nsmap=nsmap)
+        self._fill(root, self.root, values)
+        return root
+
+    def _fill(self, element, node, values):
+        for attribute, field in node.attribute_fields:
+            value = values.get(field)
+            if value is not None:
+                element.set(attribute, text(value))
+        for field in node.element_fields:
+            value = values.get(field)
+            if value is not None:
+                element.text = text(value)
+        for tag, child in node.children.items():
+            if child in self.collections:
+                for item in values.get(child.element_fields[0]) or ():
+                    _append(element, tag, item)
+            elif any(values.get(field) is not None for field in child.fields):
+                field_values = [values.get(field) for field in child.element_fields]
+                if len(field_values) == 1 and hasattr(field_values[0], 'to_tree'):
+                    _append(element, tag, field_values[0])  # a nested model
+                else:
+                    self._fill(etree.SubElement(element, tag), child, values)
+
+
+def text(value):
+    """
+    :param value: a field value
+    :return: the string the value is written to XML as.  Enum members, such as those of ``choices``, write their value
+    """
+    return str(getattr(value, 'value', value))
+
+
+def _append(parent, tag, value):
+    if hasattr(value, 'to_tree'):
+        tree = value.to_tree()
+        if tree.getparent() is not None:
+            tree = copy.deepcopy(tree)  # moving it would take it from the tree it is a view onto
+        parent.append(tree)
+    elif value is not None:
+        etree.SubElement(parent, tag).text = text(value)
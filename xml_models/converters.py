@@ -0,0 +1,189 @@
+"""
+Conversion of the raw strings found by :class:`xml_models.IntField`, :class:`xml_models.FloatField` and
+:class:`xml_models.BoolField` into Python values.
+
+Each of these fields has a converter, picked when the field is declared, which decides what happens to values that
+cannot be read with ``on_error``:
+
+``'strict'``
+    raise :class:`ValueError`.  The default for ``IntField`` and ``FloatField``.
+``'coerce'``
+    try a more lenient reading first, such as ``'12.0'`` for an int, ``'3,5'`` for a float or ``'yes'`` for a bool,
+    and raise if that fails too.
+``'default'``
+    return the field's default, so that a bad record does not abort a long batch job.  The default for
+    ``BoolField``, which has always read anything but ``true`` and ``false`` as its default.
+
+.. code-block:: python
+
+    class Reading(xml_models.Model):
+        value = xml_models.FloatField(xpath='/reading/value', on_error='default', default=float('nan'))
+
+    >>> xml_models.converters.report(Reading)  # values that could not be read
+    {'value': 3}
+
+Missing and empty values are the field's default in every mode.  Numbers are read with the builtin ``int`` and
+``float``, which do not depend on the locale.
+
+:meth:`Converter.convert_many` converts a batch of values at once, as
+:meth:`xml_models.managers.ModelQuery.to_columns` does.
+"""
+from __future__ import absolute_import
+
+STRICT = 'strict'
+COERCE = 'coerce'
+DEFAULT = 'default'
+ON_ERROR = (STRICT, COERCE, DEFAULT)
+
+_BOOLEANS = {'true': True, 'false': False, 'True': True, 'False': False, 'TRUE': True, 'FALSE': False}
+_LENIENT_BOOLEANS = {'true': True, 'false': False, 't': True, 'f': False, 'yes': True, 'no': False, 'y': True,
+                     'n': False, 'on': True, 'off': False, '1': True, '0': False}
+
+# what reading a value that is not a string, or not a valid one, raises
+_ERRORS = (ValueError, TypeError, KeyError, AttributeError, OverflowError)
+
+
+class Converter(object):
+    """
+    Converts raw values to one type.
+
+    The common case, a valid string, is handed straight to :meth:`read`.  Anything that makes it fail, from a missing
+    value to an invalid one, is sorted out afterwards.  ``convert`` is the same conversion as a plain function, which
+    is quicker to call than the converter.  ``errors`` counts the values that could not be read, and is
+    approximate when several threads convert at once.
+    """
+
+    #: name of the type in error messages
+    kind = None
+
+    def __init__(self, default=None, on_error=STRICT):
+        """
+        :param default: value of missing and empty values, and of invalid ones with ``on_error='default'``
+        :param on_error: ``'strict'``, ``'coerce'`` or ``'default'``
+        """
+        if on_error not in ON_ERROR:
+            raise ValueError('on_error must be one of %s' % ', '.join(ON_ERROR))
+        self.default = default
+        self.on_error = on_error
+        self.errors = 0
+        read, recover = self.read, self._recover
+
+        def convert(value):
+            try:
+                return read(value)
+            except _ERRORS:
+                return recover(value)
+        self.convert = convert
+
+    def __call__(self, value):
+        """
+        :param value: raw string, None if the value is missing
+        :raises ValueError: if ``value`` cannot be read and ``on_error`` is not ``'default'``
+        """
+        return self.convert(value)
+
+    def convert_many(self, values):
+        """
+        Convert a batch of raw values.  A batch of valid strings is converted in one pass, and is only looked at value
+        by value if one of them cannot be read.
+
+        :param values: list of raw strings
+        :return: list of the converted values
+        :raises ValueError: if a value cannot be read and ``on_error`` is not ``'default'``
+        """
+        try:
+            return list(map(self.read, values))
+        except _ERRORS:
+            return [self.convert(value) for value in values]
+
+    def read(self, value):
+        """
+        :param value: raw string
+        :return: the value, read without any leniency
+        :raises ValueError: or another of the errors of the builtin conversions, if ``value`` is not a valid string
+        """
+        raise NotImplementedError
+
+    def coerce(self, value):
+        """
+        :param value: stripped string that :meth:`read` could not read
+        :return: the value, read leniently
+        :raises ValueError: if it still cannot be read
+        """
+        raise ValueError
+
+    def _recover(self, value):
+        if value is None or value is self.default or value == '':
+            return self.default
+        if self.on_error == COERCE:
+            try:
+                return self.coerce(value.strip())
+            except _ERRORS:
+                pass
+        self.errors += 1
+        if self.on_error == DEFAULT:
+            return self.default
+        raise ValueError('%r is not a valid %s' % (value, self.kind))
+
+
+class IntConverter(Converter):
+    """
+    Reads ints.  Coercing also reads floats with no fractional part, such as ``'12.0'`` and ``'1e3'``.
+    """
+
+    kind = 'int'
+    read = int
+
+    def coerce(self, value):
+        number = float(value)
+        if not number.is_integer():
+            raise ValueError
+        return int(number)
+
+
+class FloatConverter(Converter):
+    """
+    Reads floats.  Coercing also reads a decimal comma, such as ``'3,5'``, when there is no decimal point.
+    """
+
+    kind = 'float'
+    read = float
+
+    def coerce(self, value):
+        if '.' in value or value.count(',') != 1:
+            raise ValueError
+        return float(value.replace(',', '.'))
+
+
+class BoolConverter(Converter):
+    """
+    Reads ``true`` and ``false`` in any case.  Coercing also reads ``t``, ``f``, ``yes``, ``no``, ``y``, ``n``,
+    ``on``, ``off``, ``1`` and ``0`` in any case.
+    """
+
+    kind = 'bool'
+    read = staticmethod(_BOOLEANS.__getitem__)
+
+    def __init__(self, default=None, on_error=DEFAULT):
+        Converter.__init__(self, default, on_error)
+
+    def _recover(self, value):
+        # other spellings of true and false, such as tRUE, are valid but slower to read
+        try:
+            return _BOOLEANS[value.lower()]
+        except _ERRORS:
+            return Converter._recover(self, value)
+
+    def coerce(self, value):
+        return _LENIENT_BOOLEANS[value.lower()]
+
+
+def report(model_class):
+    """
+    How many values each converted field of a model could not read
+
+    :param model_class: :class:`xml_models.Model` class
+    :return: dict of field name to :attr:`Converter.errors`
+    """
+    return dict((name, field.converter.errors) for name, field in model_class._fields.items()
+                if isinstance(getattr(field, 'converter', None), Converter))
@@ -0,0 +1,68 @@
+"""
+Indexes of the records in a collection response, by the value of a model's primary key.
+
+A model that declares a ``primary_key`` field, and caches its responses, gets ``get`` lookups on that field answered
+from an index of the cached collection instead of a scan of every record:
+
+.. code-block:: python
+
+    class Person(xml_models.Model):
+        id = xml_models.IntField(xpath='/Person/@id')
+        ...
+        primary_key = 'id'
+        response_cache = xml_models.MemoryCache(max_age=300)
+        finders = {(): 'http://api/people'}
+
+    >>> Person.objects.get(id=112)  # builds the index of the response in one pass
+    >>> Person.objects.get(id=113)  # a dict lookup
+
+The index of a response is built once per version of the cached body and is replaced as soon as the cache holds a
+different body.
+"""
+from __future__ import absolute_import
+
+from lxml import etree
+
+
+class RecordIndex(object):
+    """
+    The serialized records of one version of a response, by primary key
+    """
+
+    def __init__(self, version):
+        """
+        :param version: the :attr:`xml_models.cache.StoredResponse.version` of the response indexed
+        """
+        self.version = version
+        self._records = {}
+
+    @classmethod
+    def build(cls, version, records, field, namespaces):
+        """
+        :param version: the version of the response
+        :param records: the record elements of the response, in one pass
+        :param field: the primary key field
+        :param namespaces: dict of prefix to namespace URI
+        :return: :class:`RecordIndex`
+        """
+        index = cls(version)
+        for record in records:
+            index.add(field.parse_view(record, namespaces), etree.tostring(record))
+        return index
+
+    def __len__(self):
+        return len(self._records)
+
+    def add(self, key, record):
+        """
+        :param key: primary key value
+        :param record: serialized record
+        """
+        self._records.setdefault(key, []).append(record)
+
+    def get(self, key):
+        """
+        :param key: primary key value
+        :return: list of the records with the key, empty if there are none
+        """
+        return self._records.get(key, [])
@@ -1,12 +1,28 @@
 from __future__ import absolute_import
+import copy
+import datetime
+import collections
+import heapq
+import itertools
+import operator
 import xml_models
 import xml_models.rest_client as rest_client
+from xml_models.cache import cache_key
+from xml_models.columns import build_columns, require_numpy
+from xml_models import pipeline, sync
+from xml_models.index import RecordIndex
+from xml_models.singleflight import SingleFlight
 from lxml import etree
+from xml_models import xpath_finder
 from xml_models.xpath_finder import MultipleNodesReturnedException
 try:
     from StringIO import StringIO
 except ImportError:
     from io import BytesIO as StringIO
+try:
+    from urllib import quote
+except ImportError:
+    from urllib.parse import quote
 
 
 class ModelManager(object):
@@ -22,6 +38,7 @@ class ModelManager(object):
         self.model = model
         self.finders = {}
         self.headers = {}
+        self.writers = {}
         for key in finders.keys():
             field_names = [field if isinstance(field, str) else field._name for field in key]
             sorted_field_names = list(field_names)
@@ -79,6 +96,21 @@ class ModelManager(object):
         """
         return ModelQuery(self, self.model, headers=self.headers).count()
 
+    def deadline(self, seconds):
+        """
+        Limit how long the query may spend fetching, including any retries.
+
+        :Example:
+
+        .. code-block:: python
+
+            Model.objects.deadline(1.5).get(id=3)
+
+        :param seconds: time allowed for the HTTP requests
+        :return: lazy query
+        """
+        return ModelQuery(self, self.model, headers=self.headers).deadline(seconds)
+
     def get(self, **kw):
         """
         Get a single object.
@@ -90,6 +122,114 @@ class ModelManager(object):
         """
         return ModelQuery(self, self.model, headers=self.headers).get(**kw)
 
+    def bulk_create(self, models, batch_size=None, concurrency=None):
+        """
+        Send new models to the API using the model's ``create`` writer.
+
+        :Example:
+
+        .. code-block:: python
+
+            results = Model.objects.bulk_create(models, batch_size=500)
+
+        :param models: iterable of models
+        :param batch_size: overrides the writer's batch size
+        :param concurrency: overrides the number of requests the writer has in flight at once
+        :return: list of :class:`xml_models.WriteResult`, one per model
+        :raises NoRegisteredWriterError: if the model has no ``create`` writer
+        """
+        return self._write('create', models, batch_size, concurrency)
+
+    def bulk_update(self, models, batch_size=None, concurrency=None):
+        """
+        Send changed models to the API using the model's ``update`` writer.
+
+        :param models: iterable of models
+        :param batch_size: overrides the writer's batch size
+        :param concurrency: overrides the number of requests the writer has in flight at once
+        :return: list of :class:`xml_models.WriteResult`, one per model
+        :raises NoRegisteredWriterError: if the model has no ``update`` writer
+        """
+        return self._write('update', models, batch_size, concurrency)
+
+    def refresh(self, collection=None, full=False):
+        """
+        Bring a local copy of the model's collection up to date.
+
+        :Example:
+
+        .. code-block:: python
+
+            people = Person.objects.refresh()
+            ...
+            people = Person.objects.refresh(people)
+
+        The first refresh fetches the whole collection from the finder that takes no arguments.  Later refreshes
+        fetch the records changed since the previous refresh from the model's ``delta_finder``, a URL completed with
+        the time of the previous refresh formatted with ``delta_format``.  Models without a ``delta_finder`` fetch the
+        whole collection again with ``If-Modified-Since``.  Either way only records that have changed are re-parsed.
+
+        :param collection: :class:`xml_models.sync.LocalCollection` from an earlier refresh, or None to start one
+        :param full: fetch the whole collection even if a delta could be fetched
+        :return: the updated :class:`xml_models.sync.LocalCollection`
+        :raises AttributeError: if the model has no ``primary_key``
+        """
+        if collection is None:
+            collection = sync.LocalCollection(self.model)
+        query = ModelQuery(self, self.model, headers=self.headers)
+        headers = dict(self.headers)
+        delta_finder = getattr(self.model, 'delta_finder', None)
+        complete = full or collection.synced_at is None or not delta_finder
+        if complete:
+            url = query._find_query_path()
+            if collection.last_modified and not full:
+                headers['If-Modified-Since'] = collection.last_modified
+        else:
+            since = collection.synced_at.strftime(getattr(self.model, 'delta_format', sync.DELTA_FORMAT))
+            url = delta_finder % quote(since)
+
+        started = datetime.datetime.utcnow()
+        response = query._client().GET(url, headers=headers)
+        if response.response_code == 304:
+            collection.merge((), complete=False)
+        else:
+            response.expect(200)
+            body = query._body(response)
+            records = query._split(body) if body else ()
+            collection.merge(records, complete)
+            if complete:
+                headers = dict((name.lower(), value) for name, value in response.headers.items())
+                collection.last_modified = headers.get('last-modified')
+        # the time the request was sent, so that changes made while it was answered are fetched by the next delta
+        collection.synced_at = started
+        return collection
+
+    def _write(self, operation, models, batch_size, concurrency):
+        if operation not in self.writers:
+            raise NoRegisteredWriterError(operation)
+        transport = getattr(self.model, 'http_transport', None)
+        pooled = None
+        if transport is None:
+            import requests
+
+            # share connections between the requests of this write, the default transport would open one each.  A
+            # requests session is not safe to share between the writer's threads, so each thread has its own
+            transport = pooled = rest_client.RequestsTransport(session_factory=requests.Session)
+        headers = dict(self.headers)
+        headers.setdefault('Content-Type', 'application/xml')
+        try:
+            return self.writers[operation].write(self.model, models, _client(self.model, transport=transport),
+                                                 headers, batch_size, concurrency)
+        finally:
+            if pooled is not None:
+                pooled.close()
+
+
+_in_flight = SingleFlight()
+
+# the order key of the (order key, fragment) pairs of ordered records
+_order = operator.itemgetter(0)
+
 
 # this is an internal class and should not be exposed to end users so we don't need docstrings
 # pylint: disable=missing-docstring
@@ -98,119 +238,609 @@ class ModelQuery(object):
         self.manager = manager
         self.model = model
         self.args = {}
-        self.headers = headers or {}
+        self.headers = dict(headers or {})  # a copy, so that changing the manager's headers leaves queries alone
         self.custom_url = None
+        self.hydration = None
+        self.only_fields = None
+        self.deferred_fields = []
+        self.excludes = []
+        self.ordering = []
+        self.deadline_seconds = None
+        self.streaming = None
+        self.buffer = None
+        self.workers = None
+        self.chunk_size = None
+        # read once, so that the query's requests do not depend on a global changed while they are made
+        self.verify = getattr(model, 'verify_ssl', xml_models.VERIFY)
 
 
         # When calling list(query) list will call __count__ before __iter__, both of which will call _fetch &
         # _fragments. We keep a cache of fetched URLs and parsed out fragments so as to prevent fetching and parsing
-        # the tree twice.
+        # the tree twice.  The cache holds the fragments of the records the query selects, so it is dropped whenever
+        # the selection changes.
         self.__fragment_cache = []
         self.__fetch_cache = {}
+        self.__shared_fragments = ()
 
     def filter(self, **kw):
         for key in kw.keys():
             self.args[key] = kw[key]
+        self.__fragment_cache = []
+        return self
+
+    def deadline(self, seconds):
+        self.deadline_seconds = seconds
+        return self
+
+    def exclude(self, **kw):
+        self._lookups(kw)  # fail early on unknown fields
+        self.excludes.append(kw)
+        self.__fragment_cache = []
+        return self
+
+    def order_by(self, *fields):
+        self._check_fields([name.lstrip('-') for name in fields])
+        self.ordering = list(fields)
+        self.__fragment_cache = []
         return self
 
     def filter_custom(self, url):
         self.custom_url = url
         return self
 
+    def stream(self, high_watermark=1000, low_watermark=None, window=0):
+        self.streaming = {'high_watermark': high_watermark, 'low_watermark': low_watermark, 'window': window}
+        self.__fragment_cache = []
+        return self
+
+    def threaded(self, workers=None, chunk_size=64):
+        if not workers:
+            import multiprocessing  # slow to import, and only needed for the number of cores
+            workers = multiprocessing.cpu_count()
+        self.workers = workers
+        self.chunk_size = chunk_size
+        return self
+
+    def hydrate(self, mode):
+        if mode not in xml_models.HYDRATION_MODES:
+            raise ValueError('Unknown hydration mode %s' % mode)
+        self.hydration = mode
+        return self
+
+    def only(self, *fields):
+        self._check_fields(fields)
+        self.only_fields = list(fields)
+        return self
+
+    def defer(self, *fields):
+        self._check_fields(fields)
+        self.deferred_fields.extend(fields)
+        return self
+
+    def _check_fields(self, fields):
+        unknown = [name for name in fields if name not in self.model._fields]
+        if unknown:
+            raise AttributeError('%s has no fields %s' % (self.model.__name__, ', '.join(unknown)))
+
+    def _create(self, record, validated=True, hydration=None):
+        hydration = hydration or self.hydration
+        fields = None
+        if self.only_fields is not None or self.deferred_fields:
+            fields = [name for name in self.only_fields or self.model.xml_fields if name not in self.deferred_fields]
+            if hydration is None and self.model.hydration == xml_models.LAZY:
+                hydration = xml_models.EAGER  # only() and defer() name the fields to load up front, like Django
+        # records are checked against any schema as they are split out of the response
+        if isinstance(record, etree._Element):
+            return self.model(dom=record, hydration=hydration, fields=fields, validated=validated)
+        return self.model(record, hydration=hydration, fields=fields, validated=validated)
+
     def count(self):
-        response = self._fetch()
-        return len(list(self._fragments(response.content)))
+        return sum(1 for _ in self._records())
 
     def __iter__(self):
-        response = self._fetch()
-        for fragment in self._fragments(response.content):
-            yield self.model(fragment)
+        return self._hydrated(self._records())
 
     def __len__(self):
+        if self.streaming is not None:
+            # list() asks for the length first, which would fetch a streamed response once more
+            raise TypeError('Streamed queries have no length, use count()')
         return self.count()
 
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if (index.start or 0) < 0 or (index.stop or 0) < 0:
+                raise ValueError('Negative indexing is not supported')
+            if self.ordering and index.stop is not None:
+                # only the first `stop` records are needed, so keep a bounded heap rather than sorting everything
+                records = itertools.islice(self._records(limit=index.stop), index.start, None, index.step)
+            else:
+                records = itertools.islice(self._records(), index.start, index.stop, index.step)
+            return list(self._hydrated(records))
+        if index < 0:
+            raise ValueError('Negative indexing is not supported')
+        results = self[index:index + 1]
+        if not results:
+            raise IndexError('query index out of range')
+        return results[0]
+
+    def _records(self, limit=None):
+        # Records are xml fragments, in order.  Filters and order keys are evaluated with the fields' compiled xpaths on
+        # the elements as they are split out of the response, so that only the records kept are serialized and only
+        # matching records get hydrated.  With `limit`, only the first `limit` records in order are wanted, which a
+        # bounded heap finds without sorting everything
+        if self.__fragment_cache:
+            return iter(self.__fragment_cache if limit is None else self.__fragment_cache[:limit])
+        keyed = bool(self.ordering)
+        if self.streaming is None:
+            records = self._fragments(self._body(self._fetch()), keyed)
+        elif keyed and limit is None:
+            raise ValueError('Streamed queries cannot be ordered, as ordering needs every record at once')
+        else:
+            records = self._stream(keyed)
+        if not keyed:
+            return records
+        if limit is not None:
+            return (fragment for _, fragment in heapq.nsmallest(limit, records, key=_order))
+        fragments = [fragment for _, fragment in sorted(records, key=_order)]
+        if self.streaming is None and self._keeps_fragments():
+            self.__fragment_cache = fragments
+        return iter(fragments)
+
+    def _selected(self, elements, keyed=False):
+        # the fragments of the elements the query's filters match, as (order key, fragment) pairs if `keyed`
+        if not keyed and not self._predicates():
+            for element in elements:
+                yield etree.tostring(element)
+            return
+        for record in self._matching(elements):
+            fragment = etree.tostring(record)
+            yield (self._order_key(record), fragment) if keyed else fragment
+
+    def _matching(self, elements):
+        # the elements the query's filters match.  Models whose xpaths cannot all be evaluated from an element of a
+        # larger document read a copy of it instead
+        predicates = self._predicates()
+        views = self.model._views
+        for element in elements:
+            record = element if views else copy.deepcopy(element)
+            if all(predicate(record) for predicate in predicates):
+                yield record
+
+    def _hydrated(self, records):
+        if self.workers is None:
+            return (self._create(record) for record in records)
+        return self._hydrated_threaded(records)
+
+    def _hydrated_threaded(self, records):
+        # chunks of records are created and hydrated on a pool of threads, a few chunks ahead of the consumer, and
+        # handed back in order.  Records are read on this thread, so only model creation is spread across the pool
+        from concurrent.futures import ThreadPoolExecutor
+
+        hydration = self.hydration or xml_models.EAGER  # lazy models would only be parsed back on this thread
+        create = lambda chunk: [self._create(record, hydration=hydration) for record in chunk]
+        records = iter(records)
+        chunks = iter(lambda: list(itertools.islice(records, self.chunk_size)), [])
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        pending = collections.deque()
+        try:
+            for chunk in chunks:
+                pending.append(pool.submit(create, chunk))
+                if len(pending) > 2 * self.workers:
+                    for model in pending.popleft().result():
+                        yield model
+            while pending:
+                for model in pending.popleft().result():
+                    yield model
+        finally:
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=True)
+
+    def _predicates(self):
+        client_args = self._client_args()
+        predicates = [self._matcher(self._lookups(client_args))] if client_args else []
+        for exclude in self.excludes:
+            matcher = self._matcher(self._lookups(exclude))
+            predicates.append(lambda tree, matcher=matcher: not matcher(tree))
+        return predicates
+
+    def _matcher(self, lookups):
+        nsmap = self.model._nsmap
+
+        def matches(tree):
+            for field, test, value in lookups:
+                if not test(field.parse_view(tree, nsmap), value):
+                    return False
+            return True
+        return matches
+
+    def _lookups(self, kw):
+        lookups = []
+        for key, value in kw.items():
+            name, _, lookup = key.partition('__')
+            lookup = lookup or 'exact'
+            self._check_fields([name])
+            if lookup not in LOOKUPS:
+                raise ValueError('Unsupported lookup %s' % key)
+            field = self.model._fields[name]
+            if lookup == 'in':
+                value = [_to_python(field, item) for item in value]
+            elif lookup not in ('isnull', 'contains', 'startswith'):
+                value = _to_python(field, value)
+            lookups.append((field, LOOKUPS[lookup], value))
+        return lookups
+
+    def _order_key(self, tree):
+        key = []
+        for name in self.ordering:
+            field = self.model._fields[name.lstrip('-')]
+            value = field.parse_view(tree, self.model._nsmap)
+            if value is None:
+                key.append((1,))  # missing values sort last
+            else:
+                key.append((0, _Descending(value) if name.startswith('-') else value))
+        return key
+
+    def to_columns(self, fields=None):
+        columns = build_columns(self.model, self._trees(), fields)
+        return dict((name, column.values) for name, column in columns.items())
+
+    def to_numpy(self, fields=None):
+        require_numpy()
+        columns = build_columns(self.model, self._trees(), fields)
+        return dict((name, column.to_numpy()) for name, column in columns.items())
+
+    def _trees(self):
+        # the same records as iterating the query gives, filtered, ordered or streamed alike.  They are read in place
+        # as they are split out of the response, and only ordered records are copied out of it.  Streamed records, and
+        # records the query has already kept, are parsed from their fragments
+        if self.streaming is not None or self.__fragment_cache:
+            return (etree.fromstring(fragment) for fragment in self._records())
+        xml = self._body(self._fetch())
+        shared = self.__shared_fragments
+        records = self._matching((etree.fromstring(fragment) for fragment in shared) if shared else self._split(xml))
+        if not self.ordering:
+            return records
+        # split elements are released once the next one is read, so those kept for sorting are copies
+        keep = copy.deepcopy if self.model._views else (lambda record: record)
+        return (record for _, record in sorted(((self._order_key(record), keep(record)) for record in records),
+                                               key=_order))
+
     def get(self, **kw):
         for key in kw.keys():
             self.args[key] = kw[key]
+        self.__fragment_cache = []
+        if self._predicates():
+            results = self._indexed()
+            if results is None:
+                results = list(itertools.islice(self._records(), 2))
+            if not results:
+                raise DoesNotExist(self.model, self.args)
+            if len(results) > 1:
+                raise MultipleNodesReturnedException
+            return self._create(results[0])
+
+        # models whose record is the whole response can be shared between processes as snapshots
+        model_cache = getattr(self.model, 'model_cache', None)
+        if model_cache is not None:
+            url = self._find_query_path()
+            model = model_cache.load_model(self.model, url, self.headers)
+            if model is None:
+                model = self._get_from_response()
+                model_cache.store_model(model, url, self.headers)
+            return model
+        return self._get_from_response()
+
+    def _indexed(self):
+        # a lookup on the primary key alone is answered from an index of the cached response, if there is one
+        name = getattr(self.model, 'primary_key', None)
+        client_args = self._client_args()
+        if name is None or self.excludes or len(client_args) != 1:
+            return None
+        arg, value = list(client_args.items())[0]
+        if arg not in (name, name + '__exact'):
+            return None
         response = self._fetch()
-        if not response.content or response.response_code == 404:
-            raise DoesNotExist(self.model, self.args)
-
-        if not response.content:
+        version = getattr(response, 'version', None)
+        if version is None:
+            return None
+        # indexes are kept by the cache, so that they go with it
+        cache = self.model.response_cache
+        key = (self.model, cache_key(self._find_query_path(), self.headers))
+        index = cache.get_index(key)
+        if index is None or index.version != version:
+            field = self.model._fields[name]
+            build = lambda: RecordIndex.build(version, self._split(self._body(response)), field, self.model._nsmap)
+            # concurrent queries share one build of the index
+            index = _in_flight.do(('index', id(cache)) + key + (version,), build)
+            cache.set_index(key, index)
+        return index.get(_to_python(self.model._fields[name], value))[:2]
+
+    def _get_from_response(self):
+        response = self._fetch(split=False)
+        body = self._body(response)
+        if not body or response.response_code == 404:
             raise DoesNotExist(self.model, self.args)
 
-        content = response.content
-
         node_to_find = getattr(self.model, 'collection_node', None)
         if node_to_find:
-            tree = etree.fromstring(content)
-            node = tree.find('.//' + node_to_find).getchildren()
+            tree = etree.parse(self._source(body)).getroot()
+            node = next(tree.iter(xpath_finder.clark(node_to_find, self.model._nsmap))).getchildren()
             if len(node) > 1:
                 raise MultipleNodesReturnedException
-            content = etree.tostring(node[0])
+            return self._create(etree.tostring(node[0]), validated=False)
 
-        return self.model(content)
+        if hasattr(body, 'read'):
+            # a memory mapped body is parsed in place rather than read into a string first
+            return self._create(etree.parse(body).getroot(), validated=False)
+        return self._create(body, validated=False)
 
-    def _fetch(self):
-        # the caching here may be better handled with requests caching?
+    def _fetch(self, split=True):
+        # the caching here may be better handled with requests caching?  `split` is False for responses that are a
+        # single record rather than a collection, which are not split out into fragments
         url = self._find_query_path()
         if not url in self.__fetch_cache:
-            self.__fetch_cache[url] = rest_client.Client("", verify=xml_models.VERIFY).GET(url, headers=self.headers)
+            if not getattr(self.model, 'coalesce_requests', False):
+                self.__fetch_cache[url] = self._request(url)
+            elif split and getattr(self.model, 'coalesce_parsing', False):
+                # concurrent queries for the same model and URL share the response and the split out fragments
+                key = (self.model, url, tuple(sorted(self.headers.items())))
+                response, self.__shared_fragments = _in_flight.do(key, lambda: self._request_fragments(url))
+                self.__fetch_cache[url] = response
+            else:
+                key = (url, tuple(sorted(self.headers.items())))
+                self.__fetch_cache[url] = _in_flight.do(key, lambda: self._request(url))
         return self.__fetch_cache[url]
 
-    def _fragments(self, xml):
-        if len(self.__fragment_cache):
-            for item in self.__fragment_cache:
-                yield item
+    def _request(self, url):
+        client = self._client()
+        cache = getattr(self.model, 'response_cache', None)
+        if cache is None:
+            return client.GET(url, headers=self.headers)
+        return cache.fetch(client, url, self.headers)
+
+    def _request_fragments(self, url):
+        response = self._request(url)
+        try:
+            # every record, as the queries sharing them may each filter them differently
+            fragments = tuple(etree.tostring(record) for record in self._split(self._body(response)))
+        except (DoesNotExist, etree.XMLSyntaxError):
+            fragments = ()
+        return response, fragments
+
+    def _client(self):
+        deadline = rest_client.Deadline(self.deadline_seconds) if self.deadline_seconds is not None else None
+        return _client(self.model, deadline=deadline, transport=getattr(self.model, 'http_transport', None),
+                       verify=self.verify)
+
+    @staticmethod
+    def _body(response):
+        # cached responses can be parsed straight from a memory map rather than a string copy of the body
+        if hasattr(response, 'open'):
+            return response.open()
+        return response.content
+
+    @staticmethod
+    def _source(xml):
+        if hasattr(xml, 'read'):
+            return xml
+        if not isinstance(xml, bytes):
+            xml = xml.encode()
+        return StringIO(xml)
+
+    def _fragments(self, xml, keyed=False):
+        # fragments split out with iterparse are kept for __len__ and re-iteration, once all of them have been split.
+        # Ordered fragments are kept once they have been sorted
+        shared = self.__shared_fragments
+        if shared and not keyed and not self._predicates():
+            records = iter(shared)
+        else:
+            elements = (etree.fromstring(fragment) for fragment in shared) if shared else self._split(xml)
+            records = self._selected(elements, keyed)
+        if keyed:
+            for record in records:
+                yield record
             return
 
+        keep = self._keeps_fragments()
+        kept = []
+        for record in records:
+            if keep:
+                kept.append(record)
+            yield record
+        self.__fragment_cache = kept
+
+    def _keeps_fragments(self):
+        return not (getattr(self.model, 'collection_node', None) or getattr(self.model, 'collection_xpath', None))
+
+    def _stream(self, keyed=False):
+        # fragments are split out and filtered on a producer thread, which waits whenever the consumer falls behind by
+        # the high watermark.  Only queries with no more than `window` results keep them for iterating again
+        buffer = self.buffer = pipeline.BoundedBuffer(self.streaming['high_watermark'], self.streaming['low_watermark'])
+        url = self._find_query_path()
+
+        def fragments():
+            response = self._request(url)
+            for record in self._selected(self._split(self._body(response), streaming=True), keyed):
+                yield record
+
+        pipeline.produce(fragments(), buffer)
+        window = self.streaming['window']
+        kept = None if keyed else []
+        try:
+            for fragment in buffer:
+                if kept is not None:
+                    kept.append(fragment)
+                    if len(kept) > window:
+                        kept = None
+                yield fragment
+        finally:
+            buffer.cancel()
+        if kept:
+            self.__fragment_cache = kept
+
+    def _split(self, xml, streaming=False):
+        # the valid record elements of a response, in one pass.  Each element is only complete until the next is
+        # asked for.  Streaming splits hold no more of the document than the record being read, except with a
+        # collection_xpath, which needs the whole tree
         if not xml:
             raise DoesNotExist(self.model, self.args)
 
+        schema = getattr(self.model, 'schema', None)
         xpath_to_find = getattr(self.model, 'collection_xpath', None)
         node_to_find = getattr(self.model, 'collection_node', None)
-        if node_to_find:
-            xpath_to_find = '//' + node_to_find
-        if xpath_to_find:
-            tree = etree.parse(StringIO(xml.encode()))
-            for node in tree.xpath(xpath_to_find):
-                if node.getchildren():
-                    for n in node.getchildren():
-                        yield etree.tostring(n)
-                else:
-                    yield etree.tostring(node)
+        if node_to_find and streaming:
+            for record in _iter_collection(self._source(xml), xpath_finder.clark(node_to_find, self.model._nsmap)):
+                if schema is None or schema.accepts(record):
+                    yield record
+                _release(record)
+            return
+        if node_to_find or xpath_to_find:
+            tree = etree.parse(self._source(xml))
+            if node_to_find:
+                # a plain tag comparison is much cheaper than evaluating '//' + node_to_find
+                nodes = tree.iter(xpath_finder.clark(node_to_find, self.model._nsmap))
+            else:
+                nodes = xpath_finder.compile_xpath(xpath_to_find, self.model._nsmap)(tree)
+            for node in nodes:
+                for record in node.getchildren() or [node]:
+                    if schema is None or schema.accepts(record):
+                        yield record
             return
 
         # no collection node/xpath
-        tree = etree.iterparse(StringIO(xml.encode()), ['start', 'end'])
-        _, child = next(tree)  # assume there is a wrapper tag
-        _, child = next(tree)  # this is the tag we care about
+        tree = etree.iterparse(self._source(xml), ['start', 'end'])
+        try:
+            _, child = next(tree)  # assume there is a wrapper tag
+            _, child = next(tree)  # this is the tag we care about
+        except StopIteration:
+            return  # an empty collection
         node_name = child.tag
         for event, elem in tree:
             if event == 'end' and elem.tag == node_name:
-                result = etree.tostring(elem)
-                elem.clear()
-                self.__fragment_cache.append(result)
-                yield result
+                if schema is None or schema.accepts(elem):
+                    yield elem
+                _release(elem)
 
     def _find_query_path(self):
         if self.custom_url:
             return self.custom_url
 
-        keys = self.args.keys()
-        keys = sorted(keys)
-        key_tuple = tuple(keys)
-        try:
-            (url, attrs) = self.manager.finders[key_tuple]
-            return url % tuple([self.args[x] for x in attrs])
-        except KeyError:
-            raise NoRegisteredFinderError(str(key_tuple))
+        (url, attrs) = self.manager.finders[self._finder_key()]
+        return url % tuple([self.args[x] for x in attrs])
+
+    def _finder_key(self):
+        key_tuple = tuple(sorted(self.args.keys()))
+        if key_tuple in self.manager.finders:
+            return key_tuple
+
+        # fall back to the most specific finder that covers some of the arguments, as long as the rest can be
+        # filtered on client side
+        candidates = [key for key in self.manager.finders if set(key) <= set(key_tuple)]
+        for key in sorted(candidates, key=len, reverse=True):
+            remaining = set(key_tuple) - set(key)
+            if all(arg.partition('__')[0] in self.model._fields for arg in remaining):
+                return key
+        raise NoRegisteredFinderError(str(key_tuple))
+
+    def _client_args(self):
+        if self.custom_url:
+            finder_args = ()
+        else:
+            finder_args = self._finder_key()
+        return dict((key, value) for key, value in self.args.items()
+                    if key not in finder_args and key.partition('__')[0] in self.model._fields)
+
+
+def _iter_collection(source, tag):
+    # iterparse the children of every `tag` element, or the element itself if it has none, as ModelQuery._split does
+    # with a whole tree
+    depth = 0
+    collection_depth = None
+    found = False
+    for event, elem in etree.iterparse(source, ('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if collection_depth is None and elem.tag == tag:
+                collection_depth, found = depth, False
+            continue
+        if collection_depth is not None:
+            if depth == collection_depth + 1:
+                found = True
+                yield elem
+            elif depth == collection_depth:
+                if not found:
+                    yield elem
+                collection_depth = None
+        depth -= 1
+
+
+def _release(elem):
+    # cleared elements are still children of their parent, so drop those already read as well
+    elem.clear()
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
+def _client(model, deadline=None, transport=None, verify=None):
+    if verify is None:
+        verify = getattr(model, 'verify_ssl', xml_models.VERIFY)
+    return rest_client.Client("", verify=verify,
+                              timeout=getattr(model, 'request_timeout', None),
+                              retry=getattr(model, 'retry_policy', None),
+                              circuit_breakers=getattr(model, 'circuit_breakers', None),
+                              deadline=deadline,
+                              transport=transport)
+
+
+class _Descending(object):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def _to_python(field, value):
+    if hasattr(field, '_to_python') and isinstance(value, str):
+        return field._to_python(value)
+    return value
+
+
+def _compare(test):
+    def compare(value, other):
+        return value is not None and test(value, other)
+    return compare
+
+
+LOOKUPS = {
+    'exact': operator.eq,
+    'in': lambda value, other: value in other,
+    'gt': _compare(operator.gt),
+    'gte': _compare(operator.ge),
+    'lt': _compare(operator.lt),
+    'lte': _compare(operator.le),
+    'contains': _compare(lambda value, other: other in value),
+    'startswith': _compare(lambda value, other: value.startswith(other)),
+    'isnull': lambda value, other: (value is None) == other,
+}
 
 
 class NoRegisteredFinderError(Exception):
     pass
 
 
+class NoRegisteredWriterError(Exception):
+    pass
+
+
 class ValidationError(Exception):
     pass
 
@@ -0,0 +1,120 @@
+"""
+A bounded hand-off between a producer thread and a consumer, used to stream the results of a query with flat memory.
+
+The producer stops once ``high_watermark`` items are waiting and only carries on when the consumer has brought them
+down to ``low_watermark``, so that it works in bursts rather than waking up for every item taken.
+"""
+from __future__ import absolute_import
+
+import collections
+import threading
+
+
+class BoundedBuffer(object):
+    """
+    A queue between one producer and one consumer.
+
+    ``pauses`` counts the times the producer was stopped at the high watermark, and ``peak`` is the most items that
+    were ever waiting.
+    """
+
+    def __init__(self, high_watermark, low_watermark=None):
+        """
+        :param high_watermark: most items waiting before the producer is stopped
+        :param low_watermark: items waiting when the producer is started again, half the high watermark by default
+        """
+        if high_watermark < 1:
+            raise ValueError('high_watermark must be at least 1')
+        if low_watermark is None:
+            low_watermark = high_watermark // 2
+        if not 0 <= low_watermark < high_watermark:
+            raise ValueError('low_watermark must be at least 0 and below high_watermark')
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.pauses = 0
+        self.peak = 0
+        self._items = collections.deque()
+        self._condition = threading.Condition()
+        self._paused = False
+        self._closed = False
+        self._cancelled = False
+        self._error = None
+
+    def put(self, item):
+        """
+        Add an item, waiting while the buffer is over its low watermark after reaching the high one
+
+        :param item: the item
+        :return: False if the consumer has gone away and the producer should stop
+        """
+        with self._condition:
+            if len(self._items) >= self.high_watermark:
+                self.pauses += 1
+                self._paused = True
+                while len(self._items) > self.low_watermark and not self._cancelled:
+                    self._condition.wait()
+                self._paused = False
+            if self._cancelled:
+                return False
+            self._items.append(item)
+            self.peak = max(self.peak, len(self._items))
+            self._condition.notify()
+            return True
+
+    def close(self, error=None):
+        """
+        Mark the end of the items
+
+        :param error: exception raised by the producer, raised to the consumer once the items before it are taken
+        """
+        with self._condition:
+            self._closed = True
+            self._error = error
+            self._condition.notify()
+
+    def cancel(self):
+        """
+        Drop the waiting items and stop the producer
+        """
+        with self._condition:
+            self._cancelled = True
+            self._items.clear()
+            self._condition.notify()
+
+    def __iter__(self):
+        while True:
+            with self._condition:
+                while not self._items and not self._closed:
+                    self._condition.wait()
+                if not self._items:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                item = self._items.popleft()
+                if self._paused and len(self._items) <= self.low_watermark:
+                    self._condition.notify()
+            yield item
+
+
+def produce(items, buffer):
+    """
+    Feed ``items`` into ``buffer`` from a daemon thread
+
+    :param items: iterable, consumed on the thread
+    :param buffer: :class:`BoundedBuffer`
+    :return: the started :class:`threading.Thread`
+    """
+    def run():
+        try:
+            for item in items:
+                if not buffer.put(item):
+                    break
+        except Exception as error:  # pylint: disable=broad-except
+            buffer.close(error)
+        else:
+            buffer.close()
+
+    thread = threading.Thread(target=run, name='xml_models-producer')
+    thread.daemon = True
+    thread.start()
+    return thread
@@ -1,3 +1,6 @@
 from .rest_client import Client, Response
+from .policies import RetryPolicy, CircuitBreaker, CircuitBreakers, CircuitOpenError, Deadline, DeadlineExceeded
+from .transports import Transport, RequestsTransport, HttpxTransport
 
-__all__=['Client', 'Response']
\ No newline at end of file
+__all__=['Client', 'Response', 'RetryPolicy', 'CircuitBreaker', 'CircuitBreakers', 'CircuitOpenError', 'Deadline',
+         'DeadlineExceeded', 'Transport', 'RequestsTransport', 'HttpxTransport']
\ No newline at end of file
@@ -0,0 +1,164 @@
+"""
+Timeouts, retries and circuit breaking for :class:`xml_models.rest_client.Client`
+"""
+import random
+import threading
+import time
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of making a request to a host whose circuit breaker is open
+    """
+    pass
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a request cannot complete before its deadline
+    """
+    pass
+
+
+class Deadline(object):
+    """
+    A point in time by which a call, including all of its retries, must complete
+    """
+
+    def __init__(self, seconds):
+        """
+        :param seconds: time allowed from now
+        """
+        self.expires_at = time.time() + seconds
+
+    def remaining(self):
+        """
+        :return: seconds left, never negative
+        """
+        return max(0.0, self.expires_at - time.time())
+
+    def limit(self, timeout):
+        """
+        Shorten ``timeout`` so that it ends by the deadline
+
+        :param timeout: None, seconds, or a ``(connect, read)`` tuple as accepted by requests
+        :raises DeadlineExceeded: if the deadline has already passed
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded('Deadline exceeded')
+        if timeout is None:
+            return remaining
+        if isinstance(timeout, tuple):
+            return tuple(remaining if part is None else min(part, remaining) for part in timeout)
+        return min(timeout, remaining)
+
+
+class RetryPolicy(object):
+    """
+    Retry failed requests with jittered exponential backoff.
+
+    Only idempotent methods are retried.  A request is retried when it could not connect, timed out, or the server
+    answered with one of ``retry_on``.  Each retry waits a random time between zero and ``backoff * 2 ** attempt``
+    seconds, capped at ``max_backoff``.
+    """
+
+    IDEMPOTENT_METHODS = ('get', 'head', 'options', 'put', 'delete')
+
+    def __init__(self, retries=3, backoff=0.1, max_backoff=10.0, retry_on=(502, 503, 504)):
+        """
+        :param retries: number of retries after the first attempt
+        :param backoff: base backoff in seconds
+        :param max_backoff: longest wait between attempts in seconds
+        :param retry_on: response codes to retry
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_on = retry_on
+
+    def can_retry(self, method, attempt):
+        """
+        :param method: lower case HTTP method
+        :param attempt: number of attempts made so far
+        """
+        return method in self.IDEMPOTENT_METHODS and attempt <= self.retries
+
+    def delay(self, attempt):
+        """
+        :param attempt: number of attempts made so far
+        :return: seconds to wait before the next attempt
+        """
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker(object):
+    """
+    Stops calling a failing host for a while.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and requests fail fast with
+    :class:`CircuitOpenError`.  Once ``reset_timeout`` seconds have passed a single trial request is let through; the
+    circuit closes again if it succeeds and reopens if it fails.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """
+        :raises CircuitOpenError: if requests should not be made right now
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return
+            raise CircuitOpenError('Circuit open, not calling host')
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.time()
+
+
+class CircuitBreakers(object):
+    """
+    One :class:`CircuitBreaker` per host
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def for_url(self, url):
+        """
+        :param url: full URL
+        :return: the :class:`CircuitBreaker` for the URL's host
+        """
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[host]
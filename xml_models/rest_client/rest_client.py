@@ -29,18 +29,33 @@ or implied, of the FreeBSD Project.
 
 __doc__="A REST client, supporting GET, PUT, POST and DELETE"
 
-import requests
+import time
+
+from .transports import RequestsTransport
+
 
 class Client(object):
     """ 
     A new Client takes a base_url e.g. http://www.mysite.com:8765/rest and 
     optionally a tuple containing username and password for use as basic 
     auth.  
+
+    ``timeout`` is passed to requests and may be a ``(connect, read)`` tuple.  ``retry`` is a
+    :class:`RetryPolicy`, ``circuit_breakers`` a :class:`CircuitBreakers` registry shared by clients calling the same
+    hosts and ``deadline`` a :class:`Deadline` that every request, including retries, must finish by.
+
+    Requests are made by ``transport``, a :class:`RequestsTransport` unless another :class:`Transport` is given.
     """
-    def __init__(self, base_url, credentials=(None, None), verify=True):
+    def __init__(self, base_url, credentials=(None, None), verify=True, timeout=None, retry=None,
+                 circuit_breakers=None, deadline=None, transport=None):
         self.base_url = base_url or ""
         self._creds = credentials
         self.verify = verify
+        self.timeout = timeout
+        self.retry = retry
+        self.circuit_breakers = circuit_breakers
+        self.deadline = deadline
+        self.transport = transport or RequestsTransport()
     
     def GET(self, url, headers={}):
         return self._make_request(url, 'get', None, headers)
@@ -55,13 +70,54 @@ class Client(object):
         return self._make_request(url, 'delete', payload, headers)
 
     def _make_request(self, url, method, payload, headers):
-        response = getattr(requests, method)(self.base_url + url,
-                                             headers=headers,
-                                             data=payload,
-                                             auth=self._creds,
-                                             verify=self.verify)
-        return Response(self.base_url + url, response.status_code, response.headers, response.text)
-        
+        url = self.base_url + url
+        breaker = self.circuit_breakers.for_url(url) if self.circuit_breakers else None
+        attempt = 0
+        while True:
+            attempt += 1
+            # an expired deadline raises before the breaker lets a trial request through
+            timeout = self.deadline.limit(self.timeout) if self.deadline else self.timeout
+            if breaker:
+                breaker.before_request()
+            try:
+                response = self.transport.request(method, url,
+                                                  headers=headers,
+                                                  data=payload,
+                                                  auth=self._creds,
+                                                  verify=self.verify,
+                                                  timeout=timeout)
+            except self.transport.retryable_errors:
+                if breaker:
+                    breaker.record_failure()
+                if not self._wait_to_retry(method, attempt):
+                    raise
+                continue
+            except Exception:
+                # any other error still ends the attempt, so that a trial request never leaves the breaker half open
+                if breaker:
+                    breaker.record_failure()
+                raise
+
+            if breaker:
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            if not (self.retry and response.status_code in self.retry.retry_on and
+                    self._wait_to_retry(method, attempt)):
+                if isinstance(response, Response):
+                    return response  # transports replaying stored responses hand back their own
+                return Response(url, response.status_code, response.headers, response.text)
+
+    def _wait_to_retry(self, method, attempt):
+        if not self.retry or not self.retry.can_retry(method, attempt):
+            return False
+        delay = self.retry.delay(attempt)
+        if self.deadline and delay >= self.deadline.remaining():
+            return False  # no time left for another attempt, give up with what we have
+        time.sleep(delay)
+        return True
+
 class Response(object):
     """Encapsulates the response from a client GET/PUT/POST/DELETE call"""
     
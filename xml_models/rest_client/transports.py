@@ -0,0 +1,137 @@
+"""
+Pluggable HTTP transports for :class:`xml_models.rest_client.Client`.
+
+A transport makes a single HTTP request and returns an object with ``status_code``, ``headers`` and ``text``
+attributes.  Connection failures and timeouts it raises should be listed in ``retryable_errors`` so that a
+:class:`RetryPolicy` and :class:`CircuitBreakers` can act on them.
+"""
+import threading
+
+
+class Transport(object):
+    """
+    Base class for transports
+    """
+
+    retryable_errors = ()
+
+    def request(self, method, url, headers=None, data=None, auth=None, verify=True, timeout=None):
+        """
+        :param method: lower case HTTP method
+        :param url: full URL
+        :param headers: request headers
+        :param data: request body
+        :param auth: ``(username, password)`` for basic auth, or None
+        :param verify: as per requests SSL certificate verification
+        :param timeout: seconds, or a ``(connect, read)`` tuple
+        :return: response with ``status_code``, ``headers`` and ``text``
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Release any pooled connections
+        """
+        pass
+
+
+class RequestsTransport(Transport):
+    """
+    The default transport, using requests.
+
+    Without a ``session`` each request is made through the requests module functions.  Pass a
+    :class:`requests.Session` to reuse pooled connections between requests made from one thread, or a
+    ``session_factory`` such as :class:`requests.Session` to give each thread a session of its own, as requests does
+    not guarantee that sessions are safe to share between threads.
+    """
+
+    def __init__(self, session=None, session_factory=None):
+        """
+        :param session: session used for every request
+        :param session_factory: function creating a session, called once per thread making requests
+        """
+        self._session = session
+        self.session_factory = session_factory
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """The session requests from the current thread are made with, or None"""
+        if self._session is not None or self.session_factory is None:
+            return self._session
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self.session_factory()
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    @property
+    def retryable_errors(self):
+        import requests
+
+        return (requests.ConnectionError, requests.Timeout)
+
+    def request(self, method, url, headers=None, data=None, auth=None, verify=True, timeout=None):
+        # requests is imported on first use as it is slow to import
+        import requests
+
+        session = self.session
+        if session is not None:
+            return session.request(method, url, headers=headers, data=data, auth=auth, verify=verify, timeout=timeout)
+        return getattr(requests, method)(url, headers=headers, data=data, auth=auth, verify=verify, timeout=timeout)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+        self._local = threading.local()
+
+
+class HttpxTransport(Transport):
+    """
+    A transport using httpx, which multiplexes concurrent requests to the same host over a single HTTP/2 connection.
+
+    Requires ``httpx``, and ``h2`` for HTTP/2.  The transport is safe to share between threads and should be shared
+    so that requests share connections.
+    """
+
+    def __init__(self, http2=True, **client_options):
+        """
+        :param http2: negotiate HTTP/2 where the server supports it
+        :param client_options: extra keyword arguments for :class:`httpx.Client`
+        """
+        import httpx
+
+        self._httpx = httpx
+        self.retryable_errors = (httpx.TransportError,)
+        self.http2 = http2
+        self.client_options = client_options
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, url, headers=None, data=None, auth=None, verify=True, timeout=None):
+        if auth is not None and auth[0] is None:
+            auth = None
+        if isinstance(timeout, tuple):
+            timeout = self._httpx.Timeout(timeout[1], connect=timeout[0])
+        return self._client(verify).request(method.upper(), url, headers=headers, content=data, auth=auth,
+                                            timeout=timeout)
+
+    def _client(self, verify):
+        # verification is fixed per httpx client, so keep one client per setting
+        with self._lock:
+            if verify not in self._clients:
+                self._clients[verify] = self._httpx.Client(http2=self.http2, verify=verify, **self.client_options)
+            return self._clients[verify]
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients = {}
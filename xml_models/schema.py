@@ -0,0 +1,134 @@
+"""
+Schema validation of the XML models are loaded from.
+
+A model declares a ``schema`` and every document or record it is loaded from is validated by lxml before any field is
+read:
+
+.. code-block:: python
+
+    class Person(xml_models.Model):
+        schema = xml_models.Schema('schemas/person.xsd')
+"""
+from __future__ import absolute_import
+
+import itertools
+import threading
+
+from lxml import etree
+
+from xml_models.managers import ValidationError
+
+XSD = 'xsd'
+RELAXNG = 'relaxng'
+SCHEMATRON = 'schematron'
+
+_ROOT_KINDS = {
+    '{http://www.w3.org/2001/XMLSchema}schema': XSD,
+    '{http://relaxng.org/ns/structure/1.0}': RELAXNG,
+    '{http://purl.oclc.org/dsdl/schematron}schema': SCHEMATRON,
+}
+
+RAISE = 'raise'
+SKIP = 'skip'
+
+
+class Schema(object):
+    """
+    An XSD, RelaxNG or Schematron schema, compiled the first time each thread uses it.  lxml validators keep the
+    errors of the latest document they checked, so a validator shared between threads could report another thread's
+    errors.
+
+    ``sample`` validates only a fraction of the records of a query, evenly spread, for feeds where validating every
+    record costs too much.  ``on_invalid`` decides whether an invalid record in a query raises
+    :class:`xml_models.managers.ValidationError` or is skipped.  Models created directly from XML always raise.
+
+    ``checked`` and ``rejected`` count the records validated and found invalid.
+    """
+
+    def __init__(self, source, kind=None, sample=1.0, on_invalid=RAISE):
+        """
+        :param source: path or file of the schema, its XML as a string, or a parsed :class:`etree.Element`
+        :param kind: ``'xsd'``, ``'relaxng'`` or ``'schematron'``, worked out from the schema's root element if not
+            given
+        :param sample: fraction of query records to validate, between 0 and 1
+        :param on_invalid: ``'raise'`` or ``'skip'``
+        """
+        if on_invalid not in (RAISE, SKIP):
+            raise ValueError('on_invalid must be %s or %s' % (RAISE, SKIP))
+        self.source = source
+        self.kind = kind
+        self.on_invalid = on_invalid
+        self.every = max(1, int(round(1 / sample))) if sample > 0 else None
+        self.checked = 0
+        self.rejected = 0
+        self._counter = itertools.count()
+        self._tree = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def validator(self):
+        """
+        :return: the compiled lxml validator of the current thread
+        """
+        validator = getattr(self._local, 'validator', None)
+        if validator is None:
+            validator = self._local.validator = self._compile()
+        return validator
+
+    def _parse(self):
+        # the source is read once, as a file can only be read once, and each thread compiles the parsed schema
+        if self._tree is None:
+            with self._lock:
+                if self._tree is None:
+                    source = self.source
+                    if isinstance(source, str) and source.lstrip().startswith('<'):
+                        self._tree = etree.fromstring(source.encode('utf-8'))
+                    elif isinstance(source, (etree._Element, etree._ElementTree)):
+                        self._tree = source
+                    else:
+                        self._tree = etree.parse(source)
+        return self._tree
+
+    def _compile(self):
+        tree = self._parse()
+        root = tree.getroot() if hasattr(tree, 'getroot') else tree
+
+        kind = self.kind or _ROOT_KINDS.get(root.tag) or _ROOT_KINDS.get(root.tag.partition('}')[0] + '}')
+        if kind == XSD:
+            return etree.XMLSchema(tree)
+        if kind == RELAXNG:
+            return etree.RelaxNG(tree)
+        if kind == SCHEMATRON:
+            from lxml import isoschematron
+
+            return isoschematron.Schematron(tree)
+        raise ValueError('Cannot tell what kind of schema %s is, pass kind' % root.tag)
+
+    def assert_valid(self, element):
+        """
+        :param element: :class:`etree.Element` to validate, which may be part of a larger document
+        :raises xml_models.managers.ValidationError: if ``element`` is invalid
+        """
+        validator = self.validator()
+        self.checked += 1
+        if not validator.validate(element):
+            self.rejected += 1
+            raise ValidationError(str(validator.error_log.last_error))
+
+    def accepts(self, element):
+        """
+        Validate a query record, if it is sampled
+
+        :param element: :class:`etree.Element` of the record
+        :return: False if the record is invalid and should be skipped
+        :raises xml_models.managers.ValidationError: if the record is invalid and ``on_invalid`` is ``'raise'``
+        """
+        if self.every is None or next(self._counter) % self.every:
+            return True
+        try:
+            self.assert_valid(element)
+        except ValidationError:
+            if self.on_invalid == RAISE:
+                raise
+            return False
+        return True
@@ -0,0 +1,61 @@
+"""
+Request coalescing: concurrent callers asking for the same thing share a single call.
+"""
+import threading
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Deduplicates concurrent calls by key.
+
+    The first caller for a key runs the function.  Callers arriving with the same key while it is running wait for it
+    and get the same result, or the same exception.  Nothing is cached once the call completes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """
+        Call ``func`` unless a call for ``key`` is already in flight, in which case wait for that one
+
+        :param key: hashable key identifying the call
+        :param func: function without arguments
+        :return: the result of ``func``
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if leader:
+            try:
+                call.result = func()
+            except Exception as error:  # pylint: disable=broad-except
+                call.error = error
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self):
+        """
+        :return: the number of calls currently running
+        """
+        with self._lock:
+            return len(self._calls)
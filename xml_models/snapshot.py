@@ -0,0 +1,164 @@
+"""
+Compact binary snapshots of hydrated models.
+
+A snapshot holds the values of a model's fields in a fixed field order, with no XML, tree or field objects, behind a
+fingerprint of the model's field definitions.  Loading one only decodes the values, which is much cheaper than
+parsing and reading the XML again, so snapshots suit shared caches and sending models between processes.  Pickling
+a model keeps its XML instead, so snapshots are only ever made explicitly.
+
+Values are encoded with :mod:`marshal` by default, which is fast but specific to the Python version.  ``msgpack``, if
+installed, gives snapshots any Python version can read.
+"""
+from __future__ import absolute_import
+
+import datetime
+import hashlib
+import marshal
+import struct
+
+MARSHAL = 'marshal'
+MSGPACK = 'msgpack'
+
+_MAGIC = b'XMS1'
+_HEADER = struct.Struct('>4sc8s')
+_ENCODINGS = {MARSHAL: b'm', MSGPACK: b'p'}
+
+_codecs = {}
+
+
+class SnapshotError(ValueError):
+    """
+    Raised for data that is not a snapshot of the model it is loaded as
+    """
+    pass
+
+
+def dumps(model, encoding=MARSHAL):
+    """
+    :param model: :class:`xml_models.Model` instance, hydrated first if it is not already
+    :param encoding: ``'marshal'`` or ``'msgpack'``
+    :return: the snapshot as bytes
+    """
+    if encoding not in _ENCODINGS:
+        raise ValueError('Unknown snapshot encoding %s' % encoding)
+    header = _HEADER.pack(_MAGIC, _ENCODINGS[encoding], fingerprint(type(model)))
+    values = _encode_model(model)
+    if encoding == MSGPACK:
+        import msgpack
+
+        return header + msgpack.packb(values, use_bin_type=True)
+    return header + marshal.dumps(values)
+
+
+def loads(model_class, data):
+    """
+    :param model_class: the :class:`xml_models.Model` class the snapshot was taken of
+    :param data: bytes from :func:`dumps`
+    :return: a new, fully hydrated, ``model_class`` instance
+    :raises SnapshotError: if ``data`` is not a snapshot of ``model_class``, as it is defined now
+    """
+    try:
+        magic, encoding, print_ = _HEADER.unpack_from(data)
+    except struct.error:
+        raise SnapshotError('Not a model snapshot')
+    if magic != _MAGIC:
+        raise SnapshotError('Not a model snapshot')
+    if print_ != fingerprint(model_class):
+        raise SnapshotError('Snapshot is not of %s as it is now defined' % model_class.__name__)
+    payload = data[_HEADER.size:]
+    if encoding == _ENCODINGS[MSGPACK]:
+        import msgpack
+
+        values = msgpack.unpackb(payload, raw=False)
+    else:
+        values = marshal.loads(payload)
+    return _decode_model(model_class, values)
+
+
+def fingerprint(model_class):
+    """
+    Identify a model's field definitions: names, types and xpaths, including those of nested models
+
+    :param model_class: :class:`xml_models.Model` class
+    :return: 8 bytes
+    """
+    return _codec(model_class)[0]
+
+
+def _codec(model_class):
+    # the field order, fingerprint and per field value converters are worked out once per class
+    codec = _codecs.get(model_class)
+    if codec is None:
+        names = sorted(model_class._fields)
+        fields = [model_class._fields[name] for name in names]
+        digest = hashlib.sha1(model_class.__name__.encode('utf-8'))
+        for name, field in zip(names, fields):
+            digest.update(('|%s:%s:%s' % (name, type(field).__name__, field.xpath)).encode('utf-8'))
+            nested = getattr(field, 'field_type', None)
+            if hasattr(nested, '_fields'):
+                digest.update(fingerprint(nested))
+        converters = [_converters(field) for field in fields]
+        codec = _codecs[model_class] = (digest.digest()[:8], fields, converters)
+    return codec
+
+
+def _encode_model(model):
+    _, fields, converters = _codec(type(model))
+    model.hydrate()
+    return [encode(model._parse_field(field)) for field, (encode, _) in zip(fields, converters)]
+
+
+def _decode_model(model_class, values):
+    _, fields, converters = _codec(model_class)
+    model = model_class()
+    model._cache = dict((field, decode(value)) for field, (_, decode), value in zip(fields, converters, values))
+    return model
+
+
+def _converters(field):
+    from xml_models.xml_models import CharField, CollectionField, DateField, OneToOneField
+
+    if isinstance(field, DateField):
+        return _encode_date, _decode_date
+    if isinstance(field, CharField) and field.interned is not None:
+        # choices may be enum members, which are stored as their values and shared again on loading
+        return (lambda value: getattr(value, 'value', value),
+                lambda value: None if value is None else field.interned.lookup(value))
+    if isinstance(field, OneToOneField):
+        return _nested_converters(field.field_type)
+    if isinstance(field, CollectionField):
+        if hasattr(field.field_type, '_fields'):
+            encode, decode = _nested_converters(field.field_type)
+        else:
+            encode, decode = _converters(field._item_field)
+        return (lambda items: None if items is None else [encode(item) for item in items],
+                lambda items: None if items is None else [decode(item) for item in items])
+    return _same, _same
+
+
+def _nested_converters(model_class):
+    return (lambda model: None if model is None else _encode_model(model),
+            lambda values: None if values is None else _decode_model(model_class, values))
+
+
+def _same(value):
+    return value
+
+
+def _encode_date(value):
+    if value is None:
+        return None
+    offset = value.utcoffset()
+    return [value.year, value.month, value.day, value.hour, value.minute, value.second, value.microsecond,
+            None if offset is None else offset.days * 86400 + offset.seconds]
+
+
+def _decode_date(parts):
+    if parts is None:
+        return None
+    tzinfo = None
+    if parts[7] is not None:
+        from dateutil.tz import tzoffset
+
+        tzinfo = tzoffset(None, parts[7])
+    return datetime.datetime(*parts[:7], tzinfo=tzinfo)
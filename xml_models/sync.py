@@ -0,0 +1,120 @@
+"""
+Local copies of large collections, kept up to date by fetching only what changed.
+
+A model with a ``primary_key`` field can be synced with :meth:`xml_models.managers.ModelManager.refresh`.  The first
+refresh fetches the whole collection.  Later refreshes fetch only the records changed since the previous one, from
+the model's ``delta_finder`` if it has one, and otherwise by revalidating the whole collection with
+``If-Modified-Since``:
+
+.. code-block:: python
+
+    class Person(xml_models.Model):
+        id = xml_models.IntField(xpath='/Person/@id')
+        ...
+        primary_key = 'id'
+        finders = {(): 'http://api/people'}
+        delta_finder = 'http://api/people?since=%s'
+
+    >>> people = Person.objects.refresh()
+    >>> people = Person.objects.refresh(people)
+    >>> people.updated
+    [112, 205]
+
+Only records whose XML has changed are replaced, so unchanged models keep their parsed values.
+"""
+from __future__ import absolute_import
+
+import hashlib
+
+from lxml import etree
+
+#: ``strftime`` format of the time ``delta_finder`` URLs are completed with, unless a model sets ``delta_format``
+DELTA_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+class LocalCollection(object):
+    """
+    The models of a collection by primary key.
+
+    Models are created from their records the first time they are read.  ``added``, ``updated`` and ``removed`` list
+    the keys changed by the latest refresh.  Records missing from a delta are kept, as a delta only holds the changed
+    records.  Only a complete fetch of the collection removes them.
+    """
+
+    def __init__(self, model):
+        """
+        :param model: the :class:`xml_models.Model` class, which must have a ``primary_key``
+        :raises AttributeError: if the model has no ``primary_key``
+        """
+        name = getattr(model, 'primary_key', None)
+        if name not in model._fields:
+            raise AttributeError('%s has no primary_key field' % model.__name__)
+        self.model = model
+        self.key_field = model._fields[name]
+        self.synced_at = None
+        self.last_modified = None
+        self.added = []
+        self.updated = []
+        self.removed = []
+        self._digests = {}
+        self._records = {}
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, key):
+        return key in self._records
+
+    def __iter__(self):
+        for key in list(self._records):
+            yield self[key]
+
+    def __getitem__(self, key):
+        record = self._records[key]
+        if isinstance(record, bytes):
+            # records are checked against any schema as they are split out of the response
+            record = self._records[key] = self.model(record, validated=True)
+        return record
+
+    def keys(self):
+        """
+        :return: the primary keys of the models held
+        """
+        return list(self._records)
+
+    def get(self, key, default=None):
+        """
+        :param key: primary key
+        :param default: returned if there is no model with the key
+        :return: the model with the key
+        """
+        if key in self._records:
+            return self[key]
+        return default
+
+    def merge(self, records, complete):
+        """
+        Replace the models whose records have changed
+
+        :param records: record elements, in one pass
+        :param complete: True if ``records`` is the whole collection, so that models missing from it are removed
+        """
+        self.added, self.updated, self.removed = [], [], []
+        namespaces = self.model._nsmap
+        seen = set()
+        for record in records:
+            key = self.key_field.parse_view(record, namespaces)
+            fragment = etree.tostring(record, with_tail=False)
+            digest = hashlib.sha1(fragment).digest()
+            seen.add(key)
+            previous = self._digests.get(key)
+            if previous == digest:
+                continue
+            (self.added if previous is None else self.updated).append(key)
+            self._digests[key] = digest
+            self._records[key] = fragment
+        if complete:
+            self.removed = [key for key in self._records if key not in seen]
+            for key in self.removed:
+                del self._records[key]
+                del self._digests[key]
@@ -0,0 +1,161 @@
+"""
+In-process transports for testing and load testing models without a network.
+
+:class:`StubTransport` serves canned XML for URL patterns.  :class:`RecordingTransport` captures real responses to a
+directory and :class:`ReplayTransport` plays them back from memory maps.  Stubbed and replayed requests can be given
+synthetic latency and limited bandwidth so that throughput and latency under concurrency can be measured repeatably:
+
+.. code-block:: python
+
+    from xml_models.testing import StubTransport
+
+    Person.http_transport = StubTransport(latency=0.05).add(r'/person/\\d+$', '<Person>...</Person>')
+"""
+from __future__ import absolute_import
+
+import os
+import re
+import threading
+import time
+
+from xml_models.cache import CachedResponse, DiskCache, cache_key
+from xml_models.rest_client import RequestsTransport, Response, Transport
+
+
+class StubResponse(object):
+    """
+    A canned response as returned by :meth:`StubTransport.request`
+    """
+
+    def __init__(self, status_code, headers, text):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+
+
+class ReplayedResponse(CachedResponse):
+    """
+    A :class:`CachedResponse` returned by :class:`ReplayTransport`.  Its body is parsed from a memory map.
+    """
+
+    status_code = property(fget=lambda self: self.response_code)
+    text = property(fget=lambda self: self.content)
+
+
+class _Shaped(Transport):
+    """
+    Adds ``latency`` seconds to every request and limits bodies to ``bandwidth`` bytes per second
+    """
+
+    def __init__(self, latency=0, bandwidth=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _wait(self, size):
+        with self._lock:
+            self.calls += 1
+        delay = self.latency
+        if self.bandwidth:
+            delay += float(size) / self.bandwidth
+        if delay > 0:
+            time.sleep(delay)
+
+
+class StubTransport(_Shaped):
+    """
+    Serves canned responses for URL patterns.
+
+    Routes are tried in the order they were added and the first whose pattern is found in the URL answers.  Requests
+    matching no route get a ``404``.  ``calls`` counts the requests made.
+    """
+
+    def __init__(self, routes=None, latency=0, bandwidth=None):
+        """
+        :param routes: optional dict of URL pattern to body
+        :param latency: seconds added to every request
+        :param bandwidth: bytes per second the body is delivered at, or None for no limit
+        """
+        _Shaped.__init__(self, latency, bandwidth)
+        self._routes = []
+        for pattern, body in (routes or {}).items():
+            self.add(pattern, body)
+
+    def add(self, pattern, body, status=200, headers=None, method='get'):
+        """
+        Answer requests whose URL matches ``pattern``
+
+        :param pattern: regular expression searched for in the full URL
+        :param body: response body, or a function taking the :class:`re.Match` and returning it
+        :param status: response code
+        :param headers: response headers
+        :param method: lower case HTTP method to answer
+        :return: the transport, so that calls can be chained
+        """
+        self._routes.append((re.compile(pattern), method, body, status, headers or {}))
+        return self
+
+    def request(self, method, url, headers=None, data=None, auth=None, verify=True, timeout=None):
+        for pattern, route_method, body, status, response_headers in self._routes:
+            match = pattern.search(url)
+            if match and route_method == method:
+                if callable(body):
+                    body = body(match)
+                if isinstance(body, bytes):
+                    body = body.decode('utf-8')
+                self._wait(len(body))
+                return StubResponse(status, dict(response_headers), body)
+        self._wait(0)
+        return StubResponse(404, {}, '')
+
+
+class RecordingTransport(Transport):
+    """
+    Passes requests on to another transport and stores successful ``GET`` responses in ``directory`` for
+    :class:`ReplayTransport`.  The directory uses the :class:`xml_models.cache.DiskCache` layout.
+    """
+
+    def __init__(self, directory, transport=None):
+        """
+        :param directory: where to store responses.  Created if missing.
+        :param transport: transport making the real requests, a :class:`RequestsTransport` by default
+        """
+        self.store = DiskCache(directory)
+        self.transport = transport or RequestsTransport()
+        self.retryable_errors = self.transport.retryable_errors
+
+    def request(self, method, url, headers=None, data=None, auth=None, verify=True, timeout=None):
+        response = self.transport.request(method, url, headers=headers, data=data, auth=auth, verify=verify,
+                                          timeout=timeout)
+        if method == 'get' and response.status_code == 200:
+            self.store.set(cache_key(url, headers), Response(url, 200, response.headers, response.text))
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class ReplayTransport(_Shaped):
+    """
+    Plays back responses stored by :class:`RecordingTransport` without touching the network.
+
+    Requests are matched on URL and headers.  Requests that were not recorded get a ``404``.
+    """
+
+    def __init__(self, directory, latency=0, bandwidth=None):
+        """
+        :param directory: a directory written by :class:`RecordingTransport`
+        :param latency: seconds added to every request
+        :param bandwidth: bytes per second the body is delivered at, or None for no limit
+        """
+        _Shaped.__init__(self, latency, bandwidth)
+        self.store = DiskCache(directory)
+
+    def request(self, method, url, headers=None, data=None, auth=None, verify=True, timeout=None):
+        recorded = self.store.get(cache_key(url, headers)) if method == 'get' else None
+        if recorded is None:
+            self._wait(0)
+            return StubResponse(404, {}, '')
+        self._wait(os.path.getsize(recorded._path))
+        return ReplayedResponse(url, recorded.response_code, recorded.headers, recorded._path, recorded.stored_at)
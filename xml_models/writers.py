@@ -0,0 +1,160 @@
+"""
+Bulk writes for models, declared with ``writers`` on a model much like :ref:`finders`:
+
+.. code-block:: python
+
+    class Person(xml_models.Model):
+        id = xml_models.IntField(xpath='/Person/@id')
+        ...
+        writers = {'create': xml_models.BatchWriter('http://api/people', collection_node='People'),
+                   'update': xml_models.ItemWriter('http://api/people/%s', fields=(id,), method='PUT')}
+
+    >>> results = Person.objects.bulk_create(people)
+    >>> failed = [result.model for result in results if not result.ok]
+"""
+from __future__ import absolute_import
+
+import itertools
+from io import BytesIO
+
+from lxml import etree
+
+from xml_models import xpath_finder
+
+
+class WriteResult(object):
+    """
+    The outcome of writing one model
+    """
+
+    def __init__(self, model, response=None, error=None):
+        """
+        :param model: the model written
+        :param response: the :class:`xml_models.rest_client.Response` to the request carrying it, if there was one
+        :param error: the exception raised making the request, if any
+        """
+        self.model = model
+        self.response = response
+        self.error = error
+
+    @property
+    def ok(self):
+        """True if the request carrying the model got a 2xx response"""
+        return self.error is None and self.response is not None and 200 <= self.response.response_code < 300
+
+    def __repr__(self):
+        if self.error is not None:
+            return '<WriteResult %r: %r>' % (self.model, self.error)
+        return '<WriteResult %r: %s>' % (self.model, self.response.response_code)
+
+
+class _Writer(object):
+    method = 'POST'
+    batch_size = 1
+    concurrency = 1
+
+    def write(self, model_class, models, client, headers, batch_size=None, concurrency=None):
+        """
+        Send ``models``, ``concurrency`` requests at a time
+
+        :param model_class: the class of the models
+        :param models: iterable of models
+        :param client: :class:`xml_models.rest_client.Client`, shared by all requests
+        :param headers: request headers
+        :param batch_size: overrides the writer's ``batch_size``
+        :param concurrency: overrides the writer's ``concurrency``
+        :return: list of :class:`WriteResult`, one per model in the order given
+        """
+        batch_size = batch_size or self.batch_size
+        models = iter(models)
+        batches = iter(lambda: list(itertools.islice(models, batch_size)), [])
+        send = getattr(client, self.method.upper())
+
+        def write_batch(batch):
+            try:
+                response = send(self.url_for(batch), self.payload(model_class, batch), headers=headers)
+            except Exception as error:  # pylint: disable=broad-except
+                return [WriteResult(model, error=error) for model in batch]
+            return [WriteResult(model, response) for model in batch]
+
+        workers = concurrency or self.concurrency
+        if workers == 1:
+            results = [write_batch(batch) for batch in batches]
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(write_batch, batches))
+        return list(itertools.chain.from_iterable(results))
+
+    def url_for(self, batch):
+        raise NotImplementedError
+
+    def payload(self, model_class, batch):
+        raise NotImplementedError
+
+
+class ItemWriter(_Writer):
+    """
+    Writes each model with a request of its own
+    """
+
+    def __init__(self, url, fields=(), method='POST', concurrency=4):
+        """
+        :param url: URL, formatted with the values of ``fields``
+        :param fields: fields, or field names, whose values complete the URL
+        :param method: HTTP method
+        :param concurrency: number of requests in flight at once
+        """
+        self.url = url
+        self.fields = fields
+        self.method = method
+        self.concurrency = concurrency
+
+    def write(self, model_class, models, client, headers, batch_size=None, concurrency=None):
+        # every model has its own request, whatever batch size is asked for
+        return _Writer.write(self, model_class, models, client, headers, 1, concurrency)
+
+    def url_for(self, batch):
+        model = batch[0]
+        return self.url % tuple(getattr(model, field if isinstance(field, str) else field._name)
+                                for field in self.fields)
+
+    def payload(self, model_class, batch):
+        return batch[0].to_xml()
+
+
+class BatchWriter(_Writer):
+    """
+    Writes models in batches, each sent as one collection document with the models' XML inside a ``collection_node``
+    element
+    """
+
+    def __init__(self, url, collection_node, method='POST', batch_size=100, concurrency=1):
+        """
+        :param url: URL
+        :param collection_node: tag name of the collection element, in the model's namespaces
+        :param method: HTTP method
+        :param batch_size: most models per request
+        :param concurrency: number of requests in flight at once
+        """
+        self.url = url
+        self.collection_node = collection_node
+        self.method = method
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+
+    def url_for(self, batch):
+        return self.url
+
+    def payload(self, model_class, batch):
+        out = BytesIO()
+        # each model is serialized straight into the payload, the collection document is never built as a tree
+        with etree.xmlfile(out, encoding='utf-8') as xml_file:
+            xml_file.write_declaration()
+            with xml_file.element(xpath_finder.clark(self.collection_node, model_class._nsmap),
+                                  nsmap=model_class._element_nsmap()):
+                for model in batch:
+                    xml_file.write(model.to_tree(), with_tail=False)
+        return out.getvalue()
+
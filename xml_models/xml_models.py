@@ -1,9 +1,13 @@
 from __future__ import absolute_import
 
+import copy
 import datetime
-from xml_models import xpath_finder
+import threading
+from xml_models import compiler, converters, interning, snapshot, xpath_finder
+from xml_models.compiler import BuildPlan, FieldPlan
 from xml_models.managers import ModelManager
-from dateutil.parser import parse as date_parser
+from xml_models.writers import BatchWriter, ItemWriter, WriteResult
+from xml_models.schema import Schema
 from lxml import etree
 
 
@@ -11,26 +15,91 @@ from lxml import etree
 # Fields only need one public method
 from xml_models.xpath_finder import MultipleNodesReturnedException
 
+#: Parse each field on first access
+LAZY = 'lazy'
+#: Parse every field when the model is created
+EAGER = 'eager'
+#: Parse every field on a worker thread after the model is created
+BACKGROUND = 'background'
+HYDRATION_MODES = (LAZY, EAGER, BACKGROUND)
+
+_executor = None
+_lock = threading.Lock()
+_local = threading.local()  # the element of the view whose fields the thread is reading, see BaseField.parse_view
+_NOT_WRITTEN = object()
+
 
 class BaseField:
     """
     Base class for Fields.  Should not be used directly
     """
 
+    # array.array typecode used by ModelQuery.to_columns, None for fields collected into plain lists
+    _typecode = None
+
     def __init__(self, **kw):
         """
         All fields must specify an ``xpath`` as a keyword argument in their constructor.  Fields may optionally specify
         a default value using the ``default`` keyword argument.
 
+        Whitespace around values is stripped according to the ``strip`` keyword argument: True to always strip it,
+        False to keep it, or by default to strip attributes, ``text()`` and the text of elements that have children.
+
         :raises AttributeError: if xpath attribute is empty
         """
         if 'xpath' not in kw:
             raise AttributeError('No XPath supplied for xml field')
         self.xpath = kw['xpath']
         self._default = kw.pop('default', None)
+        self.strip = kw.pop('strip', None)
+        self._compiled_xpath = None
+        self._relative_xpath = None
+        self._find = None
+        self._find_relative = None
+
+    def _compile(self, namespaces):
+        """
+        Compile the xpath expression once, with the owning model's namespaces bound.  Threads hydrating models at the
+        same time each evaluate a copy of their own, see :class:`xpath_finder.LocalXPath`.
+
+        :param namespaces: dict of prefix to namespace URI
+        """
+        self._compiled_xpath = xpath_finder.local_xpath(self.xpath, namespaces)
+        # the evaluation path for single values is picked once, from what the xpath returns
+        self._find = xpath_finder.evaluator(self.xpath, namespaces, self.strip)
+        relative = xpath_finder.relative(self.xpath)
+        if relative is not None:
+            self._relative_xpath = xpath_finder.local_xpath(relative, namespaces)
+            self._find_relative = xpath_finder.evaluator(relative, namespaces, self.strip)
+
+    def parse_view(self, xml, namespace):
+        """
+        Like ``parse``, for an element of a larger document.  Absolute xpaths are evaluated from the element, as if it
+        were the root of a document of its own, where they can be, see :func:`xpath_finder.relative`.
+
+        :param xml: the etree.Element to search in
+        :param namespace: default namespace URI or a dict of prefix to namespace URI
+        """
+        previous = getattr(_local, 'view', None)
+        _local.view = xml
+        try:
+            return self.parse(xml, namespace)
+        finally:
+            _local.view = previous
+
+    def _find_xpath(self, xml=None):
+        if self._relative_xpath is not None and _is_view(xml):
+            return self._relative_xpath
+        return self._compiled_xpath if self._compiled_xpath is not None else self.xpath
 
     def _fetch_by_xpath(self, xml_doc, namespace):
-        find = xpath_finder.find_unique(xml_doc, self.xpath, namespace)
+        if self._find is None:  # not compiled by a model
+            return self._or_default(xpath_finder.find_unique(xml_doc, self.xpath, namespace))
+        if self._find_relative is not None and _is_view(xml_doc):
+            return self._or_default(self._find_relative(xml_doc))
+        return self._or_default(self._find(xml_doc))
+
+    def _or_default(self, find):
         if find is None:
             return self._default
         return find
@@ -38,33 +107,67 @@ class BaseField:
 
 class CharField(BaseField):
     """
-    Returns the single value found by the xpath expression, as a string
+    Returns the single value found by the xpath expression, as a string.
+
+    Fields that repeat a few values across many records can share one instance of each value, see
+    :mod:`xml_models.interning`.
     """
 
+    def __init__(self, intern=False, choices=None, **kw):  # pylint: disable=redefined-builtin
+        """
+        :param intern: share repeated values, up to ``interning.DEFAULT_SIZE`` distinct values or as many as given
+        :param choices: the only values allowed, as strings or an :class:`enum.Enum` class whose members are returned
+            in place of their values
+        """
+        BaseField.__init__(self, **kw)
+        self.interned = None
+        if choices is not None:
+            self.interned = interning.InternTable(choices=choices)
+        elif intern:
+            self.interned = interning.InternTable(interning.DEFAULT_SIZE if intern is True else intern)
+
     def parse(self, xml, namespace):
         """
         :param xml: the etree.Element to search in
-        :param namespace: not used yet
+        :param namespace: default namespace URI or a dict of prefix to namespace URI
         :rtype: string
         """
-        return self._fetch_by_xpath(xml, namespace)
+        return self._to_python(self._fetch_by_xpath(xml, namespace))
+
+    def _to_python(self, value):
+        if self.interned is None or value is None or value is self._default:
+            return value
+        return self.interned.lookup(value)
 
 
 class IntField(BaseField):
     """
-    Returns the single value found by the xpath expression, as an int
+    Returns the single value found by the xpath expression, as an int.
+
+    Values that are not ints raise :class:`ValueError`, unless ``on_error`` says otherwise, see
+    :mod:`xml_models.converters`.
     """
 
+    _typecode = 'q'
+
+    def __init__(self, on_error=converters.STRICT, **kw):
+        """
+        :param on_error: ``'strict'``, ``'coerce'`` or ``'default'``
+        """
+        BaseField.__init__(self, **kw)
+        self.converter = converters.IntConverter(self._default, on_error)
+        self._convert = self.converter.convert
+
     def parse(self, xml, namespace):
         """
         :param xml: the etree.Element to search in
-        :param namespace: not used yet
-        :rtype: DateTime, may be timezone aware or naive
+        :param namespace: default namespace URI or a dict of prefix to namespace URI
+        :rtype: int
         """
-        value = self._fetch_by_xpath(xml, namespace)
-        if value:
-            return int(value)
-        return self._default
+        return self._convert(self._fetch_by_xpath(xml, namespace))
+
+    def _to_python(self, value):
+        return self._convert(value)
 
 
 class DateField(BaseField):
@@ -77,6 +180,8 @@ class DateField(BaseField):
     If the XML contains UTC offsets then a timezone aware datetime object will be returned.
     """
 
+    _typecode = 'q'  # microseconds since the epoch
+
     def __init__(self, date_format=None, **kw):
         BaseField.__init__(self, **kw)
         self.date_format = date_format
@@ -84,54 +189,81 @@ class DateField(BaseField):
     def parse(self, xml, namespace):
         """
         :param xml: the etree.Element to search in
-        :param namespace: not used yet
+        :param namespace: default namespace URI or a dict of prefix to namespace URI
         :rtype: DateTime, may be timezone aware or naive
         """
-        value = self._fetch_by_xpath(xml, namespace)
+        return self._to_python(self._fetch_by_xpath(xml, namespace))
+
+    def _to_python(self, value):
         if value:
             if self.date_format:
                 return datetime.datetime.strptime(value, self.date_format)
+            from dateutil.parser import parse as date_parser  # slow to import, so only when a date is first parsed
+
             return date_parser(value)
         return self._default
 
 
 class FloatField(BaseField):
     """
-    Returns the single value found by the xpath expression, as a float
+    Returns the single value found by the xpath expression, as a float.
+
+    Values that are not floats raise :class:`ValueError`, unless ``on_error`` says otherwise, see
+    :mod:`xml_models.converters`.
     """
 
+    _typecode = 'd'
+
+    def __init__(self, on_error=converters.STRICT, **kw):
+        """
+        :param on_error: ``'strict'``, ``'coerce'`` or ``'default'``
+        """
+        BaseField.__init__(self, **kw)
+        self.converter = converters.FloatConverter(self._default, on_error)
+        self._convert = self.converter.convert
+
     def parse(self, xml, namespace):
         """
         :param xml: the etree.Element to search in
-        :param namespace: not used yet
+        :param namespace: default namespace URI or a dict of prefix to namespace URI
         :rtype: float
         """
-        value = self._fetch_by_xpath(xml, namespace)
-        if value:
-            return float(value)
-        return self._default
+        return self._convert(self._fetch_by_xpath(xml, namespace))
+
+    def _to_python(self, value):
+        return self._convert(value)
 
 
 class BoolField(BaseField):
     """
-    Returns the single value found by the xpath expression, as a boolean
+    Returns the single value found by the xpath expression, as a boolean.
+
+    Other values than ``true`` and ``false`` are the field's default, unless ``on_error`` says otherwise, see
+    :mod:`xml_models.converters`.
     """
 
+    _typecode = 'b'
+
+    def __init__(self, on_error=converters.DEFAULT, **kw):
+        """
+        :param on_error: ``'strict'``, ``'coerce'`` or ``'default'``
+        """
+        BaseField.__init__(self, **kw)
+        self.converter = converters.BoolConverter(self._default, on_error)
+        self._convert = self.converter.convert
+
     def parse(self, xml, namespace):
         """
-        Recognises any-case TRUE or FALSE only i.e. wont parse 0 as False or 1 as True etc.
+        Recognises any-case TRUE or FALSE only i.e. wont parse 0 as False or 1 as True etc., unless coercing
 
         :param xml: the etree.Element to search in
-        :param namespace: not used yet
+        :param namespace: default namespace URI or a dict of prefix to namespace URI
         :rtype: Bool
         """
-        value = self._fetch_by_xpath(xml, namespace)
-        if value is not None:
-            if value.lower() == 'true':
-                return True
-            elif value.lower() == 'false':
-                return False
-        return self._default
+        return self._convert(self._fetch_by_xpath(xml, namespace))
+
+    def _to_python(self, value):
+        return self._convert(value)
 
 
 class CollectionField(BaseField):
@@ -146,28 +278,39 @@ class CollectionField(BaseField):
         """
         :param field_type: class to cast to.  Should be a subclass of :class:`BaseField` or :class:`Model`
         :param order_by: the attribute in ``field_type`` to order the collection on. Asc only
+        :param intern: with :class:`CharField` items, share repeated values, see :class:`CharField`
+        :param choices: with :class:`CharField` items, the only values allowed, see :class:`CharField`
         """
         self.field_type = field_type
         self.order_by = order_by
+        item_options = dict((name, kw.pop(name)) for name in ('intern', 'choices') if name in kw)
         BaseField.__init__(self, **kw)
+        self._item_field = None
+        if BaseField in field_type.__bases__:
+            self._item_field = field_type(xpath='.', **item_options)
+
+    def _compile(self, namespaces):
+        BaseField._compile(self, namespaces)
+        if self._item_field is not None:
+            self._item_field._compile(namespaces)
 
     def parse(self, xml, namespace):
         """
-        Find all nodes matching the xpath expression and create objects from each the matched node.
+        Find all nodes matching the xpath expression and create objects from each the matched node.  Models are
+        created as views onto the matched nodes, see :class:`Model`.
 
         If ``order_by`` has been defined then the resulting list will be ordered.
 
         :param xml: the etree.Element to search in
-        :param namespace: not used yet
+        :param namespace: default namespace URI or a dict of prefix to namespace URI
         :rtype: as defined by ``self.field_type``
         """
-        matches = xpath_finder.find_all(xml, self.xpath, namespace)
+        matches = xpath_finder.compile_xpath(self._find_xpath(xml), namespace)(xml)
 
-        if BaseField not in self.field_type.__bases__:
-            results = [self.field_type(xml=match) for match in matches]
+        if self._item_field is None:
+            results = [_nested(self.field_type, match) for match in matches]
         else:
-            field = self.field_type(xpath='.')
-            results = [field.parse(xpath_finder.domify(match), namespace) for match in matches]
+            results = [self._item_field.parse(match, namespace) for match in matches]
         if self.order_by:
             from operator import attrgetter
 
@@ -190,14 +333,14 @@ class OneToOneField(BaseField):
     def parse(self, xml, namespace):
         """
         :param xml: the etree.Element to search in
-        :param namespace: not used yet
+        :param namespace: default namespace URI or a dict of prefix to namespace URI
         :rtype: as defined by ``self.field_type``
         """
-        match = xpath_finder.find_all(xml, self.xpath, namespace)
+        match = xpath_finder.compile_xpath(self._find_xpath(xml), namespace)(xml)
         if len(match) > 1:
             raise MultipleNodesReturnedException
         if len(match) == 1:
-            return self.field_type(xml=match[0])
+            return _nested(self.field_type, match[0])
         return self._default
 
 
@@ -208,17 +351,29 @@ class ModelBase(type):
 
     def __new__(mcs, name, bases, attrs):
         new_class = super(ModelBase, mcs).__new__(mcs, name, bases, attrs)
-        xml_fields = [field_name for field_name in attrs.keys() if isinstance(attrs[field_name], BaseField)]
+        # everything worked out here is shared by every thread using the class, so it is never changed afterwards
+        xml_fields = tuple(field_name for field_name in attrs.keys() if isinstance(attrs[field_name], BaseField))
         setattr(new_class, 'xml_fields', xml_fields)
+        # resolve the namespaces once per class so that every field xpath is compiled with them bound
+        nsmap = xpath_finder.namespace_map(getattr(new_class, 'namespace', None),
+                                           getattr(new_class, 'namespaces', None))
+        setattr(new_class, '_nsmap', nsmap)
+        setattr(new_class, '_fields', dict((field_name, attrs[field_name]) for field_name in xml_fields))
+        # nested instances can only read a subtree in place if every field xpath can be made relative to it
+        setattr(new_class, '_views', all(xpath_finder.relative(attrs[field_name].xpath) is not None
+                                         for field_name in xml_fields))
         for field_name in xml_fields:
             setattr(new_class, field_name, new_class._get_xpath(attrs[field_name]))
             attrs[field_name]._name = field_name
-        if "finders" in attrs:
-            setattr(new_class, "objects", ModelManager(new_class, attrs["finders"]))
-        else:
-            setattr(new_class, "objects", ModelManager(new_class, {}))
-        if "headers" in attrs:
-            setattr(new_class.objects, "headers", attrs["headers"])
+            attrs[field_name]._compile(nsmap)
+        plan = None
+        if getattr(new_class, 'compile_fields', False):
+            plan = FieldPlan([attrs[field_name] for field_name in xml_fields], nsmap,
+                             (CharField, IntField, FloatField, DateField, BoolField))
+        setattr(new_class, '_plan', plan)
+        setattr(new_class, '_builder', BuildPlan([attrs[field_name] for field_name in xml_fields], nsmap,
+                                                 CollectionField))
+        setattr(new_class, "objects", _LazyManager(attrs))
         return new_class
 
     def _get_xpath(cls, field_impl):
@@ -226,10 +381,39 @@ class ModelBase(type):
                         fset=lambda cls, value: cls._set_value(field_impl, value))
 
 
-from future.utils import with_metaclass
+class _LazyManager(object):
+    """
+    Creates a model's :class:`ModelManager` the first time ``objects`` is used, rather than when the class is defined
+    """
 
+    def __init__(self, attrs):
+        self.finders = attrs.get("finders", {})
+        self.settings = dict((name, attrs[name]) for name in ("headers", "writers") if name in attrs)
+        self.manager = None
+        self._lock = threading.Lock()
 
-class Model(with_metaclass(ModelBase)):
+    def __get__(self, instance, owner):
+        # threads that use the model for the first time at once all get the same manager
+        with self._lock:
+            if self.manager is None:
+                manager = ModelManager(owner, self.finders)
+                for name, value in self.settings.items():
+                    setattr(manager, name, value)
+                self.manager = manager
+                setattr(owner, "objects", manager)  # replaces this descriptor, so later lookups are plain reads
+        return self.manager
+
+
+def _with_metaclass(meta, *bases):
+    # a temporary class whose metaclass swaps itself out for ``meta``, so the syntax works on Python 2 and 3 alike
+    class metaclass(type):
+        def __new__(mcs, name, this_bases, attrs):
+            return meta(name, bases, attrs)
+
+    return type.__new__(metaclass, 'temporary_class', (), {})
+
+
+class Model(_with_metaclass(ModelBase, object)):
     """
     A model is a representation of the XML source, consisting of a number of Fields. It can be constructed with
     either an xml string, or an :class:`etree.Element`.
@@ -240,6 +424,7 @@ class Model(with_metaclass(ModelBase)):
 
         class Person(xml_models.Model):
             namespace="urn:my.default.namespace"
+            namespaces={'addr': 'urn:my.address.namespace'}
             name = xml_models.CharField(xpath"/Person/@Name", default="John")
             nicknames = xml_models.CollectionField(CharField, xpath="/Person/Nicknames/Name")
             addresses = xml_models.CollectionField(Address, xpath="/Person/Addresses/Address")
@@ -247,14 +432,90 @@ class Model(with_metaclass(ModelBase)):
 
     If you define :ref:`finders` on your model you will also be able to retreive models from an API endpoint using
     a familiar Django-esque object manager style of access with chainable filtering etc.
+
+    Fields are parsed lazily the first time they are read.  A model's ``hydration`` may instead be ``'eager'``, to
+    parse every field when the model is created, or ``'background'``, to parse them on a worker thread.
+
+    Setting ``compile_fields = True`` on a model reads all fields with simple paths, such as ``/Person/name`` or
+    ``/Person/@id``, in a single walk of the document the first time any one of them is accessed.  This is much faster
+    for models with many fields.
+
+    A model with a ``schema``, see :class:`xml_models.Schema`, validates the XML it is created from before any field is
+    read.
+
+    Unprefixed names in field xpaths are in the default ``namespace``, if one is given.  Other namespaces can be
+    referenced by the prefixes declared in ``namespaces``.
+
+    Models read through a :class:`OneToOneField` or :class:`CollectionField` are views onto their element of the
+    parent's tree rather than copies of it.  Their absolute xpaths are evaluated from that element, and their changes
+    are written straight into the parent's tree.
     """
 
-    def __init__(self, xml=None, dom=None):
+    hydration = LAZY
+    schema = None
+
+    def __init__(self, xml=None, dom=None, hydration=None, fields=None, validated=False, view=False):
+        """
+        :param xml: xml string
+        :param dom: :class:`etree.Element`
+        :param hydration: overrides the model's ``hydration`` policy
+        :param fields: names of the fields to hydrate up front, defaults to all of them
+        :param validated: the XML has already been checked against the model's ``schema``
+        :param view: ``dom`` is an element of a larger document, which the model reads and writes in place.  Set for the
+            models of :class:`OneToOneField` and :class:`CollectionField`, otherwise xpaths are evaluated from the
+            root of the document ``dom`` belongs to
+        :raises xml_models.managers.ValidationError: if the XML does not match the model's ``schema``
+        """
         self._xml = xml
         self._dom = dom
+        self._view = view and dom is not None
         self._cache = {}
+        self._found = None
+        self._hydration_future = None
+        self._shared = False  # True while a worker thread may be hydrating the model too
+        self._written = {}
+
+        hydration = hydration or self.hydration
+        if hydration not in HYDRATION_MODES:
+            raise ValueError('Unknown hydration mode %s, expected one of %s' % (hydration, ', '.join(HYDRATION_MODES)))
+        if xml is not None or dom is not None:
+            if self.schema is not None and not validated:
+                self.schema.assert_valid(self._get_tree())
+            if hydration == EAGER:
+                self.hydrate(fields)
+            elif hydration == BACKGROUND:
+                self._shared = True
+                self._hydration_future = _background(self.hydrate, fields)
         self.validate_on_load()
 
+    @classmethod
+    def build(cls, **values):
+        """
+        Create a new model from field values.
+
+        The tree is built directly from the values rather than from xpath lookups, which makes this the quickest way to
+        create a model to send.
+
+        :param values: field name to value
+        :raises AttributeError: if a name is not a field of the model
+        """
+        model = cls()
+        for name, value in values.items():
+            if name not in cls._fields:
+                raise AttributeError('%s has no field %s' % (cls.__name__, name))
+            model._cache[cls._fields[name]] = value
+        model._get_tree()
+        return model
+
+    def hydrate(self, fields=None):
+        """
+        Parse fields now rather than on first access.
+
+        :param fields: names of the fields to parse, defaults to all of them
+        """
+        for field_name in fields if fields is not None else self.xml_fields:
+            self._parse_field(self._fields[field_name])
+
 
     def validate_on_load(self):
         """
@@ -272,9 +533,11 @@ class Model(with_metaclass(ModelBase)):
 
         :rtype: :class:`lxml.etree.Element`
         """
-        for field in self._cache:
-            self._update_field(field)
-        return self._get_tree()
+        tree = self._get_tree()
+        for field, value in list(self._cache.items()):
+            if self._written.get(field, _NOT_WRITTEN) is not value:  # values the tree was built with are already in it
+                self._update_field(field)
+        return tree
 
     def to_xml(self, pretty=False):
         """
@@ -282,7 +545,31 @@ class Model(with_metaclass(ModelBase)):
 
         :rtype: string
         """
-        return etree.tostring(self.to_tree(), pretty_print=pretty).decode('UTF-8')
+        return etree.tostring(self.to_tree(), pretty_print=pretty, with_tail=False).decode('UTF-8')
+
+    def to_snapshot(self, encoding=snapshot.MARSHAL):
+        """
+        Compact binary snapshot of the model's field values, see :mod:`xml_models.snapshot`.  Every field is hydrated
+        first.
+
+        :param encoding: ``'marshal'`` or ``'msgpack'``
+        :rtype: bytes
+        """
+        return snapshot.dumps(self, encoding)
+
+    @classmethod
+    def from_snapshot(cls, data):
+        """
+        Load a model from :meth:`to_snapshot`.  It has no XML of its own, :meth:`to_xml` builds it from the values.
+
+        :param data: snapshot bytes
+        :raises xml_models.snapshot.SnapshotError: if ``data`` is not a snapshot of this model as it is defined now
+        """
+        return snapshot.loads(cls, data)
+
+    def __reduce__(self):
+        # pickle and copy keep the whole XML, including anything no field maps; snapshots are only made explicitly
+        return type(self), (self.to_xml(), None, None, None, True)
 
     def _update_attribute(self, field):
         """
@@ -295,7 +582,10 @@ class Model(with_metaclass(ModelBase)):
         xpath = "/".join(parts[:-1])  # I think it is safe to assume attributes are in the last place
         attr = parts[-1].replace('@', '')
 
-        self._get_tree().xpath(xpath)[0].attrib[attr] = str(getattr(self, field._name))
+        if ':' in attr:
+            attr = xpath_finder.clark(attr, self._nsmap)
+
+        self._xpath(xpath)[0].attrib[attr] = compiler.text(getattr(self, field._name))
 
     def _update_subtree(self, field):
         """
@@ -303,8 +593,11 @@ class Model(with_metaclass(ModelBase)):
         :param field: Model field with `to_tree`
         """
         new_tree = getattr(self, field._name).to_tree()
-        old_tree = self._get_tree().xpath(field.xpath)[0]
-        self._get_tree().replace(old_tree, new_tree)
+        old_tree = self._xpath(field.xpath)[0]
+        if new_tree is not old_tree:  # a view has already written its changes in place
+            if new_tree.getparent() is not None:
+                new_tree = copy.deepcopy(new_tree)  # moving it would take it from the tree it is a view onto
+            old_tree.getparent().replace(old_tree, new_tree)
 
     def _create_from_xpath(self, xpath, tree, value=None, extra_root_name=None):
         """
@@ -321,20 +614,17 @@ class Model(with_metaclass(ModelBase)):
         xpath = '' if extra_root_name is None else '/' + extra_root_name
         for part in parts[:-1]:  # save the last node
             xpath += '/' + part
-            nodes = tree.xpath(xpath)
+            nodes = self._xpath(xpath, tree)
 
             if not nodes:
-                node = etree.XML("<%s/>" % part)
-                tree.append(node)
-                tree = node
+                tree = etree.SubElement(tree, xpath_finder.clark(part, self._nsmap))
             else:
                 tree = nodes[0]
         # now we create the missing last node
-        node = etree.XML("<%s/>" % parts[-1])
-        tree.append(node)
+        node = etree.SubElement(tree, xpath_finder.clark(parts[-1], self._nsmap))
 
         if value:
-            node.text = str(value)
+            node.text = compiler.text(value)
 
         return node
 
@@ -350,28 +640,43 @@ class Model(with_metaclass(ModelBase)):
             from itertools import izip_longest as zip_longest
 
         new_values = getattr(self, field._name)
-        old_values = self._get_tree().xpath(field.xpath)
+        old_values = self._xpath(field.xpath)
 
         collection_xpath = "/".join(field.xpath.split('/')[:-1])
-        collection_node = self._get_tree().xpath(collection_xpath)[0]
+        collection_node = self._xpath(collection_xpath)[0]
+
+        if isinstance(field.field_type, ModelBase):
+            # views write their changes in place, so only a reordered, shortened or extended collection needs moving
+            trees = [new.to_tree() for new in new_values if new]
+            if len(trees) == len(old_values) and all(tree is old for tree, old in zip(trees, old_values)):
+                return
+            # swap every old element out first so that items which merely moved are moved rather than copied
+            slots = []
+            for old in old_values:
+                slot = etree.Comment()
+                old.getparent().replace(old, slot)
+                slots.append(slot)
+            for slot, tree in zip_longest(slots, trees):
+                if tree is None:
+                    slot.getparent().remove(slot)
+                    continue
+                if tree.getparent() is not None:
+                    tree = copy.deepcopy(tree)  # moving it would take it from the tree it is a view onto
+                if slot is None:
+                    collection_node.append(tree)
+                else:
+                    slot.getparent().replace(slot, tree)
+            return
 
         for old, new in zip_longest(old_values, new_values):
             if not new:
                 old.getparent().remove(old)
                 continue
 
-            if isinstance(field.field_type, ModelBase):
-                xml = etree.fromstring(new.to_xml())
-                if old is None:
-                    collection_node.append(xml)
-                else:
-                    collection_node.replace(old, xml)
-                continue
-
             if old is None:
                 self._create_from_xpath(field.xpath, self._get_tree(), new)
             else:
-                old.text = new
+                old.text = compiler.text(new)
 
     def _update_field(self, field):
         """
@@ -387,8 +692,8 @@ class Model(with_metaclass(ModelBase)):
         elif isinstance(field, OneToOneField):
             self._update_subtree(field)
         else:
-            node = self._get_tree().xpath(field.xpath)
-            value = str(getattr(self, field._name))
+            node = self._xpath(field.xpath)
+            value = compiler.text(getattr(self, field._name))
             if node:
                 node[0].text = value
             else:
@@ -396,24 +701,92 @@ class Model(with_metaclass(ModelBase)):
 
     def _get_tree(self):
         if self._dom is None:
-            self._dom = xpath_finder.domify(self._get_xml())
+            dom = xpath_finder.domify(self._xml) if self._xml else self._build()
+            if not self._shared:
+                self._dom = dom
+            else:
+                with _lock:  # a background hydration may be racing us for the tree
+                    if self._dom is None:
+                        self._dom = dom
         return self._dom
 
     def _get_xml(self):
         if not self._xml:
+            self._xml = etree.tostring(self._get_tree())
+        return self._xml
+
+    def _build(self):
+        values = dict(self._cache)
+        tree = self._builder.build(values, self._element_nsmap())
+        if tree is None:
             # create a fake root node that will get stripped off later
-            tree = etree.Element('RrootR')
-            for field in self._cache:
+            tree = etree.Element(xpath_finder.clark('RrootR', self._nsmap), nsmap=self._element_nsmap())
+            for field in values:
                 self._create_from_xpath(field.xpath, tree, extra_root_name='RrootR')
-            self._xml = etree.tostring(tree[0])
-
-        return self._xml
+            return xpath_finder.domify(etree.tostring(tree[0]))
+
+        for field, value in values.items():
+            if field not in self._builder:
+                self._create_from_xpath(field.xpath, tree)
+            elif not isinstance(field, (CollectionField, OneToOneField)):
+                self._written[field] = value
+        return tree
+
+    def _xpath(self, expression, tree=None):
+        if tree is None:
+            tree = self._get_tree()
+        if self._view and tree is self._dom:
+            expression = xpath_finder.relative(expression)
+        return xpath_finder.compile_xpath(expression, self._nsmap)(tree)
+
+    @classmethod
+    def _element_nsmap(cls):
+        nsmap = dict(cls._nsmap)
+        if xpath_finder.DEFAULT_PREFIX in nsmap:
+            nsmap[None] = nsmap.pop(xpath_finder.DEFAULT_PREFIX)
+        return nsmap
 
     def _set_value(self, field, value):
+        self._written.pop(field, None)  # the tree no longer holds the value, even if it is set back to the same one
         self._cache[field] = value
 
     def _parse_field(self, field):
-        if field not in self._cache:
-            namespace = getattr(self, 'namespace', None)
-            self._cache[field] = field.parse(self._get_tree(), namespace)
-        return self._cache[field]
+        try:
+            return self._cache[field]
+        except KeyError:
+            # setdefault, so that a value set while parsing in the background is not overwritten
+            return self._cache.setdefault(field, self._read_field(field))
+
+    def _read_field(self, field):
+        plan = self._plan
+        if plan is not None and field in plan:
+            if self._found is None:
+                tree = self._get_tree()
+                self._found = plan.extract(tree if self._view else tree.getroottree().getroot())
+            return plan.value(field, self._found)
+        if self._view:
+            return field.parse_view(self._get_tree(), self._nsmap)
+        return field.parse(self._get_tree(), self._nsmap)
+
+
+def _is_view(xml):
+    # the element is the view onto part of a larger document whose fields this thread is reading
+    return xml is getattr(_local, 'view', None)
+
+
+def _nested(model, element):
+    if model._views:
+        return model(dom=element, view=True)
+    return model(xml=etree.tostring(element, with_tail=False))
+
+
+def _background(func, *args):
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                import xml_models
+
+                _executor = ThreadPoolExecutor(max_workers=xml_models.BACKGROUND_WORKERS)
+    return _executor.submit(func, *args)
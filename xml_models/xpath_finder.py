@@ -1,6 +1,8 @@
 from lxml import etree
 
+import re
 import sys
+import threading
 
 if sys.version < '3':
     def unicode(string):
@@ -26,30 +28,349 @@ class MultipleNodesReturnedException(Exception):
     pass
 
 
+# XPath 1.0 has no notion of a default namespace, so unprefixed names are bound to this prefix instead
+DEFAULT_PREFIX = '_'
+
+_TOKENS = re.compile(r"""
+    (?P<literal>"[^"]*"|'[^']*')
+  | (?P<number>\d+(?:\.\d*)?|\.\d+)
+  | (?P<name>[A-Za-z_][\w.-]*(?::(?:[A-Za-z_][\w.-]*|\*))?)
+  | (?P<op>//|::|\.\.|!=|<=|>=|[/@()\[\],|=<>+*$.-])
+  | (?P<space>\s+)
+""", re.VERBOSE)
+
+_NAME_TEST = re.compile(r'(?:[A-Za-z_][\w.-]*:)?(?:[A-Za-z_][\w.-]*|\*)(?![\w.:(-])')
+# tokens after which a / starts a new, absolute, location path
+_OPERAND_EXPECTED = ('[', '(', ',', '=', '!=', '<', '>', '<=', '>=', '+', '-', 'and', 'or')
+
+_compiled = {}
+_local_compiled = {}
+
+#: Result kinds of the expressions :func:`evaluator` specializes
+ELEMENT = 'element'
+STRING = 'string'
+
+_PREDICATE = re.compile(r'\[[^\[\]]*\]')
+_STEP = r'(?:(?:self|child|descendant|descendant-or-self)::)?(?:[A-Za-z_][\w.-]*:)?(?:[A-Za-z_][\w.-]*|\*)'
+_ELEMENT_PATH = re.compile(r'^(?:\.|(?:\.?/{1,2})?%s(?:/{1,2}%s)*)$' % (_STEP, _STEP))
+_STRING_STEP = re.compile(r'/(?:@(?:[A-Za-z_][\w.-]*:)?[A-Za-z_][\w.-]*|text\(\))$')
+
+
+def namespace_map(namespace=None, namespaces=None):
+    """
+    Build a prefix map for XPath evaluation
+
+    :param namespace: default namespace URI, bound to :data:`DEFAULT_PREFIX`
+    :param namespaces: dict of prefix to namespace URI
+    :return: dict of prefix to namespace URI
+    """
+    nsmap = dict(namespaces or {})
+    if namespace:
+        nsmap[DEFAULT_PREFIX] = namespace
+    return nsmap
+
+
+def qualify(expression, prefix=DEFAULT_PREFIX):
+    """
+    Bind the unprefixed element names in ``expression`` to ``prefix``
+
+    :param expression: xpath expression
+    :param prefix: namespace prefix
+    :return: xpath expression
+    """
+    tokens = [(m.lastgroup, m.group()) for m in _TOKENS.finditer(expression)]
+    if ''.join(text for _, text in tokens) != expression:
+        raise etree.XPathSyntaxError('Cannot parse xpath expression %s' % expression)
+    significant = [(kind, text) for kind, text in tokens if kind != 'space']
+
+    result = []
+    position = 0
+    # per the XPath 1.0 lexical rules a name or * is only a name test where an operand is expected, otherwise it is
+    # an operator i.e. and, or, div, mod or multiply
+    expect_operand = True
+    axis = last = None
+    for kind, text in tokens:
+        if kind == 'space':
+            result.append(text)
+            continue
+        position += 1
+        following = significant[position][1] if position < len(significant) else None
+        if kind == 'name':
+            if not expect_operand:
+                expect_operand = True
+            elif following == '::':
+                axis = text
+            elif following != '(':
+                if ':' not in text and last not in ('@', '$') and not (last == '::' and axis in ('attribute',
+                                                                                                   'namespace')):
+                    text = '%s:%s' % (prefix, text)
+                expect_operand = False
+        elif kind in ('literal', 'number') or text in (')', ']', '.', '..'):
+            expect_operand = False
+        elif text == '*':
+            expect_operand = not expect_operand
+        else:
+            expect_operand = True
+        last = text
+        result.append(text)
+    return ''.join(result)
+
+
+def relative(expression):
+    """
+    Rewrite an absolute location path to be evaluated from the element its first step matches, rather than from the
+    root of the document e.g. ``/Person/name`` becomes ``self::Person/name`` and ``//name`` becomes
+    ``descendant-or-self::name``.  This lets a model read a subtree of a larger document in place.
+
+    :param expression: xpath expression
+    :return: the rewritten expression, ``expression`` itself if it is already relative, or None if it cannot be
+        rewritten e.g. a union, a path with absolute paths in its predicates or a function of an absolute path
+    """
+    if not expression.startswith('/'):
+        # e.g. count(/Person/phone) is still evaluated from the root of the document
+        return None if _has_absolute_path(expression) else expression
+    if expression.startswith('//'):
+        axis, rest = 'descendant-or-self::', expression[2:]
+    else:
+        axis, rest = 'self::', expression[1:]
+    if not _NAME_TEST.match(rest):
+        return None
+    last = None
+    for match in _TOKENS.finditer(rest):
+        text = match.group()
+        if text == '|' or (text in ('/', '//') and last in _OPERAND_EXPECTED):
+            return None
+        if match.lastgroup != 'space':
+            last = text
+    return axis + rest
+
+
+def _has_absolute_path(expression):
+    last = '('  # the start of an expression expects an operand, as after an opening bracket
+    for match in _TOKENS.finditer(expression):
+        text = match.group()
+        if text in ('/', '//') and last in _OPERAND_EXPECTED:
+            return True
+        if match.lastgroup != 'space':
+            last = text
+    return False
+
+
+def clark(name, namespace=None):
+    """
+    Convert a tag name, optionally prefixed, to Clark notation i.e. ``{namespace-uri}local-name``
+
+    :param name: tag name e.g. ``name`` or ``p:name``
+    :param namespace: default namespace URI or a dict of prefix to namespace URI
+    :return: tag in Clark notation
+    """
+    nsmap = namespace if isinstance(namespace, dict) else namespace_map(namespace)
+    prefix, _, local = name.rpartition(':')
+    uri = nsmap.get(prefix or DEFAULT_PREFIX)
+    if uri:
+        return '{%s}%s' % (uri, local)
+    return local
+
+
+def compile_xpath(expression, namespace=None, smart_strings=True):
+    """
+    Compile ``expression`` once for a given set of namespaces.
+
+    Unprefixed element names are bound to the default namespace, if there is one.
+
+    :param expression: xpath expression.  Already compiled expressions are returned unchanged
+    :param namespace: default namespace URI or a dict of prefix to namespace URI
+    :param smart_strings: return string results as lxml's smart strings, which keep a reference to their element,
+        rather than plain strings
+    :return: :class:`etree.XPath`
+    """
+    if isinstance(expression, (etree.XPath, LocalXPath)):
+        return expression
+    nsmap = namespace if isinstance(namespace, dict) else namespace_map(namespace)
+    key = (expression, tuple(sorted(nsmap.items())), smart_strings)
+    compiled = _compiled.get(key)
+    if compiled is None:
+        source = qualify(expression) if DEFAULT_PREFIX in nsmap else expression
+        compiled = _compiled[key] = etree.XPath(source, namespaces=nsmap or None, smart_strings=smart_strings)
+    return compiled
+
+
+class LocalXPath(object):
+    """
+    An xpath expression compiled separately for each thread that evaluates it.
+
+    lxml evaluates a compiled :class:`etree.XPath` for one thread at a time, so threads sharing one wait for each
+    other.  Called like the :class:`etree.XPath` it wraps.
+    """
+
+    def __init__(self, source, namespaces=None, smart_strings=True):
+        """
+        :param source: xpath expression, with its names already bound to prefixes
+        :param namespaces: dict of prefix to namespace URI
+        :param smart_strings: see :func:`compile_xpath`
+        """
+        self.path = source
+        self.namespaces = namespaces
+        self.smart_strings = smart_strings
+        self._local = threading.local()
+
+    def __call__(self, xml_doc, **variables):
+        try:
+            xpath = self._local.xpath
+        except AttributeError:
+            xpath = self._local.xpath = etree.XPath(self.path, namespaces=self.namespaces,
+                                                    smart_strings=self.smart_strings)
+        return xpath(xml_doc, **variables)
+
+
+def local_xpath(expression, namespace=None, smart_strings=True):
+    """
+    Like :func:`compile_xpath`, but each thread evaluates its own compiled copy of the expression
+
+    :param expression: xpath expression
+    :param namespace: default namespace URI or a dict of prefix to namespace URI
+    :param smart_strings: see :func:`compile_xpath`
+    :return: :class:`LocalXPath`
+    """
+    nsmap = namespace if isinstance(namespace, dict) else namespace_map(namespace)
+    key = (expression, tuple(sorted(nsmap.items())), smart_strings)
+    compiled = _local_compiled.get(key)
+    if compiled is None:
+        source = qualify(expression) if DEFAULT_PREFIX in nsmap else expression
+        etree.XPath(source, namespaces=nsmap or None)  # raises syntax errors now, rather than on first use
+        # setdefault keeps the first instance if another thread compiles the same expression at the same time
+        compiled = _local_compiled.setdefault(key, LocalXPath(source, nsmap or None, smart_strings))
+    return compiled
+
+
+def result_kind(expression):
+    """
+    Work out what an expression evaluates to from its syntax alone
+
+    :param expression: xpath expression
+    :return: :data:`ELEMENT` for paths of element steps, :data:`STRING` for paths ending in an attribute or
+        ``text()``, or None for anything else e.g. unions and functions
+    """
+    previous = None
+    while previous != expression:  # predicates do not change what a path returns, so drop them
+        previous, expression = expression, _PREDICATE.sub('', expression)
+    match = _STRING_STEP.search(expression)
+    if match:
+        return STRING if _ELEMENT_PATH.match(expression[:match.start()]) else None
+    return ELEMENT if _ELEMENT_PATH.match(expression) else None
+
+
+def evaluator(expression, namespace=None, strip=None):
+    """
+    Build a function that finds the single value of ``expression``, like :func:`find_unique`, specialized for what
+    the expression returns.  Paths to elements, attributes and ``text()`` are evaluated without smart strings and go
+    straight to the value.  Other expressions use :func:`find_unique`.  Each thread evaluates a compiled copy of the
+    expression of its own, see :class:`LocalXPath`.
+
+    :param expression: xpath expression
+    :param namespace: default namespace URI or a dict of prefix to namespace URI
+    :param strip: True to strip whitespace from values, False to keep it, or None to strip attributes, ``text()``
+        and the text of elements that have children, as :func:`value_of` does
+    :return: function taking a document or element and returning the matching string, or None
+    """
+    kind = result_kind(expression)
+    if kind is None:
+        compiled = local_xpath(expression, namespace)
+        return lambda xml_doc: find_unique(xml_doc, compiled)
+
+    xpath = local_xpath(expression, namespace, smart_strings=False)
+    convert = converter(kind, strip)
+
+    def find(xml_doc):
+        matches = xpath(xml_doc)
+        if len(matches) == 1:
+            return convert(matches[0])
+        if matches:
+            raise MultipleNodesReturnedException
+    return find
+
+
+def converter(kind, strip=None):
+    """
+    :param kind: :data:`ELEMENT` or :data:`STRING`
+    :param strip: stripping policy, see :func:`evaluator`
+    :return: function taking an element, or a string, and returning its value
+    """
+    if kind == STRING:
+        return _same if strip is False else _strip
+    if strip is None:
+        return _element_value
+    return _element_text if strip is False else _element_stripped
+
+
+def _same(value):
+    return value
+
+
+def _strip(value):
+    return value.strip()
+
+
+def _element_text(element):
+    return element.text
+
+
+def _element_stripped(element):
+    text = element.text
+    return None if text is None else text.strip()
+
+
+def _element_value(element):
+    text = element.text
+    if text is None or not len(element):
+        return text
+    return text.strip()
+
+
 def find_unique(xml_doc, expression, namespace=None):
     """
     Find a single value or node in ``xml_doc`` matching ``expression``
 
     :param xml_doc:
-    :param expression: xpath expression
-    :param namespace: not used yet
+    :param expression: xpath expression or a compiled :class:`etree.XPath`
+    :param namespace: default namespace URI or a dict of prefix to namespace URI
     :return: the matching node or string
     :raises MultipleNodesReturnedException: if the xpath expression matches more than one result
     """
-    matches = xml_doc.xpath(expression)
+    matches = compile_xpath(expression, namespace)(xml_doc)
+    if not isinstance(matches, list):
+        # functions such as name() and count() evaluate to a single string, number or boolean
+        return _string_value(matches)
     if len(matches) == 1:
-        matched = matches[0]
+        return value_of(matches[0])
 
-        if not matched:
-            return unicode(matched.text)
+    if len(matches) > 1:
+        raise MultipleNodesReturnedException
 
-        if hasattr(matched, 'text'):
-            return unicode(matched.text).strip()
 
-        return unicode(matched).strip()
+def value_of(matched):
+    """
+    The value of a single xpath result
 
-    if len(matches) > 1:
-        raise MultipleNodesReturnedException
+    :param matched: an element or a string result
+    :return: string
+    """
+    if not hasattr(matched, 'text'):
+        return unicode(matched).strip()  # attribute and text() results, which may be empty
+
+    if not matched:
+        return unicode(matched.text)
+
+    return unicode(matched.text).strip()
+
+
+def _string_value(result):
+    # as XPath's string() converts it
+    if isinstance(result, bool):
+        return 'true' if result else 'false'
+    if isinstance(result, float):
+        return str(int(result)) if result.is_integer() else repr(result)
+    return unicode(result).strip()
 
 
 def find_all(xml, expression, namespace):
@@ -57,11 +378,11 @@ def find_all(xml, expression, namespace):
     Find all matching values or nodes in ``xml`` that match ``expression``
 
     :param xml:
-    :param expression: xpath expression
-    :param namespace: not used yet
+    :param expression: xpath expression or a compiled :class:`etree.XPath`
+    :param namespace: default namespace URI or a dict of prefix to namespace URI
     :return: a list of matching values or nodes
     """
-    matches = xml.xpath(expression)
+    matches = compile_xpath(expression, namespace)(xml)
     return [etree.tostring(match) for match in matches]
 
 